@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import LayoutFingerprint
+
 
 # Register your models here.
+@admin.register(LayoutFingerprint)
+class LayoutFingerprintAdmin(admin.ModelAdmin):
+    list_display = ("bank_name", "header_cells", "hits", "misses", "updated_at")
+    list_editable = ("bank_name",)
+    list_display_links = ("header_cells",)
+    search_fields = ("bank_name", "header_signature")
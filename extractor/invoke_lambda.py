@@ -3,12 +3,16 @@ import json
 import os
 import io
 import re
+import tempfile
+import pandas as pd
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from PyPDF2 import PdfReader
 from .models import ExtractedDataUsingAzure_lambda
+from .processing.pipeline.version import content_hash, pipeline_version
+from .views import notify_user
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,6 +23,30 @@ def _sanitize_name(name: str) -> str:
     return safe[:200] or "document"
 
 
+def _notify_reused_result(user_email, pdf_file_name, s3_key, start_time):
+    """
+    Email the reused CSV of a completed job like a processed one.
+
+    Failures are logged and never fail the request.
+    """
+    try:
+        bucket_name = os.getenv("PROCESSING_BUCKET")
+        if not bucket_name:
+            raise Exception("PROCESSING_BUCKET environment variable not set")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, os.path.basename(s3_key))
+            boto3.client("s3").download_file(bucket_name, s3_key, csv_path)
+            notify_user(
+                user_email,
+                pdf_file_name,
+                csv_path,
+                start_time,
+                len(pd.read_csv(csv_path)),
+            )
+    except Exception as e:
+        logger.error(f"Failed to send email notification for reused result: {e}")
+
+
 def AzureExtractorView(request):
     """
     Updated Django view for serverless architecture.
@@ -82,6 +110,58 @@ def AzureExtractorView(request):
                     {"error": True, "message": f"Invalid PDF file: {str(e)}"},
                 )
 
+            # Reuse the result of an identical statement processed with the
+            # same prompts and models instead of starting the workflow again.
+            # Jobs only carry the version reported by the Lambda that processed
+            # them, so a result is only reused while the Lambda's environment
+            # matches this one.
+            document_hash = content_hash(clean_bytes)
+            version = pipeline_version()
+            previous = (
+                ExtractedDataUsingAzure_lambda.objects.filter(
+                    content_hash=document_hash,
+                    pipeline_version=version,
+                    status="COMPLETED",
+                )
+                .exclude(final_csv_s3_key__isnull=True)
+                .exclude(final_csv_s3_key="")
+                .order_by("-created_at")
+                .first()
+            )
+            if previous:
+                job = ExtractedDataUsingAzure_lambda.objects.create(
+                    pdf_name=pdf_name,
+                    user_email=user_email if user_email else None,
+                    pdf_path=previous.pdf_path,
+                    extracted_csv_path=previous.extracted_csv_path,
+                    csv_name=f"{pdf_name}_final.csv",
+                    status="COMPLETED",
+                    progress=100,
+                    final_csv_url=previous.final_csv_url,
+                    final_csv_s3_key=previous.final_csv_s3_key,
+                    num_pages=num_pages,
+                    content_hash=document_hash,
+                    pipeline_version=version,
+                )
+                logger.info(
+                    f"Job {job.id} reuses completed job {previous.id} "
+                    f"({document_hash[:12]}, pipeline {version})"
+                )
+                if user_email:
+                    _notify_reused_result(
+                        user_email, pdf_file.name, previous.final_csv_s3_key, start_time
+                    )
+                return render(
+                    request,
+                    "processing_started.html",
+                    {
+                        "job_id": job.id,
+                        "email": user_email,
+                        "pages": num_pages,
+                        "pdf_name": pdf_name,
+                    },
+                )
+
             # Upload PDF to S3
             s3 = boto3.client("s3")
             timestamp = timezone.now().strftime("%Y%m%d_%H%M%S")
@@ -102,6 +182,9 @@ def AzureExtractorView(request):
                 csv_name=f"{pdf_name}_final.csv",
                 status="STARTED",
                 num_pages=num_pages,
+                content_hash=document_hash,
+                # Reported by the Lambda from its own environment on completion
+                pipeline_version=None,
             )
 
             s3.upload_fileobj(
@@ -191,6 +274,9 @@ def update_job_status(request):
     """
     Webhook endpoint for Lambda functions to update job status.
     Called by your aggregator Lambda when processing completes.
+
+    The aggregator sends the ``pipeline_version`` it computed in its own
+    environment; completed jobs are only reused for re-uploads under it.
     """
     if request.method == "POST":
         try:
@@ -216,6 +302,8 @@ def update_job_status(request):
                 job.error_message = data["error_message"]
             if "final_csv_key" in data:
                 job.final_csv_s3_key = data["final_csv_key"]
+            if "pipeline_version" in data:
+                job.pipeline_version = data["pipeline_version"]
 
             job.updated_at = timezone.now()
             job.save()
@@ -0,0 +1,200 @@
+import heapq
+import json
+import math
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from extractor.processing.azure.ocr_tool import (
+    AzureAgent,
+    extract_table_data,
+    group_page_ranges,
+    split_tables_by_page,
+)
+
+
+def makespan(durations, workers):
+    """Wall time of running the given durations on a pool of ``workers`` threads."""
+    finish_times = [0.0] * max(1, workers)
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def page_cells(tables):
+    """Sorted cell texts of a page, used to compare the output of both modes."""
+    return sorted(
+        cell
+        for table in extract_table_data(tables)
+        for row in table["structured_data"]["matrix"]
+        for cell in row
+        if cell
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-page and chunked Azure OCR modes on a recorded fixture. "
+        "Use --record to capture a fixture from a PDF with live Azure calls, "
+        "including one real analysis per chunk for every --chunk-sizes value."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixture", help="Path of the recorded fixture (JSON)")
+        parser.add_argument(
+            "--record",
+            metavar="PDF",
+            help="Record the fixture from this PDF instead of replaying it",
+        )
+        parser.add_argument(
+            "--chunk-sizes",
+            default="5,10,20",
+            help="Comma separated chunk sizes to evaluate (default: 5,10,20)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Concurrent analyses in flight (default: 8)",
+        )
+
+    def handle(self, *args, **options):
+        chunk_sizes = [int(size) for size in options["chunk_sizes"].split(",")]
+        if options["record"]:
+            self.record(options["record"], options["fixture"], chunk_sizes)
+            return
+
+        try:
+            with open(options["fixture"], encoding="utf-8") as f:
+                fixture = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read fixture {options['fixture']}: {e}")
+
+        self.replay(fixture, chunk_sizes, options["workers"])
+
+    def record(self, pdf_path, fixture_path, chunk_sizes):
+        """
+        Analyse every page on its own, every chunk of every chunk size and the
+        whole PDF at once, keeping timings and tables.
+        """
+        from extractor.processing.pre.render_pdf import iter_rendered_pages
+        from extractor.processing.pre.page_image import PageImage
+        from PyPDF2 import PdfReader
+
+        agent = AzureAgent()
+        num_pages = len(PdfReader(pdf_path, strict=False).pages)
+        fixture = {"poll_interval_seconds": 1.0, "pages": {}, "chunks": {}, "document": {}}
+
+        for page_num, image in iter_rendered_pages(pdf_path, range(1, num_pages + 1)):
+            started = time.monotonic()
+            result = agent.analyze_document(PageImage(page_num, image).png_bytes, page_num)
+            fixture["pages"][str(page_num)] = {
+                "seconds": time.monotonic() - started,
+                "tables": [table.as_dict() for table in (result.tables or [])],
+            }
+            self.stdout.write(f"Recorded page {page_num}/{num_pages}")
+
+        for chunk_size in chunk_sizes:
+            recorded = fixture["chunks"][str(chunk_size)] = []
+            for first_page, last_page in group_page_ranges(range(1, num_pages + 1), chunk_size):
+                pages = f"{first_page}-{last_page}"
+                started = time.monotonic()
+                result = agent.analyze_document(pdf_path, pages, pages=pages)
+                recorded.append(
+                    {
+                        "pages": pages,
+                        "seconds": time.monotonic() - started,
+                        "tables": [table.as_dict() for table in (result.tables or [])],
+                    }
+                )
+                self.stdout.write(f"Recorded chunk {pages} (k={chunk_size})")
+
+        started = time.monotonic()
+        result = agent.analyze_document(pdf_path, f"1-{num_pages}", pages=f"1-{num_pages}")
+        fixture["document"] = {
+            "seconds": time.monotonic() - started,
+            "tables": [table.as_dict() for table in (result.tables or [])],
+        }
+
+        with open(fixture_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+        self.stdout.write(self.style.SUCCESS(f"Fixture written to {fixture_path}"))
+
+    def replay(self, fixture, chunk_sizes, workers):
+        """
+        Compare request count, polls and wall time of both modes from the fixture.
+
+        Per-page and chunk timings are used as recorded; wall time is the
+        makespan of those latencies on ``workers`` concurrent analyses. Chunk
+        sizes that were not recorded are modelled instead, from a linear fit
+        of the recorded timings, seconds = overhead + k * per_page, and are
+        marked as such in the output.
+        """
+        poll_interval = fixture.get("poll_interval_seconds", 1.0)
+        page_timings = {int(page): entry["seconds"] for page, entry in fixture["pages"].items()}
+        num_pages = len(page_timings)
+        recorded_chunks = fixture.get("chunks", {})
+        document_seconds = fixture["document"]["seconds"]
+
+        typical_page = statistics.median(page_timings.values())
+        per_page = max(0.0, (document_seconds - typical_page) / max(1, num_pages - 1))
+        overhead = max(0.0, typical_page - per_page)
+
+        rows = [
+            (
+                "per-page",
+                num_pages,
+                sum(math.ceil(seconds / poll_interval) for seconds in page_timings.values()),
+                makespan(page_timings.values(), workers),
+            )
+        ]
+        modelled = False
+        for chunk_size in chunk_sizes:
+            if str(chunk_size) in recorded_chunks:
+                mode = f"chunked k={chunk_size}"
+                durations = [chunk["seconds"] for chunk in recorded_chunks[str(chunk_size)]]
+            else:
+                modelled = True
+                mode = f"chunked k={chunk_size}*"
+                durations = [
+                    overhead + (last - first + 1) * per_page
+                    for first, last in group_page_ranges(page_timings, chunk_size)
+                ]
+            rows.append(
+                (
+                    mode,
+                    len(durations),
+                    sum(math.ceil(seconds / poll_interval) for seconds in durations),
+                    makespan(durations, workers),
+                )
+            )
+
+        self.stdout.write(f"{num_pages} pages, {workers} workers")
+        self.stdout.write(f"{'mode':<16}{'requests':>10}{'polls':>8}{'wall (s)':>10}")
+        for mode, requests, polls, wall in rows:
+            self.stdout.write(f"{mode:<16}{requests:>10}{polls:>8}{wall:>10.1f}")
+        if modelled:
+            self.stdout.write(
+                f"* not recorded, modelled with overhead {overhead:.2f}s and "
+                f"{per_page:.2f}s per page; re-record with --chunk-sizes to measure"
+            )
+
+        # Splitting chunk results back to pages must reproduce the per-page cells
+        analyses = {"document": [fixture["document"]]}
+        analyses.update(
+            (f"k={chunk_size}", chunks) for chunk_size, chunks in recorded_chunks.items()
+        )
+        for label, chunks in analyses.items():
+            started = time.perf_counter()
+            split_pages = {}
+            for chunk in chunks:
+                split_pages.update(split_tables_by_page(chunk["tables"]))
+            split_ms = (time.perf_counter() - started) * 1000
+            matching = sum(
+                page_cells(split_pages.get(page_num, []))
+                == page_cells(fixture["pages"][str(page_num)]["tables"])
+                for page_num in page_timings
+            )
+            self.stdout.write(
+                f"{label}: split back to pages in {split_ms:.1f} ms, "
+                f"{matching}/{num_pages} pages with identical cell text"
+            )
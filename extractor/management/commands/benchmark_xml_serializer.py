@@ -0,0 +1,148 @@
+import glob
+import os
+import random
+import statistics
+import time
+import tracemalloc
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from extractor.processing.gemini.client import count_tokens, estimate_tokens
+from extractor.processing.post.handle_csv_to_xml import dataframe_to_xml, table_to_xml
+
+
+def load_pages(paths):
+    """Read page tables from saved temp CSVs, given as files or directories."""
+    pages = {}
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.csv"))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+            pages[file_path] = df.values.tolist()
+    return pages
+
+
+def synthetic_page(rows, cols, seed=0):
+    """A dense statement-like page of ``rows`` x ``cols`` cells."""
+    rng = random.Random(seed)
+    header = ["Date", "Description", "Debit", "Credit", "Balance"]
+    page = [[header[c] if c < len(header) else f"Column {c}" for c in range(cols)]]
+    for r in range(rows - 1):
+        row = [
+            f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024",
+            f"POS PURCHASE {rng.randint(100000, 999999)} CARD & CO <REF>",
+            f"{rng.randint(1, 99999) / 100:,.2f}" if r % 2 else "",
+            "" if r % 2 else f"{rng.randint(1, 99999) / 100:,.2f}",
+            f"{rng.randint(1, 9999999) / 100:,.2f}",
+        ]
+        page.append((row + [f"x{c}" for c in range(len(row), cols)])[:cols])
+    return page
+
+
+def measure(convert, rows, repeat):
+    """Median wall time in ms and peak traced memory in KiB of one conversion."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        convert(rows)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    output = convert(rows)
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return output, statistics.median(timings), peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the minidom XML converter with the single-pass serializer "
+        "(pretty and compact) on saved page CSVs or a synthetic page."
+    )
+
+    CONVERTERS = {
+        "minidom": lambda rows: dataframe_to_xml(pd.DataFrame(rows)),
+        "single-pass": lambda rows: table_to_xml(rows),
+        "compact": lambda rows: table_to_xml(rows, compact=True),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="Page CSVs or directories of them, e.g. a job's temp_csv directory",
+        )
+        parser.add_argument(
+            "--synthetic",
+            metavar="ROWSxCOLS",
+            help="Benchmark a generated page instead, e.g. 200x5",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Timed runs per page and converter (default: 5)",
+        )
+        parser.add_argument(
+            "--count-tokens",
+            action="store_true",
+            help="Count tokens with the Gemini API instead of the offline estimate",
+        )
+
+    def handle(self, *args, **options):
+        if options["synthetic"]:
+            try:
+                rows, cols = (int(value) for value in options["synthetic"].lower().split("x"))
+            except ValueError:
+                raise CommandError("--synthetic expects ROWSxCOLS, e.g. 200x5")
+            pages = {f"synthetic {rows}x{cols}": synthetic_page(rows, cols)}
+        elif options["paths"]:
+            pages = load_pages(options["paths"])
+        else:
+            raise CommandError("Pass page CSVs or --synthetic ROWSxCOLS")
+        if not pages:
+            raise CommandError("No page CSVs found")
+
+        tokens = (
+            (lambda text: count_tokens("cleaning", text))
+            if options["count_tokens"]
+            else estimate_tokens
+        )
+        totals = {name: {"ms": 0.0, "kib": 0.0, "bytes": 0, "tokens": 0} for name in self.CONVERTERS}
+        mismatches = []
+
+        for name, rows in pages.items():
+            outputs = {}
+            for converter, convert in self.CONVERTERS.items():
+                output, ms, kib = measure(convert, rows, options["repeat"])
+                outputs[converter] = output or ""
+                totals[converter]["ms"] += ms
+                totals[converter]["kib"] = max(totals[converter]["kib"], kib)
+                totals[converter]["bytes"] += len(outputs[converter].encode("utf-8"))
+                totals[converter]["tokens"] += tokens(outputs[converter])
+            if outputs["minidom"] != outputs["single-pass"]:
+                mismatches.append(name)
+
+        self.stdout.write(f"Pages: {len(pages)} (tokens {'counted' if options['count_tokens'] else 'estimated'})")
+        self.stdout.write(
+            f"{'converter':<12} {'time ms':>10} {'peak KiB':>10} {'bytes':>10} {'tokens':>10}"
+        )
+        for converter, total in totals.items():
+            self.stdout.write(
+                f"{converter:<12} {total['ms']:>10.2f} {total['kib']:>10.1f} "
+                f"{total['bytes']:>10} {total['tokens']:>10}"
+            )
+
+        baseline = totals["minidom"]
+        for converter in ("single-pass", "compact"):
+            total = totals[converter]
+            self.stdout.write(
+                f"{converter}: {baseline['ms'] / max(total['ms'], 1e-9):.1f}x faster, "
+                f"{1 - total['tokens'] / max(baseline['tokens'], 1):.0%} fewer tokens"
+            )
+
+        if mismatches:
+            self.stdout.write(
+                self.style.ERROR(f"Output differs from minidom for: {', '.join(mismatches)}")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("single-pass output identical to minidom"))
@@ -0,0 +1,206 @@
+import glob
+import json
+import os
+import re
+import tempfile
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from extractor.processing.gemini.client import count_tokens, estimate_tokens
+from extractor.processing.gemini.cleaning.clean_using_response import (
+    process_gemini_response,
+)
+from extractor.processing.gemini.cleaning.gemini_response import prompt
+from extractor.processing.pipeline.page_table import PageTable
+from extractor.processing.post.table_encoding import ENCODINGS, encode_table
+from extractor.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def read_cells(csv_path):
+    """Cells of a saved page CSV as strings, without the CSV header line."""
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False).values.tolist()
+
+
+def apply_operations(rows, operations):
+    """
+    Run recorded cleaning operations on a page table.
+
+    Returns:
+        list: Cleaned rows as written to the extracted CSV, or None if an operation failed
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "page.csv")
+        try:
+            process_gemini_response(
+                {"operations": operations},
+                PageTable(0, rows),
+                output_path,
+                logger,
+                trace="off",
+            )
+        except Exception:
+            return None
+        return read_cells(output_path)
+
+
+def compare_cells(result, reference):
+    """
+    Matching cells of a cleaned page against the reference.
+
+    Returns:
+        tuple: (shape matches, matching cells, reference cells)
+    """
+    total = sum(len(row) for row in reference)
+    if result is None or len(result) != len(reference) or any(
+        len(row) != len(expected) for row, expected in zip(result, reference)
+    ):
+        return False, 0, total
+    matching = sum(
+        cell == expected
+        for row, expected_row in zip(result, reference)
+        for cell, expected in zip(row, expected_row)
+    )
+    return True, matching, total
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare table encodings of the cleaning prompt on recorded pages: "
+        "prompt tokens and accuracy of the operations Gemini returned for each "
+        "encoding. Use --record to capture a fixture from a job's storage directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fixture", help="Path of the recorded fixture (JSON)")
+        parser.add_argument(
+            "--record",
+            metavar="STORAGE_DIR",
+            help=(
+                "Record the fixture from a job directory processed with "
+                "EXTRACTOR_SAVE_ARTIFACTS and EXTRACTOR_SAVE_PAGE_IMAGES, "
+                "calling Gemini once per page and encoding"
+            ),
+        )
+        parser.add_argument(
+            "--encodings",
+            default=",".join(ENCODINGS),
+            help=f"Comma separated encodings (default: {','.join(ENCODINGS)})",
+        )
+        parser.add_argument(
+            "--count-tokens",
+            action="store_true",
+            help="Count tokens with the Gemini API instead of the offline estimate",
+        )
+
+    def handle(self, *args, **options):
+        encodings = options["encodings"].split(",")
+        unknown = set(encodings) - set(ENCODINGS)
+        if unknown:
+            raise CommandError(f"Unknown encodings: {', '.join(sorted(unknown))}")
+
+        if options["record"]:
+            self.record(options["record"], options["fixture"], encodings)
+            return
+
+        try:
+            with open(options["fixture"], encoding="utf-8") as f:
+                fixture = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read fixture {options['fixture']}: {e}")
+        self.replay(fixture, encodings, options["count_tokens"])
+
+    def record(self, storage_dir, fixture_path, encodings):
+        """Call Gemini for every saved page in each encoding and keep the operations."""
+        from PIL import Image
+        from extractor.processing.gemini.cleaning.gemini_response import GeminiAgent
+        from extractor.processing.pre.page_image import PageImage
+
+        csv_paths = sorted(
+            glob.glob(os.path.join(storage_dir, "temp_csv", "page_*.csv")),
+            key=lambda path: int(re.search(r"page_(\d+)", path).group(1)),
+        )
+        if not csv_paths:
+            raise CommandError(f"No saved page tables in {storage_dir}/temp_csv")
+
+        agent = GeminiAgent()
+        pages = []
+        for csv_path in csv_paths:
+            page_num = int(re.search(r"page_(\d+)", csv_path).group(1))
+            image_path = os.path.join(storage_dir, "image_split", f"page_{page_num}.png")
+            expected_path = os.path.join(storage_dir, "extracted_csv", f"page_{page_num}.csv")
+            if not os.path.exists(image_path):
+                self.stdout.write(f"Page {page_num}: no saved image, skipped")
+                continue
+
+            rows = read_cells(csv_path)
+            # The cleaned page CSV carries the statement header as its first line
+            headers = (
+                dict(enumerate(pd.read_csv(expected_path, nrows=0).columns))
+                if os.path.exists(expected_path)
+                else {}
+            )
+            image = PageImage(page_num, Image.open(image_path))
+            responses = {}
+            for encoding in encodings:
+                responses[encoding] = agent.call_gemini(
+                    encode_table(rows, encoding), image, headers, logger, encoding=encoding
+                )
+                self.stdout.write(
+                    f"Page {page_num} {encoding}: {len(responses[encoding])} operations"
+                )
+            pages.append(
+                {
+                    "page": page_num,
+                    "headers": {str(index): name for index, name in headers.items()},
+                    "rows": rows,
+                    "expected": read_cells(expected_path) if os.path.exists(expected_path) else None,
+                    "responses": responses,
+                }
+            )
+
+        with open(fixture_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(pages)} pages to {fixture_path}"))
+
+    def replay(self, fixture, encodings, use_api):
+        """Report prompt tokens and operation accuracy per encoding."""
+        tokens = (lambda text: count_tokens("cleaning", text)) if use_api else estimate_tokens
+        totals = {
+            encoding: {"table": 0, "prompt": 0, "pages": 0, "shape": 0, "cells": 0, "of": 0}
+            for encoding in encodings
+        }
+
+        for page in fixture["pages"]:
+            headers = {int(index): name for index, name in page["headers"].items()}
+            # Without a stored cleaned page the XML result is the reference
+            reference = page.get("expected")
+            if reference is None and "xml" in page["responses"]:
+                reference = apply_operations(page["rows"], page["responses"]["xml"])
+
+            for encoding in encodings:
+                table_text = encode_table(page["rows"], encoding)
+                total = totals[encoding]
+                total["table"] += tokens(table_text)
+                total["prompt"] += tokens(prompt(headers, table_text, encoding))
+                if encoding not in page["responses"] or reference is None:
+                    continue
+                result = apply_operations(page["rows"], page["responses"][encoding])
+                shape_ok, matching, cells = compare_cells(result, reference)
+                total["pages"] += 1
+                total["shape"] += shape_ok
+                total["cells"] += matching
+                total["of"] += cells
+
+        self.stdout.write(
+            f"Pages: {len(fixture['pages'])} (tokens {'counted' if use_api else 'estimated'})"
+        )
+        self.stdout.write(
+            f"{'encoding':<9} {'table tok':>10} {'prompt tok':>11} {'shape ok':>10} {'cell acc':>9}"
+        )
+        for encoding, total in totals.items():
+            accuracy = f"{total['cells'] / total['of']:.1%}" if total["of"] else "n/a"
+            self.stdout.write(
+                f"{encoding:<9} {total['table']:>10} {total['prompt']:>11} "
+                f"{total['shape']:>4}/{total['pages']:<5} {accuracy:>9}"
+            )
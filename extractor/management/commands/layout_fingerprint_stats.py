@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from extractor.models import LayoutFingerprint
+
+
+class Command(BaseCommand):
+    help = "Report layout fingerprint hits and misses per bank."
+
+    def handle(self, *args, **options):
+        rows = (
+            LayoutFingerprint.objects.values("bank_name")
+            .annotate(layouts=Count("id"), hits=Sum("hits"), misses=Sum("misses"))
+            .order_by("bank_name")
+        )
+        self.stdout.write(f"{'bank':<32}{'layouts':>9}{'hits':>8}{'misses':>8}{'hit rate':>10}")
+        for row in rows:
+            lookups = row["hits"] + row["misses"]
+            hit_rate = row["hits"] / lookups if lookups else 0.0
+            self.stdout.write(
+                f"{(row['bank_name'] or '(unnamed)')[:31]:<32}{row['layouts']:>9}"
+                f"{row['hits']:>8}{row['misses']:>8}{hit_rate:>10.0%}"
+            )
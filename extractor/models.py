@@ -30,12 +30,25 @@ class ExtractedDataUsingAzure(models.Model):
     updated_at = models.DateTimeField(
         auto_now=True, help_text="When the record was last updated"
     )
+    content_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="SHA-256 of the cleaned PDF bytes",
+    )
+    pipeline_version = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        help_text="Prompts and models the CSV was produced with",
+    )
 
     def __str__(self):
         return f"{self.pdf_name} - {self.user_email or 'No Email'}"
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["content_hash", "pipeline_version"])]
 
 
 class ExtractedDataUsingAzure_lambda(models.Model):
@@ -66,5 +79,42 @@ class ExtractedDataUsingAzure_lambda(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Dedup of re-uploaded statements
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    pipeline_version = models.CharField(max_length=32, null=True, blank=True)
+
     def __str__(self):
         return f"{self.pdf_name} - {self.status}"
+
+    class Meta:
+        indexes = [models.Index(fields=["content_hash", "pipeline_version"])]
+
+
+class LayoutFingerprint(models.Model):
+    """
+    A statement layout whose header map has been confirmed by Gemini.
+
+    Pages whose Azure column headers and letterhead match a stored layout
+    reuse its header map instead of calling Gemini for the header.
+    """
+
+    header_signature = models.CharField(
+        max_length=64,
+        db_index=True,
+        help_text="SHA-256 of the normalised Azure columnHeader texts",
+    )
+    header_cells = models.JSONField(default=list)
+    image_hash = models.CharField(
+        max_length=16, help_text="dHash of the top band of the page"
+    )
+    column_map = models.JSONField(
+        default=list, help_text="Header items as returned by Gemini"
+    )
+    bank_name = models.CharField(max_length=255, null=True, blank=True)
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.bank_name or self.header_signature[:12]} - {self.hits}/{self.misses}"
@@ -0,0 +1,98 @@
+import asyncio
+import io
+import os
+import threading
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.ai.documentintelligence.aio import (
+    DocumentIntelligenceClient as AsyncDocumentIntelligenceClient,
+)
+from .ocr_tool import AZURE_API_VERSION, AZURE_MODEL_ID
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 32
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def max_in_flight():
+    """Process-wide limit of concurrent Azure analyses (AZURE_OCR_MAX_IN_FLIGHT)."""
+    return int(os.getenv("AZURE_OCR_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT))
+
+
+class AsyncOcrBackend:
+    """
+    Azure Document Intelligence over the SDK's aio client.
+
+    A single event loop runs on a background thread and owns one client, one
+    HTTP transport (a shared aiohttp session, so connections are reused) and
+    a semaphore capping the analyses in flight for the whole process. All
+    polling happens on that loop; callers only wait on a future, so dozens of
+    analyses can be in flight without a thread blocked per poll.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or max_in_flight()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="azure-ocr-loop", daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        # Both must be created on the loop that will use them
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._client = AsyncDocumentIntelligenceClient(
+            endpoint=os.environ.get("AZURE_END_POINT"),
+            credential=AzureKeyCredential(os.environ.get("AZURE_SECRET_KEY")),
+            transport=AioHttpTransport(),
+            api_version=AZURE_API_VERSION,
+        )
+
+    async def analyze(self, document_bytes, pages=None):
+        """Run one analysis on the event loop, waiting for a free slot first."""
+        options = {"pages": pages} if pages else {}
+        async with self._semaphore:
+            poller = await self._client.begin_analyze_document(
+                AZURE_MODEL_ID, io.BytesIO(document_bytes), **options
+            )
+            return await poller.result()
+
+    def run(self, coroutine):
+        """
+        Schedule any coroutine on the backend's loop from any thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, document_bytes, pages=None):
+        """
+        Schedule an analysis from any thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the AnalyzeResult
+        """
+        return self.run(self.analyze(document_bytes, pages))
+
+    def analyze_document(self, document_bytes, pages=None):
+        """Blocking helper for synchronous callers."""
+        return self.submit(document_bytes, pages).result()
+
+
+def get_async_backend():
+    """Return the process-wide ``AsyncOcrBackend``, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = AsyncOcrBackend()
+                logger.info(
+                    f"[DEBUG] [ASYNC_OCR] Started async OCR backend with {_backend.limit} slots"
+                )
+    return _backend
@@ -0,0 +1,159 @@
+import os
+from .ocr_tool import column_header_cells, extract_table_data
+from ..pre.classify_page import DATE_PATTERN, MIN_TRANSACTION_ROWS, is_numeric
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Keyword groups of a transaction table header and their weight in the confidence
+HEADER_KEYWORDS = {
+    "date": (0.3, ("date",)),
+    "description": (
+        0.2,
+        ("description", "details", "particulars", "narration", "remarks"),
+    ),
+    "amount": (
+        0.2,
+        ("debit", "credit", "withdrawal", "deposit", "amount", "paid in", "paid out"),
+    ),
+    "balance": (0.3, ("balance",)),
+}
+# Headers of account summaries, which name dates and balances but hold no transactions
+SUMMARY_KEYWORDS = ("opening", "closing", "total", "brought forward", "carried forward")
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+
+def local_header_mode():
+    """
+    Local header mode from EXTRACTOR_LOCAL_HEADERS.
+
+    "shadow" (default) only logs the local header next to Gemini's, "on"
+    skips the Gemini header call for confident local headers, and "off"
+    disables local headers.
+    """
+    return os.getenv("EXTRACTOR_LOCAL_HEADERS", "shadow").lower()
+
+
+def local_headers_enabled():
+    """Whether confident local headers replace the Gemini header call."""
+    return local_header_mode() == "on"
+
+
+def min_confidence():
+    """Confidence needed to skip Gemini (EXTRACTOR_LOCAL_HEADER_MIN_CONFIDENCE)."""
+    return float(
+        os.getenv("EXTRACTOR_LOCAL_HEADER_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE)
+    )
+
+
+def header_confidence(headers):
+    """
+    Score how much a header row looks like a transaction table header.
+
+    Args:
+        headers (list): Header texts
+
+    Returns:
+        float: Sum of the weights of the keyword groups found, between 0 and 1
+    """
+    texts = [header.lower() for header in headers]
+    return round(
+        sum(
+            weight
+            for weight, keywords in HEADER_KEYWORDS.values()
+            if any(keyword in text for text in texts for keyword in keywords)
+        ),
+        2,
+    )
+
+
+def _is_transaction_row(row):
+    # Same rule as classify_tables: a date and a number that is not part of the date
+    return any(DATE_PATTERN.search(cell) for cell in row) and any(
+        is_numeric(cell) for cell in row
+    )
+
+
+def _table_header(table):
+    """
+    Header row of one table with the rows below it.
+
+    Azure's ``columnHeader`` cells are used when present, otherwise the first
+    row with more than three filled cells mentioning a date, balance or
+    description, the same rule as extract_table_to_dataframe.
+
+    Returns:
+        tuple: (headers, data rows, source), or None when the table has no header row
+    """
+    extracted = extract_table_data([table])
+    if not extracted:
+        return None
+    matrix = extracted[0]["structured_data"]["matrix"]
+    width = max((len(row) for row in matrix), default=0)
+
+    headers = column_header_cells([table])
+    if headers:
+        header_rows = {
+            cell["rowIndex"] for cell in table["cells"] if cell["kind"] == "columnHeader"
+        }
+        rows = [row for index, row in enumerate(matrix) if index not in header_rows]
+        return headers + [""] * (width - len(headers)), rows, "columnHeader cells"
+
+    for index, row in enumerate(matrix):
+        filled = [cell for cell in row if cell.strip()]
+        if len(filled) > 3 and any(
+            keyword in cell.lower()
+            for cell in filled
+            for keyword in ("date", "balance", "description")
+        ):
+            return row, matrix[index + 1 :], "keyword row"
+    return None
+
+
+def detect_header_locally(tables, page_logger=None):
+    """
+    Find the statement header of a page from its Azure tables.
+
+    Every table's header row is scored with ``header_confidence`` and the best
+    one is returned. A header only counts when at least MIN_TRANSACTION_ROWS
+    rows below it hold a date and an amount, and never when it names an
+    account summary. Empty header cells keep their place, so the header
+    indices match the table's column positions.
+
+    Args:
+        tables (list): Tables in the format of ``compact_tables``
+        page_logger (Logger, optional): Logger instance for the page
+
+    Returns:
+        tuple: (header items in the format returned by Gemini, confidence)
+    """
+    page_logger = page_logger or logger
+    best, best_confidence = [], 0.0
+    for table in tables:
+        found = _table_header(table)
+        if found is None:
+            continue
+        headers, rows, source = found
+        headers = [" ".join(header.split()) for header in headers]
+        if len([header for header in headers if header]) < 3:
+            continue
+
+        transaction_rows = sum(_is_transaction_row(row) for row in rows)
+        summary = any(
+            keyword in header.lower() for header in headers for keyword in SUMMARY_KEYWORDS
+        )
+        confidence = (
+            header_confidence(headers)
+            if transaction_rows >= MIN_TRANSACTION_ROWS and not summary
+            else 0.0
+        )
+        page_logger.info(
+            f"[DEBUG] [LOCAL_HEADER] {headers} from {source}, "
+            f"{transaction_rows} transaction rows, summary {summary}, confidence {confidence}"
+        )
+        if confidence > best_confidence:
+            best_confidence = confidence
+            best = [
+                {"index": index, "headers": header} for index, header in enumerate(headers)
+            ]
+    return best, best_confidence
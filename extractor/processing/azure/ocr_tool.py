@@ -1,23 +1,79 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+import hashlib
+import io
 import os
+import threading
 from azure.core.credentials import AzureKeyCredential
-from azure.ai.formrecognizer import DocumentAnalysisClient
 from azure.ai.documentintelligence import DocumentIntelligenceClient
+from ..pre.render_pdf import group_page_ranges
+from ...utils.disk_cache import get_disk_cache
 from ...utils.logger import get_logger
+from ...utils.rate_limiter import (
+    call_with_backoff,
+    call_with_backoff_async,
+    get_rate_limiter,
+)
 import pandas as pd
 
 logger = get_logger(__name__)
 
-# Azure credentials
-endpoint = os.environ.get("AZURE_END_POINT")
-key = os.environ.get("AZURE_SECRET_KEY")
-document_analysis_client = DocumentAnalysisClient(
-    endpoint=endpoint, credential=AzureKeyCredential(key)
-)
-document_intelligence_client = DocumentIntelligenceClient(
-    endpoint=endpoint, credential=AzureKeyCredential(key)
-)
+AZURE_MODEL_ID = "prebuilt-invoice"
+# Pinned so cached OCR results are only reused for the same service version
+AZURE_API_VERSION = os.getenv("AZURE_API_VERSION", "2024-11-30")
+
+_client_lock = threading.Lock()
+_document_intelligence_client = None
+
+
+def get_document_intelligence_client():
+    """Return the process-wide synchronous client, created on first use."""
+    global _document_intelligence_client
+    if _document_intelligence_client is None:
+        with _client_lock:
+            if _document_intelligence_client is None:
+                # Azure credentials
+                endpoint = os.environ.get("AZURE_END_POINT")
+                key = os.environ.get("AZURE_SECRET_KEY")
+                _document_intelligence_client = DocumentIntelligenceClient(
+                    endpoint=endpoint,
+                    credential=AzureKeyCredential(key),
+                    api_version=AZURE_API_VERSION,
+                )
+    return _document_intelligence_client
+
+
+def ocr_backend():
+    """OCR client backend from AZURE_OCR_BACKEND: "sync" (default) or "async"."""
+    return os.getenv("AZURE_OCR_BACKEND", "sync").lower()
+
+
+def ocr_cache():
+    """
+    Persistent cache of per-page OCR tables, or None when AZURE_OCR_CACHE is off.
+
+    Bounded by AZURE_OCR_CACHE_MAX_MB (default 512) of compressed tables.
+    """
+    if os.getenv("AZURE_OCR_CACHE", "true").lower() not in ("1", "true", "yes"):
+        return None
+    max_bytes = int(os.getenv("AZURE_OCR_CACHE_MAX_MB", 512)) * 1024 * 1024
+    return get_disk_cache("azure_ocr", max_bytes)
+
+
+def ocr_cache_key(document_bytes):
+    """Cache key of a page: image hash, Azure model id and API version."""
+    image_hash = hashlib.sha256(document_bytes).hexdigest()
+    return f"{AZURE_MODEL_ID}:{AZURE_API_VERSION}:{image_hash}"
+
+
+def _read_document(document):
+    """Return the raw bytes of a page given as a file path, bytes or stream."""
+    if isinstance(document, (bytes, bytearray, memoryview)):
+        return bytes(document)
+    with _open_document(document) as file:
+        return file.read()
 
 
 def make_serializable(value):
@@ -199,207 +255,512 @@ def extract_table_data(tables):
     return extracted_tables
 
 
-class AzureAgent:
-    def __init__(
-        self, images, page_path, page_num, retries=3, temp_path=None, page_logger=None
-    ):
-        self.images = images
-        self.retries = retries
-        self.combined_data = []
-        self.page_path = page_path
-        self.page_num = page_num
-        self.temp_path = temp_path
-        self.page_logger = page_logger
-
-        def process_page(page_path, page_num, retries):
-            page_data = {
-                "page_number": page_num,
-                "file_path": page_path,
-                "analysis": {},
-                "extracted_tables": [],
-            }
+def tables_to_dataframe(extracted_tables, page_num, page_logger):
+    """
+    Build the per-page DataFrame from the output of ``extract_table_data``.
 
-            df = None  # Initialize df outside the try block
+    Each table contributes its header row followed by its matrix, with OCR
+    artefacts (newlines, "?", selection marks) stripped from every cell.
 
-            attempt = 0
-            while attempt < retries:
-                try:
-                    self.page_logger.info(
-                        f"[DEBUG] [PROCESS_PAGE] page_path: {page_path}"
-                    )
-                    with open(page_path, "rb") as file:
-                        poller = document_intelligence_client.begin_analyze_document(
-                            "prebuilt-invoice", file
-                        )
-                        result = poller.result()
-                        self.page_logger.info(
-                            f"[DEBUG] [PROCESS_PAGE] result.tables: {result.tables}"
+    Args:
+        extracted_tables (list): Tables as returned by ``extract_table_data``
+        page_num (int): Page number, used for logging
+        page_logger (Logger): Logger instance for the page
+
+    Returns:
+        pandas.DataFrame: Combined table data for the page
+    """
+    matrix = []
+    df_list = []
+
+    for table in extracted_tables:
+        try:
+            headers = table["structured_data"]["headers"]
+            page_logger.info(
+                f"[DEBUG] [PROCESS_PAGE] Extracted table headers: {headers}"
+            )
+            page_logger.info(
+                f"[DEBUG] [PROCESS_PAGE] Sample rows: {table['structured_data']['rows']}"
+            )
+
+            buffer_matrix = table["structured_data"]["matrix"]
+            page_logger.info(f"[DEBUG] [PROCESS_PAGE] matrix: {buffer_matrix}")
+
+            # Create DataFrame with robust error handling
+            try:
+                matrix = (
+                    matrix + [headers] + buffer_matrix
+                )  # add headers to the row 0 of the dataframe
+                temp_df = pd.DataFrame(matrix)
+
+                if not temp_df.empty:
+                    # Clean DataFrame content
+                    temp_df = temp_df.map(
+                        lambda x: (
+                            x.replace("\n", " ")
+                            .replace("?", "")
+                            .replace(":selected:", "")
+                            .replace(":unselected:", "")
+                            .strip()
+                            if isinstance(x, str)
+                            else x
                         )
+                    )
+                    df_list.append(temp_df)
 
-                        # Extract table data if tables exist
-                        if hasattr(result, "tables") and result.tables:
-                            # Add debugging for table structure analysis
-                            try:
-                                extracted_tables = extract_table_data(result.tables)
-                                page_data["extracted_tables"] = extracted_tables
-
-                                matrix = []
-                                headers = []
-                                df_list = []
-                                df = pd.DataFrame()
-
-                                # Log sample of extracted data
-                                for table in extracted_tables:
-                                    try:
-                                        headers = table["structured_data"]["headers"]
-                                        self.page_logger.info(
-                                            f"[DEBUG] [PROCESS_PAGE] Extracted table headers: {headers}"
-                                        )
-                                        self.page_logger.info(
-                                            f"[DEBUG] [PROCESS_PAGE] Sample rows: {table['structured_data']['rows']}"
-                                        )
-
-                                        buffer_matrix = table["structured_data"][
-                                            "matrix"
-                                        ]
-                                        self.page_logger.info(
-                                            f"[DEBUG] [PROCESS_PAGE] matrix: {buffer_matrix}"
-                                        )
-
-                                        # Create DataFrame with robust error handling
-                                        try:
-                                            matrix = (
-                                                matrix + [headers] + buffer_matrix
-                                            )  # add headers to the row 0 of the dataframe
-                                            temp_df = pd.DataFrame(matrix)
-                                            self.page_logger.info(
-                                                f"[DEBUG] [PROCESS_PAGE] DataFrame with headers at row 0: {df}"
-                                            )
-
-                                            if not temp_df.empty:
-                                                # Clean DataFrame content
-                                                temp_df = temp_df.map(
-                                                    lambda x: (
-                                                        x.replace("\n", " ")
-                                                        .replace("?", "")
-                                                        .replace(":selected:", "")
-                                                        .replace(":unselected:", "")
-                                                        .strip()
-                                                        if isinstance(x, str)
-                                                        else x
-                                                    )
-                                                )
-                                                df_list.append(temp_df)
-
-                                                self.page_logger.info(
-                                                    f"[DEBUG] [PROCESS_PAGE] DataFrame for page {page_num}:\n{df}"
-                                                )
-                                                self.page_logger.info(
-                                                    f"[DEBUG] [PROCESS_PAGE] DataFrame shape: {df.shape}"
-                                                )
-                                                self.page_logger.info(
-                                                    f"[DEBUG] [PROCESS_PAGE] DataFrame dtypes:\n{df.dtypes}"
-                                                )
-                                            else:
-                                                self.page_logger.warning(
-                                                    f"[WARNING] [PROCESS_PAGE] Empty DataFrame created for page {page_num}"
-                                                )
-
-                                        except Exception as df_error:
-                                            self.page_logger.error(
-                                                f"[ERROR] [PROCESS_PAGE] Failed to create or process DataFrame for page {page_num}: {df_error}"
-                                            )
-                                            df = None
-
-                                    except Exception as table_processing_error:
-                                        self.page_logger.error(
-                                            f"[ERROR] [PROCESS_PAGE] Error processing individual table for page {page_num}: {table_processing_error}"
-                                        )
-                                        continue
-
-                                df = pd.concat(df_list)
-
-                                # Save DataFrame to CSV with error handling
-                                if self.temp_path:
-                                    try:
-                                        self.page_logger.info(
-                                            f"[DEBUG] [PROCESS_PAGE] Saving CSV for page {page_num} to: {self.temp_path}"
-                                        )
-                                        df.to_csv(self.temp_path, index=False)
-                                        self.page_logger.info(
-                                            f"[DEBUG] [PROCESS_PAGE] Successfully saved CSV for page {page_num}"
-                                        )
-                                    except Exception as csv_error:
-                                        self.page_logger.error(
-                                            f"[ERROR] [PROCESS_PAGE] Failed to save CSV for page {page_num}: {csv_error}"
-                                        )
-                                        # Continue processing even if CSV save fails
-                                else:
-                                    self.page_logger.warning(
-                                        f"[WARNING] [PROCESS_PAGE] No temp_path provided for page {page_num}, skipping CSV save"
-                                    )
-
-                            except Exception as extract_error:
-                                self.page_logger.error(
-                                    f"[ERROR] [PROCESS_PAGE] Error extracting tables for page {page_num}: {extract_error}"
-                                )
-                                # Set empty extracted_tables to prevent downstream errors
-                                page_data["extracted_tables"] = []
-                                df = None
-                        else:
-                            self.page_logger.info(
-                                f"[DEBUG] [PROCESS_PAGE] No tables found in result for page {page_num}"
-                            )
-                            page_data["extracted_tables"] = []
-                            df = None
-
-                        page_data["analysis"] = result
-
-                    self.page_logger.info(
-                        f"[DEBUG] [PROCESS_PAGE] Successfully processed page {page_num}"
+                    page_logger.info(
+                        f"[DEBUG] [PROCESS_PAGE] DataFrame for page {page_num}:\n{temp_df}"
                     )
-                    self.page_logger.info(
-                        f"[DEBUG] [PROCESS_PAGE] Final DataFrame for page {page_num}: {df is not None}"
+                    page_logger.info(
+                        f"[DEBUG] [PROCESS_PAGE] DataFrame shape: {temp_df.shape}"
+                    )
+                else:
+                    page_logger.warning(
+                        f"[WARNING] [PROCESS_PAGE] Empty DataFrame created for page {page_num}"
                     )
 
-                    return df
+            except Exception as df_error:
+                page_logger.error(
+                    f"[ERROR] [PROCESS_PAGE] Failed to create or process DataFrame for page {page_num}: {df_error}"
+                )
 
-                except Exception as e:
-                    attempt += 1
-                    self.page_logger.error(
-                        f"[ERROR] [PROCESS_PAGE] Error processing page {page_num}, attempt {attempt}/{retries}: {e}"
-                    )
-                    if attempt == retries:
-                        self.page_logger.error(
-                            f"[ERROR] [PROCESS_PAGE] Failed to process page {page_num} after {retries} attempts."
-                        )
-                        return None
-                    else:
-                        self.page_logger.info(
-                            f"[DEBUG] [PROCESS_PAGE] Retrying page {page_num}, attempt {attempt + 1}"
-                        )
+        except Exception as table_processing_error:
+            page_logger.error(
+                f"[ERROR] [PROCESS_PAGE] Error processing individual table for page {page_num}: {table_processing_error}"
+            )
+            continue
 
-        with ThreadPoolExecutor() as executor:
-            future_to_page = {
-                executor.submit(
-                    process_page, self.page_path, self.page_num, self.retries
-                ): self.page_num
-                for self.page_num, self.page_path in enumerate(self.images, start=1)
-            }
-            for future in as_completed(future_to_page):
-                self.page_num = future_to_page[future]
-                try:
-                    page_data = future.result()
-                    if page_data is not None:
-                        self.combined_data.append(page_data)
-                        logger.info(
-                            f"[DEBUG] [AZURE_AGENT] Successfully processed page {self.page_num}"
-                        )
-                    else:
-                        logger.warning(
-                            f"[WARNING] [AZURE_AGENT] Page {self.page_num} returned None"
-                        )
-                except Exception as e:
-                    logger.error(
-                        f"[ERROR] [AZURE_AGENT] Page {self.page_num} failed with error: {e}"
-                    )
+    return pd.concat(df_list)
+
+
+def _field(item, attr, key, default=None):
+    """Read a field from an Azure model object or from its camelCase dictionary form."""
+    if isinstance(item, dict):
+        return item.get(key, default)
+    return getattr(item, attr, default)
+
+
+def _first_page_number(item):
+    regions = _field(item, "bounding_regions", "boundingRegions") or []
+    for region in regions:
+        page_number = _field(region, "page_number", "pageNumber")
+        if page_number is not None:
+            return page_number
+    return None
+
+
+def compact_tables(tables):
+    """
+    Reduce Azure tables to the fields read by ``extract_table_data``.
+
+    Args:
+        tables (list): Azure table objects or their dictionary form
+
+    Returns:
+        list: Tables in the JSON-serialisable dictionary format
+    """
+    return [
+        {
+            "rowCount": _field(table, "row_count", "rowCount", 0),
+            "columnCount": _field(table, "column_count", "columnCount", 0),
+            "cells": [
+                {
+                    "rowIndex": _field(cell, "row_index", "rowIndex"),
+                    "columnIndex": _field(cell, "column_index", "columnIndex"),
+                    "content": _field(cell, "content", "content") or "",
+                    "kind": _field(cell, "kind", "kind") or "",
+                }
+                for cell in _field(table, "cells", "cells") or []
+            ],
+        }
+        for table in tables
+    ]
+
+
+def column_header_cells(tables):
+    """
+    Column header texts of the widest table with Azure ``columnHeader`` cells.
+
+    Header cells spanning several rows are joined per column.
+
+    Args:
+        tables (list): Tables in the format of ``compact_tables``
+
+    Returns:
+        list: Header text per column index, or an empty list when no table has header cells
+    """
+    best, best_count = [], 0
+    for table in tables:
+        columns = {}
+        for cell in table["cells"]:
+            if cell["kind"] == "columnHeader" and cell["content"].strip():
+                column = cell["columnIndex"] or 0
+                columns.setdefault(column, []).append(" ".join(cell["content"].split()))
+        if len(columns) > best_count:
+            best_count = len(columns)
+            best = [" ".join(columns.get(index, [])) for index in range(max(columns) + 1)]
+    return best
+
+
+def split_tables_by_page(tables):
+    """
+    Split the tables of a multi-page analysis back into per-page tables.
+
+    Every cell is assigned to the page of its first bounding region, so a table
+    continuing over a page break becomes one table per page. Row indices are
+    re-based per page, which gives each page the same shape a single-page
+    analysis would produce.
+
+    Args:
+        tables (list): Azure table objects or their dictionary form
+
+    Returns:
+        dict: page number -> list of tables in the dictionary format read by ``extract_table_data``
+    """
+    tables_by_page = {}
+
+    for table in tables:
+        table_page = _first_page_number(table)
+        cells_by_page = {}
+        for cell in _field(table, "cells", "cells") or []:
+            page_number = _first_page_number(cell) or table_page
+            cells_by_page.setdefault(page_number, []).append(cell)
+
+        for page_number, cells in cells_by_page.items():
+            row_indices = [_field(cell, "row_index", "rowIndex") or 0 for cell in cells]
+            first_row = min(row_indices)
+            tables_by_page.setdefault(page_number, []).append(
+                {
+                    "rowCount": max(row_indices) - first_row + 1,
+                    "columnCount": _field(table, "column_count", "columnCount", 0),
+                    "cells": [
+                        {
+                            "rowIndex": row_index - first_row,
+                            "columnIndex": _field(cell, "column_index", "columnIndex"),
+                            "content": _field(cell, "content", "content") or "",
+                            "kind": _field(cell, "kind", "kind") or "",
+                        }
+                        for row_index, cell in zip(row_indices, cells)
+                    ],
+                }
+            )
+
+    return tables_by_page
+
+
+def _open_document(image):
+    """Return a binary stream for a page given as a file path, bytes or stream."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return io.BytesIO(image)
+    if isinstance(image, (str, os.PathLike)):
+        return open(image, "rb")
+    return image
+
+
+class AzureAgent:
+    """
+    OCR over Azure Document Intelligence.
+
+    Pages are submitted one at a time with ``submit_page_tables``; the OCR
+    stage of the page pipeline runs ``max_workers`` submitters and keeps up
+    to ``max_in_flight`` analyses pending. Results are returned per call
+    rather than stored on the agent, so one agent can be shared by several
+    threads. With AZURE_OCR_BACKEND=async the analyses,
+    their retries and backoff run on the shared ``AsyncOcrBackend`` event
+    loop: ``submit_page_tables`` returns a future at once, so a few threads
+    can keep every slot of the backend busy.
+    """
+
+    def __init__(self, retries=3, max_workers=None, backend=None, retry_budget=None):
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.backend = backend or ocr_backend()
+        # Async workers only submit analyses and never wait for them
+        default_workers = 2 if self.backend == "async" else 8
+        self.max_workers = max_workers or int(
+            os.getenv("AZURE_OCR_WORKERS", default_workers)
+        )
+        if self.backend == "async":
+            # Imported lazily so the sync path does not need aiohttp
+            from .async_ocr import max_in_flight
+
+            self.max_in_flight = max_in_flight()
+        else:
+            self.max_in_flight = self.max_workers
+
+    def analyze_document(self, document, label, page_logger=None, pages=None):
+        """
+        Run one ``begin_analyze_document`` operation through the shared Azure
+        rate limiter, retrying with jittered exponential backoff.
+
+        Args:
+            document (str|bytes|file): Page image or PDF as a path, raw bytes or binary stream
+            label: Page number or page range, used for logging
+            page_logger (Logger, optional): Logger instance for the page
+            pages (str, optional): Azure page range such as "3-8" for multi-page documents
+
+        Returns:
+            AnalyzeResult: The analysis result, or None once retries are exhausted
+        """
+        if self.backend == "async":
+            return self.submit_document(document, label, page_logger, pages).result()
+
+        page_logger = page_logger or logger
+        options = {"pages": pages} if pages else {}
+
+        def analyze():
+            page_logger.info(f"[DEBUG] [PROCESS_PAGE] page: {label}")
+            with _open_document(document) as file:
+                poller = get_document_intelligence_client().begin_analyze_document(
+                    AZURE_MODEL_ID, file, **options
+                )
+                return poller.result()
+
+        try:
+            return call_with_backoff(
+                get_rate_limiter("azure", AZURE_MODEL_ID),
+                analyze,
+                retries=self.retries,
+                retry_budget=self.retry_budget,
+                page_logger=page_logger,
+                label=f"Azure analysis of page {label}",
+            )
+        except Exception as e:
+            page_logger.error(
+                f"[ERROR] [PROCESS_PAGE] Failed to process page {label}: {e}"
+            )
+            return None
+
+    def submit_document(self, document, label, page_logger=None, pages=None, then=None):
+        """
+        Schedule ``analyze_document`` on the async backend without waiting for it.
+
+        Args:
+            document (str|bytes|file): Page image or PDF as a path, raw bytes or binary stream
+            label: Page number or page range, used for logging
+            page_logger (Logger, optional): Logger instance for the page
+            pages (str, optional): Azure page range such as "3-8" for multi-page documents
+            then (callable, optional): Applied to the result (None on failure) in a
+                short-lived thread, so blocking work stays off the event loop
+
+        Returns:
+            concurrent.futures.Future: Resolves to the result, or to ``then(result)``
+        """
+        from .async_ocr import get_async_backend
+
+        backend = get_async_backend()
+        page_logger = page_logger or logger
+        document_bytes = _read_document(document)
+
+        async def analyze():
+            page_logger.info(f"[DEBUG] [PROCESS_PAGE] page: {label}")
+            return await backend.analyze(document_bytes, pages)
+
+        async def run():
+            try:
+                result = await call_with_backoff_async(
+                    get_rate_limiter("azure", AZURE_MODEL_ID),
+                    analyze,
+                    retries=self.retries,
+                    retry_budget=self.retry_budget,
+                    page_logger=page_logger,
+                    label=f"Azure analysis of page {label}",
+                )
+            except Exception as e:
+                page_logger.error(
+                    f"[ERROR] [PROCESS_PAGE] Failed to process page {label}: {e}"
+                )
+                result = None
+            if then is None:
+                return result
+            return await asyncio.to_thread(then, result)
+
+        return backend.run(run())
+
+    def build_page_dataframe(self, page_num, tables, temp_path=None, page_logger=None):
+        """
+        Turn the Azure tables of one page into its DataFrame and optionally save it.
+
+        Args:
+            page_num (int): Page number, used for logging
+            tables (list): Azure table objects or their dictionary form
+            temp_path (str, optional): Where to save the page CSV
+            page_logger (Logger, optional): Logger instance for the page
+
+        Returns:
+            pandas.DataFrame: Table data for the page, or None if no tables could be extracted
+        """
+        page_logger = page_logger or logger
+
+        # Extract table data if tables exist
+        if not tables:
+            page_logger.info(
+                f"[DEBUG] [PROCESS_PAGE] No tables found in result for page {page_num}"
+            )
+            return None
+
+        try:
+            df = tables_to_dataframe(extract_table_data(tables), page_num, page_logger)
+        except Exception as extract_error:
+            page_logger.error(
+                f"[ERROR] [PROCESS_PAGE] Error extracting tables for page {page_num}: {extract_error}"
+            )
+            return None
+
+        # Save DataFrame to CSV with error handling
+        if temp_path:
+            try:
+                page_logger.info(
+                    f"[DEBUG] [PROCESS_PAGE] Saving CSV for page {page_num} to: {temp_path}"
+                )
+                df.to_csv(temp_path, index=False)
+                page_logger.info(
+                    f"[DEBUG] [PROCESS_PAGE] Successfully saved CSV for page {page_num}"
+                )
+            except Exception as csv_error:
+                page_logger.error(
+                    f"[ERROR] [PROCESS_PAGE] Failed to save CSV for page {page_num}: {csv_error}"
+                )
+                # Continue processing even if CSV save fails
+
+        page_logger.info(
+            f"[DEBUG] [PROCESS_PAGE] Successfully processed page {page_num}"
+        )
+        return df
+
+    def submit_page_tables(self, page_num, image, page_logger=None):
+        """
+        Start OCR for a single page and return a future of its tables.
+
+        Cache hits and the sync backend resolve the future before returning;
+        with the async backend the analysis runs on the event loop and no
+        thread waits for it.
+
+        Args:
+            page_num (int): Page number, used for logging
+            image (str|bytes|file): Page image as a path, raw bytes or binary stream
+            page_logger (Logger, optional): Logger instance for the page
+
+        Returns:
+            concurrent.futures.Future: Resolves to tables in the format of
+            ``compact_tables``, or None if OCR failed
+        """
+        page_logger = page_logger or logger
+        document = _read_document(image)
+
+        # Byte-identical pages seen before skip Azure entirely
+        cache = ocr_cache()
+        cache_key = ocr_cache_key(document)
+        tables = cache.get(cache_key) if cache else None
+        if tables is not None:
+            page_logger.info(
+                f"[DEBUG] [PROCESS_PAGE] OCR cache hit for page {page_num}"
+            )
+
+        def page_tables(result):
+            if result is None:
+                return None
+            page_logger.info(f"[DEBUG] [PROCESS_PAGE] result.tables: {result.tables}")
+            tables = compact_tables(getattr(result, "tables", None) or [])
+            if cache:
+                cache.set(cache_key, tables)
+            return tables
+
+        if tables is None and self.backend == "async":
+            return self.submit_document(document, page_num, page_logger, then=page_tables)
+
+        future = Future()
+        if tables is None:
+            tables = page_tables(self.analyze_document(document, page_num, page_logger))
+        future.set_result(tables)
+        return future
+
+
+def ocr_mode():
+    """OCR mode from AZURE_OCR_MODE: "page" (one analysis per page image) or "chunked"."""
+    return os.getenv("AZURE_OCR_MODE", "page").lower()
+
+
+class ChunkedDocumentOcr:
+    """
+    OCR a statement with one Azure analysis per chunk of pages instead of per page.
+
+    The cleaned PDF is submitted with an Azure page range for each chunk of
+    ``chunk_size`` pages, so request count and polling overhead scale with
+    chunks rather than pages. Every chunk is submitted as soon as the object
+    is built, so the chunks are analysed concurrently (on the async backend's
+    event loop, or on up to ``agent.max_workers`` threads). Results are split
+    back to pages with ``split_tables_by_page`` and exposed through the same
+    ``submit_page_tables`` contract as ``AzureAgent``; page
+    images are not needed.
+    """
+
+    def __init__(self, agent, pdf_path, page_numbers, chunk_size=None):
+        self.agent = agent
+        self.pdf_path = pdf_path
+        self.chunk_size = chunk_size or int(os.getenv("AZURE_OCR_CHUNK_SIZE", 10))
+        self.chunks = group_page_ranges(page_numbers, self.chunk_size)
+        self._results = {}
+        if agent.backend == "async":
+            document = _read_document(pdf_path)
+            for chunk in self.chunks:
+                pages = f"{chunk[0]}-{chunk[1]}"
+                self._results[chunk] = agent.submit_document(
+                    document, pages, pages=pages, then=partial(self._split, pages)
+                )
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=max(1, min(agent.max_workers, len(self.chunks))),
+                thread_name_prefix="ocr-chunk",
+            )
+            for chunk in self.chunks:
+                self._results[chunk] = executor.submit(self._analyze_chunk, chunk)
+            # Submitted chunks still run; the threads exit once they are done
+            executor.shutdown(wait=False)
+
+    def _chunk_for(self, page_num):
+        for first_page, last_page in self.chunks:
+            if first_page <= page_num <= last_page:
+                return first_page, last_page
+        raise ValueError(f"Page {page_num} is not part of any OCR chunk")
+
+    def _split(self, pages, result):
+        """page number -> tables of a chunk's analysis, or None if it failed."""
+        if result is None:
+            return None
+        logger.info(
+            f"[DEBUG] [AZURE_AGENT] Chunk {pages} returned {len(result.tables or [])} tables"
+        )
+        return split_tables_by_page(result.tables or [])
+
+    def _analyze_chunk(self, chunk):
+        first_page, last_page = chunk
+        pages = f"{first_page}-{last_page}"
+        result = self.agent.analyze_document(self.pdf_path, pages, pages=pages)
+        return self._split(pages, result)
+
+    def submit_page_tables(self, page_num, image=None, page_logger=None):
+        """
+        Future of the tables of one page, resolved when its chunk is analysed.
+
+        ``image`` is accepted for interface parity with ``AzureAgent`` and
+        ignored: the page is read from the PDF.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the page's tables (empty when
+            it has none), or None if its chunk failed
+        """
+        future = Future()
+
+        def done(chunk_future):
+            try:
+                tables_by_page = chunk_future.result()
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(
+                    None if tables_by_page is None else tables_by_page.get(page_num, [])
+                )
+
+        self._results[self._chunk_for(page_num)].add_done_callback(done)
+        return future
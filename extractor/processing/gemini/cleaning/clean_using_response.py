@@ -1,11 +1,19 @@
 import pandas as pd
 from ....utils.logger import get_logger
+from ....utils.regex_cache import get_regex_cache
+from .operation_plan import OperationPlan, operation_plan_enabled
+from .operation_trace import OperationTrace
+from .vectorized_ops import VECTORIZED_HANDLERS, cleaning_engine
 import numpy as np
 import re
 
 logger = get_logger(__name__)
 
 
+class NoTransactionsError(Exception):
+    """Raised when the operations leave no rows, e.g. for a page without a transaction table."""
+
+
 def handle_regex_replace(operations, matrix, page_logger):
     """
     Apply regex find-and-replace operations to all cells in the matrix.
@@ -22,7 +30,7 @@ def handle_regex_replace(operations, matrix, page_logger):
         numpy.ndarray: Modified matrix with regex replacements applied
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_regex_replace ===")
     page_logger.info(f"operations: {operations}")
 
@@ -50,8 +58,9 @@ def handle_regex_replace(operations, matrix, page_logger):
                         matrix[r, c] = updated_val
                         # Log changes for debugging
                         if original_val != updated_val:
-                            page_logger.info(
-                                f"[r={r}, c={c}] '{original_val}' → '{updated_val}' using pattern '{regex}'"
+                            page_logger.debug(
+                                "[r=%s, c=%s] '%s' → '%s' using pattern '%s'",
+                                r, c, original_val, updated_val, regex,
                             )
 
         return matrix
@@ -76,7 +85,7 @@ def handle_delete_rows(operations, matrix, page_logger):
         numpy.ndarray: Matrix with specified rows removed
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_delete_rows ===")
     page_logger.info(f"operations: {operations}")
 
@@ -118,7 +127,7 @@ def handle_map_column(operations, matrix, page_logger, header):
         tuple: (matrix, updated_header) - Matrix unchanged, header with new mappings
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_map_column ===")
     page_logger.info(f"operations: {operations}")
 
@@ -172,7 +181,7 @@ def handle_merge_rows(operations, matrix, page_logger):
 
     Note: Values are concatenated with space separator. Order depends on row indices.
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_merge_rows ===")
     page_logger.info(f"operations: {operations}")
 
@@ -205,12 +214,12 @@ def handle_merge_rows(operations, matrix, page_logger):
 
                     # Merge each column of the source and target rows
                     for c in range(columns_in_matrix):
-                        page_logger.info(
-                            f"merging row {rows} and {target_row_index} at column {c}"
+                        page_logger.debug(
+                            "merging row %s and %s at column %s", rows, target_row_index, c
                         )
-                        page_logger.info(f"source row value: {matrix[rows, c]}")
-                        page_logger.info(
-                            f"target row value: {matrix[target_row_index, c]}"
+                        page_logger.debug("source row value: %s", matrix[rows, c])
+                        page_logger.debug(
+                            "target row value: %s", matrix[target_row_index, c]
                         )
 
                         # Concatenate values based on row order
@@ -223,8 +232,9 @@ def handle_merge_rows(operations, matrix, page_logger):
                                 f"{matrix[rows, c]} {matrix[target_row_index, c]}"
                             )
 
-                        page_logger.info(
-                            f"merging row {rows} and {target_row_index} at column {c}\n Final element value: {merged_val}"
+                        page_logger.debug(
+                            "merging row %s and %s at column %s\n Final element value: %s",
+                            rows, target_row_index, c, merged_val,
                         )
                         matrix[target_row_index, c] = merged_val
 
@@ -251,7 +261,7 @@ def handle_split_cols(operations, matrix, page_logger):
         numpy.ndarray: Matrix with source column data split into target columns
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_split_cols ===")
     page_logger.info(f"operations: {operations}")
 
@@ -296,12 +306,12 @@ def handle_split_cols(operations, matrix, page_logger):
                 # Assign matched groups to target columns
                 for i, destination_id in enumerate(index_created):
                     if i < len(groups):
-                        page_logger.info(
-                            f"row {row_idx} original: '{cell}' -> groups: {groups}"
+                        page_logger.debug(
+                            "row %s original: '%s' -> groups: %s", row_idx, cell, groups
                         )
                         matrix[row_idx, destination_id] = groups[i]
 
-        page_logger.info(f"matrix post split_cols: \n {matrix}")
+        page_logger.debug("matrix post split_cols: \n %s", matrix)
         return matrix
 
     except Exception as e:
@@ -326,7 +336,7 @@ def handle_insert_column(operations, matrix, page_logger, header):
 
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_insert_column ===")
     page_logger.info(f"operations: {operations}")
 
@@ -352,7 +362,7 @@ def handle_insert_column(operations, matrix, page_logger, header):
 
             # Create a column filled with default_value
             default_col = np.full((matrix.shape[0],), default_value, dtype=object)
-            page_logger.info(f"default_col: {default_col}")
+            page_logger.debug("default_col: %s", default_col)
 
             # Insert column into matrix and header
             matrix = np.insert(matrix, index, default_col, axis=1)
@@ -382,7 +392,7 @@ def handle_copy_item(operations, matrix, page_logger):
 
 
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_copy_item ===")
     page_logger.info(f"operations: {operations}")
 
@@ -441,7 +451,7 @@ def handle_merge_cols(operations, matrix, page_logger):
 
     Note: Values are concatenated with space separator. Order based on column indices.
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info(f"=== Starting handle_merge_cols ===")
     page_logger.info(f"operations: {operations}")
 
@@ -472,11 +482,11 @@ def handle_merge_cols(operations, matrix, page_logger):
         # Process each row in the specified range
         for r in range(start_row, end_row):
             for source_col_index in source_col_indices:
-                page_logger.info(
-                    f"merging column {source_col_index} and {target_col_index} at row {r}"
+                page_logger.debug(
+                    "merging column %s and %s at row %s", source_col_index, target_col_index, r
                 )
-                page_logger.info(f"source column value: {matrix[r, source_col_index]}")
-                page_logger.info(f"target column value: {matrix[r, target_col_index]}")
+                page_logger.debug("source column value: %s", matrix[r, source_col_index])
+                page_logger.debug("target column value: %s", matrix[r, target_col_index])
 
                 # Concatenate values based on column order
                 if source_col_index < target_col_index:
@@ -488,11 +498,12 @@ def handle_merge_cols(operations, matrix, page_logger):
                         f"{matrix[r, target_col_index]} {matrix[r, source_col_index]}"
                     )
 
-                page_logger.info(
-                    f"merging column {source_col_index} and {target_col_index} at row {r}\n Final row: {merged_val}"
+                page_logger.debug(
+                    "merging column %s and %s at row %s\n Final row: %s",
+                    source_col_index, target_col_index, r, merged_val,
                 )
                 matrix[r, target_col_index] = merged_val
-            page_logger.info(f"row {r} after merging: {matrix[r]}")
+            page_logger.debug("row %s after merging: %s", r, matrix[r])
 
         return matrix
 
@@ -518,7 +529,7 @@ def handle_delete_cols(operations, matrix, page_logger):
 
     Note: Columns are deleted in reverse order to avoid index shifting issues.
     """
-    page_logger.info(f"starting state of dataframe: \n {matrix}")
+    page_logger.debug("starting state of dataframe: \n %s", matrix)
     page_logger.info("=== Starting handle_delete_cols ===")
     page_logger.info(f"operations: {operations}")
 
@@ -569,21 +580,22 @@ OPERATION_HANDLERS = {
 
 
 def process_gemini_response(
-    json_response, temp_path, extracted_data_path, page_logger=None
+    json_response, page_table, extracted_data_path, page_logger=None, trace=None
 ):
     """
     Main processing function that applies a sequence of operations to clean tabular data.
 
     This function orchestrates the entire data cleaning process by:
-    1. Loading CSV data into a numpy matrix
+    1. Loading the page table into a numpy matrix
     2. Processing each operation in sequence
     3. Saving the cleaned data back to CSV
 
     Args:
         json_response (dict|list): Gemini AI response containing operations to perform
-        temp_path (str): Path to input CSV file with raw extracted data
+        page_table (PageTable): Raw extracted data of the page
         extracted_data_path (str): Path where cleaned CSV data should be saved
         page_logger (Logger, optional): Logger instance for detailed operation tracking
+        trace (str, optional): Trace mode of the operations, defaults to EXTRACTOR_OPERATION_TRACE
 
     Returns:
         None: Results are saved to extracted_data_path
@@ -594,12 +606,12 @@ def process_gemini_response(
     """
     logger_ = page_logger or logger
     logger_.info("=== Starting GeminiResponseHandler execution ===")
+    trace = OperationTrace(logger_, trace)
 
-    # Load CSV data into numpy matrix
-    df = pd.read_csv(temp_path)
-    matrix = df.to_numpy()
+    # Load the page table into a numpy matrix
+    matrix = page_table.to_matrix()
     header = matrix[0]  # First row contains headers
-    page_logger.info(f"matrix (2D array) obtained from dataframe: \n {matrix}")
+    trace.matrix("matrix (2D array) obtained from dataframe", matrix)
 
     # Extract operations from response (handle both dict and list formats)
     operations = (
@@ -614,31 +626,32 @@ def process_gemini_response(
         matrix,  # keep original if not NaN
         "",  # replace if NaN
     )
-    page_logger.info(f"matrix after replacing np.nan with empty string: \n {matrix}")
+    trace.matrix("matrix after replacing np.nan with empty string", matrix)
+
+    handlers = (
+        VECTORIZED_HANDLERS if cleaning_engine() == "vectorized" else OPERATION_HANDLERS
+    )
+    # Fused steps run vectorized, so the reference engine keeps one step per operation
+    plan = OperationPlan(
+        operations,
+        handlers,
+        optimize=handlers is VECTORIZED_HANDLERS and operation_plan_enabled(),
+    )
 
-    # Process each operation sequentially
-    for op in operations:
-        op_type = op.get("operation_type")
-        op_details = op.get("operation", {})
-        logger_.info(f"Starting operation: {op_type} with details: {op_details}")
+    # Process each step sequentially
+    for step in plan.steps:
+        op_type = step.op_type
+        logger_.info(f"Starting operation: {op_type} with details: {step.describe()}")
 
-        # Get appropriate handler for this operation type
-        handler = OPERATION_HANDLERS.get(op_type)
-        if handler:
+        if step.runnable:
             try:
                 logger_.info(f"Applying operation: {op_type}")
+                trace.start(matrix, header)
+                matrix, header = step.apply(matrix, header, logger_, plan.stats)
 
-                # Special handling for operations that modify headers
-                if op_type == "map_column" or op_type == "insert_column":
-                    matrix, header = handler(
-                        [op_details], matrix, logger_, header=header
-                    )
-                else:
-                    matrix = handler([op_details], matrix, logger_)
-
-                page_logger.info(f"matrix post {op_type}: \n {matrix}")
+                trace.record(op_type, matrix, header)
                 logger_.info(f"Completed operation: {op_type}")
-                page_logger.info(f"Post operation shape of matrix: {matrix.shape}")
+                logger_.info(f"Post operation shape of matrix: {matrix.shape}")
 
             except Exception as e:
                 raise Exception(f"Operation {op_type} failed: {e}")
@@ -646,9 +659,12 @@ def process_gemini_response(
         else:
             logger_.warning(f"No handler found for operation type: {op_type}")
 
+    plan.log_summary(logger_)
+    logger_.info(f"[DEBUG] [REGEX_CACHE] {get_regex_cache().stats()}")
+
     # Validate final result and save to CSV
     if len(matrix) == 0:
-        raise Exception("No transactions found in the dataframe")
+        raise NoTransactionsError("No transactions found in the dataframe")
 
     # Create DataFrame with proper headers if possible
     if len(header) == len(matrix[0]):
@@ -659,4 +675,4 @@ def process_gemini_response(
         df = pd.DataFrame(matrix)
         df.to_csv(extracted_data_path, index=False)
 
-    logger_.info(f"Final matrix:\n {matrix}")
+    trace.matrix("Final matrix", matrix)
@@ -1,15 +1,56 @@
+import hashlib
 import json
-from google import genai
-from google.genai import types
 import os
+from google.genai import types
 from .create_pydantic_model import DynamicModel
+from ..client import gemini_model_config, get_gemini_client
+from ....utils.disk_cache import get_disk_cache
 from ....utils.logger import get_logger
-from PIL import Image
+from ....utils.rate_limiter import call_with_backoff, get_rate_limiter
 
 logger = get_logger(__name__)
 
+# Sampling settings of the cleaning call; part of the pipeline version
+GENERATION_SETTINGS = {"temperature": 1, "include_thoughts": True}
+
+
+# How the raw table is introduced in the prompt for the non-XML encodings. The
+# rest of the prompt keeps calling the table "the XML"; the note maps that onto
+# the encoding so the operation definitions stay unchanged.
+TABLE_SECTIONS = {
+    "tsv": (
+        "RAW TABLE (TSV):\n"
+        "            The raw table is given as tab-separated values instead of XML. The first line names the columns col_0, col_1, ...; every other line starts with the 0-based row index, followed by the cells of that row. Row and column indices are exactly those of the XML format (row_N, col_N). Wherever these instructions refer to the XML, they mean this table. Inside a cell, \\t, \\n and \\\\ stand for a tab, a line break and a backslash.\n"
+        "            {table}"
+    ),
+    "json": (
+        "RAW TABLE (JSON):\n"
+        "            The raw table is given as a JSON array instead of XML. Each inner array is one row and holds its cells in column order. The 0-based position of a row in the outer array is its row index and the position of a cell in its row is its column index, exactly as row_N and col_N in the XML format. Wherever these instructions refer to the XML, they mean this table.\n"
+        "            {table}"
+    ),
+}
+
+
+def table_section(xml_output, encoding="xml"):
+    """The raw table block of the cleaning prompt for an encoding."""
+    if encoding in TABLE_SECTIONS:
+        return TABLE_SECTIONS[encoding].format(table=xml_output)
+    return f"""RAW TABLE XML:
+            {xml_output}"""
+
+
+def feedback_section(feedback):
+    """Closing block of a re-prompt, listing why the previous operations could not be applied."""
+    return f"""
+
+            ### YOUR PREVIOUS OPERATIONS FOR THIS PAGE FAILED:
+            The operations you returned before could not be applied to the raw table. Indices refer to the table as it is after all earlier operations have run.
+            {feedback}
+            Return the complete corrected list of operations for this page.
+        """
 
-def prompt(target_schema, xml_output):
+
+def prompt(target_schema, xml_output, encoding="xml"):
     return f"""
             You are an expert bank statement formatter. Your task is to generate the necessary row and column modifications to transform the provided raw table into a final, clean table that adheres to the TARGET SCHEMA. You have access to the original image of the page as a primary reference to accurately identify column boundaries, data types, and formatting discrepancies that may not be fully apparent in the raw XML alone. The series of operations should mandatorily transform the XML to match the provided transaction table in the original image.
 
@@ -47,8 +88,7 @@ def prompt(target_schema, xml_output):
             RULES FOR YOUR ANALYSIS AND OUTPUT:
             Refer to the Original Image: Use the visual layout to resolve ambiguities in RAW TABLE XML—like split cells, misaligned headers, or visually merged columns.
 
-            RAW TABLE XML:
-            {xml_output}
+            {table_section(xml_output, encoding)}
 
             Your output must be a single JSON object structured according to the BankStatementFormattingOutput Pydantic model.
 
@@ -258,32 +298,105 @@ def prompt(target_schema, xml_output):
         """
 
 
+def response_cache():
+    """
+    Persistent cache of cleaning responses.
+
+    Entries expire after GEMINI_CACHE_TTL_HOURS (default 168) and the cache is
+    bounded by GEMINI_CACHE_MAX_MB (default 256) of compressed responses.
+    """
+    ttl_seconds = float(os.getenv("GEMINI_CACHE_TTL_HOURS", 168)) * 3600
+    max_bytes = int(os.getenv("GEMINI_CACHE_MAX_MB", 256)) * 1024 * 1024
+    return get_disk_cache("gemini_cleaning", max_bytes, ttl_seconds)
+
+
+def bypass_response_cache():
+    """Whether cached cleaning responses are ignored (GEMINI_CACHE_BYPASS)."""
+    return os.getenv("GEMINI_CACHE_BYPASS", "false").lower() in ("1", "true", "yes")
+
+
 class GeminiAgent:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = "gemini-2.5-flash"
+    def __init__(self, retries=3, retry_budget=None, bypass_cache=None):
+        self.client = get_gemini_client("cleaning")
+        self.model = gemini_model_config("cleaning")["model"]
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.bypass_cache = (
+            bypass_response_cache() if bypass_cache is None else bypass_cache
+        )
+        # Key of the page's first prompt, under which a working program is stored
+        self.response_key = None
 
-    def call_gemini(self, xml_output, image, headers, page_logger):
+    def cache_key(self, prompt_text, image):
+        """
+        Hash of everything that determines the cleaning response.
 
-        prompt_text = prompt(headers, str(xml_output))
+        The prompt text already embeds the header map and the XML; the image
+        is represented by its PNG hash.
+        """
+        digest = hashlib.sha256()
+        for part in (
+            self.model,
+            json.dumps(GENERATION_SETTINGS, sort_keys=True),
+            json.dumps(DynamicModel.model_json_schema(), sort_keys=True),
+            prompt_text,
+            image.sha256,
+        ):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def call_gemini(
+        self, xml_output, image, headers, page_logger, encoding="xml", feedback=None
+    ):
+
+        prompt_text = prompt(headers, str(xml_output), encoding)
+        # A re-prompt carries the validation errors of the previous response
+        if feedback:
+            prompt_text += feedback_section(feedback)
 
         page_logger.debug(f"Prompt Text: {prompt_text}")
-        image = Image.open(image)
 
-        content = [prompt_text, image]
+        # Identical inputs are answered from the cache; a bypass still
+        # refreshes the stored response once the page has been cleaned
+        cache = response_cache()
+        cache_key = self.cache_key(prompt_text, image)
+        if not feedback:
+            self.response_key = cache_key
+        if not self.bypass_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                page_logger.info(
+                    f"[DEBUG] [GEMINI_CACHE] Cache hit for page {image.page_num}"
+                )
+                return cached
+
+        # Shares the page's PNG bytes instead of re-reading the image from disk
+        image_part = types.Part.from_bytes(data=image.png_bytes, mime_type="image/png")
+
+        content = [prompt_text, image_part]
 
         thoughts = ""
         answer = ""
 
-        response = self.client.models.generate_content(
-            model=self.model,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=DynamicModel,
-                temperature=1,
-                thinking_config=types.ThinkingConfig(include_thoughts=True),
+        response = call_with_backoff(
+            get_rate_limiter("gemini", self.model),
+            lambda: self.client.models.generate_content(
+                model=self.model,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=DynamicModel,
+                    temperature=GENERATION_SETTINGS["temperature"],
+                    thinking_config=types.ThinkingConfig(
+                        include_thoughts=GENERATION_SETTINGS["include_thoughts"]
+                    ),
+                ),
+                contents=content,
             ),
-            contents=content,
+            retries=self.retries,
+            retry_budget=self.retry_budget,
+            page_logger=page_logger,
+            label=f"Gemini cleaning call ({self.model})",
         )
 
         for part in response.candidates[0].content.parts:
@@ -300,5 +413,15 @@ class GeminiAgent:
                 page_logger.info(part.text)
                 answer += part.text
 
-        json_response = json.loads(response.text)["operations"]
-        return json_response
+        return json.loads(response.text)["operations"]
+
+    def cache_response(self, json_response):
+        """
+        Store a program once it has cleaned its page.
+
+        Responses are only cached after validation and processing succeeded,
+        so a failing program is never replayed. It is stored under the key of
+        the page's first prompt, so the next run skips any re-prompting too.
+        """
+        if self.response_key is not None:
+            response_cache().set(self.response_key, json_response)
@@ -0,0 +1,238 @@
+import os
+import numpy as np
+from ....utils.logger import get_logger
+from ....utils.regex_cache import compile_regex
+
+logger = get_logger(__name__)
+
+DELETIONS = ("delete_rows", "delete_cols")
+# Operations that also update the header
+HEADER_OPERATIONS = ("map_column", "insert_column")
+# Operations whose handlers do nothing for an empty operation list on a page with rows;
+# merge_cols is missing because its handler fails on an empty list
+SKIPPABLE_WHEN_EMPTY = (
+    "regex_replace",
+    "delete_rows",
+    "delete_cols",
+    "map_column",
+    "merge_rows",
+    "split_cols",
+    "insert_column",
+    "copy_item",
+)
+
+
+def operation_plan_enabled():
+    """Whether operation lists are optimized before they run (EXTRACTOR_OPERATION_PLAN)."""
+    return os.getenv("EXTRACTOR_OPERATION_PLAN", "true").lower() in ("1", "true", "yes")
+
+
+class PlanStep:
+    """
+    One step of an operation plan.
+
+    A step either runs a single operation of the Gemini response through its
+    handler, or runs a fused group: consecutive row and column deletions
+    applied as one mask, or consecutive regex replacements applied as one
+    chained pass.
+    """
+
+    def __init__(self, op_type, details=None, handler=None, deletions=None, regexes=None):
+        self.op_type = op_type
+        self.details = details
+        self.handler = handler
+        self.deletions = deletions
+        self.regexes = regexes
+
+    @property
+    def runnable(self):
+        """False for operations without a handler, which are skipped with a warning."""
+        return (
+            self.handler is not None
+            or self.deletions is not None
+            or self.regexes is not None
+        )
+
+    def describe(self):
+        """Operation details for logging; the fused operations for fused steps."""
+        if self.deletions is not None:
+            return self.deletions
+        if self.regexes is not None:
+            return self.regexes
+        return self.details
+
+    def apply(self, matrix, header, page_logger, stats):
+        """
+        Run the step.
+
+        Returns:
+            tuple: (matrix, header)
+        """
+        if self.deletions is not None:
+            return _apply_deletions(self.deletions, matrix, page_logger, stats), header
+        if self.regexes is not None:
+            return _apply_regex_chain(self.regexes, matrix, page_logger), header
+        if self.op_type in HEADER_OPERATIONS:
+            return self.handler([self.details], matrix, page_logger, header=header)
+        return self.handler([self.details], matrix, page_logger), header
+
+
+def _fusable(op_type, details, key):
+    # Malformed operations keep their own step so they fail in their handler
+    inner_ops = details.get(op_type) if isinstance(details, dict) else None
+    return isinstance(inner_ops, list) and all(
+        isinstance(inner_op, dict) and all(name in inner_op for name in key)
+        for inner_op in inner_ops
+    )
+
+
+def _apply_deletions(deletions, matrix, page_logger, stats):
+    """
+    Apply consecutive row and column deletions with a single copy.
+
+    The deletions are simulated on the row and column positions exactly as
+    the handlers perform them, one ``np.delete`` at a time, and the surviving
+    positions are taken from the matrix once.
+    """
+    kept_rows = np.arange(matrix.shape[0])
+    kept_cols = np.arange(matrix.shape[1])
+    copies = 0
+
+    for op_type, inner_op in deletions:
+        try:
+            if op_type == "delete_rows":
+                row_indices = inner_op.get("row_indices", [])
+                valid_indices = [i for i in row_indices if 0 <= i < len(kept_rows)]
+                if valid_indices:
+                    kept_rows = np.delete(kept_rows, valid_indices)
+                    copies += 1
+            else:
+                deleted = False
+                for col_index in sorted(inner_op.get("col_indices", []), reverse=True):
+                    if col_index < len(kept_cols):
+                        if len(kept_rows) == 0:
+                            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+                        kept_cols = np.delete(kept_cols, col_index)
+                        deleted = True
+                copies += deleted
+        except Exception as e:
+            raise Exception(f"Error in handle_{op_type}: {e}")
+
+    page_logger.info(
+        f"[DEBUG] [OPERATION_PLAN] Deleting {matrix.shape[0] - len(kept_rows)} rows and "
+        f"{matrix.shape[1] - len(kept_cols)} columns with one copy instead of {copies}"
+    )
+    if copies:
+        matrix = matrix[np.ix_(kept_rows, kept_cols)]
+        stats["copies_saved"] += copies - 1
+    return matrix
+
+
+def _apply_regex_chain(regexes, matrix, page_logger):
+    """
+    Apply consecutive regex replacements in a single pass over the matrix.
+
+    Every distinct non-empty string cell runs through the whole chain. As in
+    the handler, a pattern only sees cells that are still non-empty, and it is
+    compiled the first time such a cell reaches it.
+    """
+    try:
+        if len(matrix) == 0:
+            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+        compiled = [None] * len(regexes)
+
+        def run_chain(value):
+            for position, (regex, replacement) in enumerate(regexes):
+                if not value:
+                    break
+                if compiled[position] is None:
+                    compiled[position] = compile_regex(regex)
+                value = compiled[position].sub(replacement, value)
+            return value
+
+        values = matrix.ravel().tolist()
+        distinct = {value for value in values if isinstance(value, str) and value}
+        replaced = {value: run_chain(value) for value in distinct}
+        replaced = {value: new for value, new in replaced.items() if new != value}
+        page_logger.info(
+            f"[DEBUG] [OPERATION_PLAN] {len(regexes)} regex replacements in one pass "
+            f"changed {len(replaced)} distinct values"
+        )
+        if replaced:
+            values = [
+                replaced.get(value, value) if isinstance(value, str) else value
+                for value in values
+            ]
+            matrix[:, :] = np.array(values, dtype=object).reshape(matrix.shape)
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_regex_replace: {e}")
+
+
+class OperationPlan:
+    """
+    Execution plan of the operations returned by Gemini.
+
+    Without optimization every operation is its own step, exactly as the
+    operations are listed. With optimization, operations with empty lists are
+    dropped, runs of ``delete_rows``/``delete_cols`` become one deletion step
+    and runs of ``regex_replace`` become one chained pass. The matrix produced
+    is identical either way; ``stats`` reports the passes and copies saved.
+    """
+
+    def __init__(self, operations, handlers, optimize=True):
+        self.steps = []
+        self.stats = {
+            "operations": len(operations),
+            "dropped": 0,
+            "passes_saved": 0,
+            "copies_saved": 0,
+        }
+
+        passes_before = 0
+        for op in operations:
+            op_type = op.get("operation_type")
+            op_details = op.get("operation", {})
+            handler = handlers.get(op_type)
+
+            if not optimize or handler is None:
+                self.steps.append(PlanStep(op_type, op_details, handler))
+                continue
+
+            inner_ops = op_details.get(op_type) if isinstance(op_details, dict) else None
+            previous = self.steps[-1] if self.steps else None
+            passes_before += 1
+
+            if op_type in SKIPPABLE_WHEN_EMPTY and inner_ops == []:
+                self.stats["dropped"] += 1
+            elif op_type in DELETIONS and _fusable(op_type, op_details, ()):
+                deletions = [(op_type, inner_op) for inner_op in inner_ops]
+                if previous is not None and previous.deletions is not None:
+                    previous.deletions.extend(deletions)
+                    if op_type not in previous.op_type.split("+"):
+                        previous.op_type = f"{previous.op_type}+{op_type}"
+                else:
+                    self.steps.append(PlanStep(op_type, deletions=deletions))
+            elif op_type == "regex_replace" and _fusable(op_type, op_details, ("regex", "replacement")):
+                # Each pattern is a pass of its own without the plan
+                passes_before += len(inner_ops) - 1
+                regexes = [(inner_op["regex"], inner_op["replacement"]) for inner_op in inner_ops]
+                if previous is not None and previous.regexes is not None:
+                    previous.regexes.extend(regexes)
+                else:
+                    self.steps.append(PlanStep(op_type, regexes=regexes))
+            else:
+                self.steps.append(PlanStep(op_type, op_details, handler))
+
+        if optimize:
+            self.stats["passes_saved"] = passes_before - sum(
+                step.runnable for step in self.steps
+            )
+
+    def log_summary(self, page_logger):
+        page_logger.info(
+            f"[DEBUG] [OPERATION_PLAN] {self.stats['operations']} operations planned into "
+            f"{len(self.steps)} steps ({self.stats['dropped']} no-ops dropped): saved "
+            f"{self.stats['passes_saved']} passes and {self.stats['copies_saved']} copies"
+        )
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import numpy as np
+from ....utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRACE_MODES = ("diff", "full", "off")
+TRACE_LEVEL = logging.INFO
+# Changed cells listed per operation; the rest are only counted
+MAX_TRACED_CELLS = 50
+
+
+def operation_trace_mode():
+    """
+    How cleaning operations are traced in the page logs (EXTRACTOR_OPERATION_TRACE).
+
+    "diff" (default) logs the cells each operation changed, "full" the whole
+    matrix after every operation and "off" nothing.
+    """
+    mode = os.getenv("EXTRACTOR_OPERATION_TRACE", "diff").lower()
+    if mode not in TRACE_MODES:
+        logger.warning(
+            f"[DEBUG] [TRACE] Unknown trace mode {mode!r}, using 'diff' "
+            f"(choose from {', '.join(TRACE_MODES)})"
+        )
+        return "diff"
+    return mode
+
+
+class CellDiff:
+    """
+    Changes of one operation, formatted only when the log record is emitted.
+
+    Renders as one JSON object: the operation, its shape (before and after
+    when it changed), the header when it changed and, for operations that
+    kept the shape, the number of changed cells with the first
+    ``MAX_TRACED_CELLS`` as ``[row, col, old, new]``.
+    """
+
+    def __init__(self, op_type, before, after, header_before, header_after):
+        self.op_type = op_type
+        self.before = before
+        self.after = after
+        self.header_before = header_before
+        self.header_after = header_after
+
+    def as_dict(self):
+        record = {"op": self.op_type}
+        if self.before.shape == self.after.shape:
+            record["shape"] = list(self.after.shape)
+            changed = np.argwhere(self.before != self.after)
+            record["changed"] = len(changed)
+            record["cells"] = [
+                [int(r), int(c), self.before[r, c], self.after[r, c]]
+                for r, c in changed[:MAX_TRACED_CELLS]
+            ]
+        else:
+            record["shape"] = [list(self.before.shape), list(self.after.shape)]
+        header_before = np.asarray(self.header_before).tolist()
+        header_after = np.asarray(self.header_after).tolist()
+        if header_before != header_after:
+            record["header"] = header_after
+        return record
+
+    def __str__(self):
+        return json.dumps(self.as_dict(), ensure_ascii=False, default=str)
+
+
+class OperationTrace:
+    """
+    Per-page trace of the cleaning operations.
+
+    Nothing is copied or formatted unless the page logger is enabled for
+    ``TRACE_LEVEL`` and the mode is not "off"; messages are passed to the
+    logger as arguments, so numpy arrays are only turned into text by
+    handlers that actually write the record.
+    """
+
+    def __init__(self, page_logger, mode=None):
+        self.page_logger = page_logger
+        self.mode = mode or operation_trace_mode()
+        self.enabled = self.mode != "off" and page_logger.isEnabledFor(TRACE_LEVEL)
+        self._before = None
+
+    def matrix(self, label, matrix):
+        """Log a whole matrix, in "full" mode only."""
+        if self.enabled and self.mode == "full":
+            self.page_logger.log(TRACE_LEVEL, "%s: \n %s", label, matrix)
+
+    def start(self, matrix, header):
+        """Snapshot the matrix before an operation runs."""
+        if self.enabled and self.mode == "diff":
+            # Handlers may update the matrix in place
+            self._before = (matrix.copy(), np.array(header, dtype=object))
+
+    def record(self, op_type, matrix, header):
+        """Log what the operation changed since ``start``."""
+        if not self.enabled:
+            return
+        if self.mode == "full":
+            self.page_logger.log(TRACE_LEVEL, "matrix post %s: \n %s", op_type, matrix)
+        elif self._before is not None:
+            before, header_before = self._before
+            self._before = None
+            self.page_logger.log(
+                TRACE_LEVEL,
+                "[DEBUG] [TRACE] %s",
+                CellDiff(op_type, before, matrix, header_before, header),
+            )
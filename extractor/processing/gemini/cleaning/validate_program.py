@@ -0,0 +1,289 @@
+import json
+import os
+import re
+from ....utils.logger import get_logger
+from ....utils.regex_cache import UnsafePatternError, compile_regex
+
+logger = get_logger(__name__)
+
+DEFAULT_REPROMPT_ATTEMPTS = 1
+
+
+def reprompt_attempts():
+    """How often a page is re-prompted after its program failed validation (EXTRACTOR_REPROMPT_ATTEMPTS)."""
+    return max(0, int(os.getenv("EXTRACTOR_REPROMPT_ATTEMPTS", DEFAULT_REPROMPT_ATTEMPTS)))
+
+
+class ProgramError:
+    """A problem that would make an operation of a Gemini program fail."""
+
+    def __init__(self, step, operation_type, message):
+        self.step = step
+        self.operation_type = operation_type
+        self.message = message
+
+    def as_dict(self):
+        return {
+            "step": self.step,
+            "operation_type": self.operation_type,
+            "message": self.message,
+        }
+
+    def __str__(self):
+        return f"Operation {self.step} ({self.operation_type}): {self.message}"
+
+
+class ProgramValidation:
+    """
+    Result of checking a program against the shape of a page.
+
+    Attributes:
+        operations (list): The program that was checked
+        errors (list): ProgramError per failing operation, in program order
+        shapes (list): (rows, columns) after every operation that was simulated
+    """
+
+    def __init__(self, shape, operations=None):
+        self.initial_shape = shape
+        self.operations = operations or []
+        self.errors = []
+        self.shapes = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def feedback(self):
+        """Rejected program and its error list for re-prompting Gemini with the page."""
+        rows, cols = self.initial_shape
+        return "\n".join(
+            ["The operations you returned were:", json.dumps(self.operations, ensure_ascii=False)]
+            + [f"The raw table has {rows} rows and {cols} columns."]
+            + [f"- {error}" for error in self.errors]
+        )
+
+
+class _Invalid(Exception):
+    pass
+
+
+def _int(value, name):
+    if not isinstance(value, int):
+        raise _Invalid(f"{name} must be an integer, got {value!r}")
+    return value
+
+
+def _within(value, size, name, unit, allow_negative=True):
+    _int(value, name)
+    low = -size if allow_negative else 0
+    if not low <= value < size:
+        raise _Invalid(f"{name} {value} is out of range for {size} {unit}")
+    return value
+
+
+def _row_range(op, rows):
+    row_range = op.get("row_range", {})
+    if not isinstance(row_range, dict):
+        raise _Invalid(f"row_range must be an object, got {row_range!r}")
+    start_row = _int(row_range.get("start_row", 0), "start_row")
+    end_row = _int(row_range.get("end_row", rows), "end_row")
+    if end_row < 0:
+        end_row = rows
+    return start_row, end_row
+
+
+def _check_rows(start_row, end_row, rows):
+    """The handlers visit every row of ``range(start_row, end_row)``."""
+    if start_row < end_row and (start_row < -rows or end_row > rows):
+        raise _Invalid(
+            f"row_range {start_row} to {end_row} is out of range for {rows} rows"
+        )
+
+
+def _compile(regex, name):
+    if not isinstance(regex, str):
+        raise _Invalid(f"{name} must be a string, got {regex!r}")
+    try:
+        return compile_regex(regex)
+    except re.error as e:
+        raise _Invalid(f"{name} {regex!r} does not compile: {e}")
+    except UnsafePatternError as e:
+        raise _Invalid(f"{name} is refused: {e}")
+
+
+def _check_replacement(pattern, replacement):
+    """Expand the template against an empty match with the same groups as the pattern."""
+    if not isinstance(replacement, str):
+        raise _Invalid(f"replacement must be a string, got {replacement!r}")
+    names = {index: name for name, index in pattern.groupindex.items()}
+    groups = "".join(
+        f"(?P<{names[index]}>)" if index in names else "()"
+        for index in range(1, pattern.groups + 1)
+    )
+    try:
+        re.compile(groups).sub(replacement, "")
+    except (re.error, IndexError) as e:
+        raise _Invalid(f"replacement {replacement!r} is invalid: {e}")
+
+
+def _inner_ops(op_type, details):
+    if not isinstance(details, dict) or not isinstance(details.get(op_type), list):
+        raise _Invalid(f"operation must hold a list under {op_type!r}")
+    inner_ops = details[op_type]
+    for inner_op in inner_ops:
+        if not isinstance(inner_op, dict):
+            raise _Invalid(f"{op_type} entries must be objects, got {inner_op!r}")
+    return inner_ops
+
+
+def _simulate(op_type, inner_ops, shape):
+    """
+    Apply one operation to the simulated shape, raising _Invalid where the handler would fail.
+
+    Returns:
+        tuple: (rows, columns, header length) after the operation
+    """
+    rows, cols, header_length = shape
+
+    if op_type == "regex_replace":
+        for inner_op in inner_ops:
+            pattern = _compile(inner_op.get("regex"), "regex")
+            _check_replacement(pattern, inner_op.get("replacement"))
+
+    elif op_type == "delete_rows":
+        for inner_op in inner_ops:
+            row_indices = [_int(i, "row_index") for i in inner_op.get("row_indices", [])]
+            # Indices outside the table are ignored by the handler
+            rows -= len({i for i in row_indices if 0 <= i < rows})
+
+    elif op_type == "map_column":
+        for inner_op in inner_ops:
+            if "header_name" not in inner_op:
+                raise _Invalid("header_name is missing")
+            for col_index in inner_op.get("column_index", []):
+                _int(col_index, "column_index")
+                if col_index < -header_length or col_index > header_length:
+                    raise _Invalid(
+                        f"column_index {col_index} is out of range for {header_length} headers"
+                    )
+                if col_index == header_length:
+                    header_length += 1
+
+    elif op_type == "merge_rows":
+        for inner_op in inner_ops:
+            start_row, end_row = _row_range(inner_op, rows)
+            target_row_index = inner_op.get("target_row_index")
+            for source in inner_op.get("source_row_indices", []):
+                if start_row <= _int(source, "source_row_index") <= end_row:
+                    _within(target_row_index, rows, "target_row_index", "rows", allow_negative=False)
+                    if cols:
+                        _within(source, rows, "source_row_index", "rows")
+
+    elif op_type == "split_cols":
+        for inner_op in inner_ops:
+            start_row, end_row = _row_range(inner_op, rows)
+            pattern = _compile(inner_op.get("split_logic", ""), "split_logic")
+            num_target_cols = _int(inner_op.get("num_target_cols"), "num_target_cols")
+            if start_row >= end_row:
+                continue
+            _check_rows(start_row, end_row, rows)
+            _within(inner_op.get("source_col_index"), cols, "source_col_index", "columns")
+            # Matched rows fill as many targets as there are groups, unmatched ones num_target_cols
+            filled = max(pattern.groups, num_target_cols)
+            for i, destination in enumerate(inner_op.get("index_created", [])):
+                if i < filled:
+                    _within(destination, cols, "index_created", "columns")
+
+    elif op_type == "insert_column":
+        for inner_op in inner_ops:
+            if "name" not in inner_op:
+                raise _Invalid("name is missing")
+            index = min(_int(inner_op.get("position"), "position"), cols)
+            if not isinstance(inner_op.get("default_value", ""), str):
+                raise _Invalid("default_value must be a string")
+            if index < -cols or not -header_length <= index <= header_length:
+                raise _Invalid(f"position {index} is out of range for {cols} columns")
+            cols += 1
+            header_length += 1
+
+    elif op_type == "copy_item":
+        for inner_op in inner_ops:
+            _within(inner_op.get("from_row"), rows, "from_row", "rows", allow_negative=False)
+            _within(inner_op.get("from_col"), cols, "from_col", "columns", allow_negative=False)
+            _within(inner_op.get("to_row"), rows, "to_row", "rows", allow_negative=False)
+            _within(inner_op.get("to_col"), cols, "to_col", "columns", allow_negative=False)
+
+    elif op_type == "merge_cols":
+        if not inner_ops:
+            raise _Invalid("merge_cols needs at least one entry")
+        # Only the last entry is applied by the handler
+        inner_op = inner_ops[-1]
+        target_col_index = inner_op.get("target_col_index")
+        sources = [
+            _int(i, "source_col_index")
+            for i in inner_op.get("source_col_indices", [])
+            if i != target_col_index
+        ]
+        start_row, end_row = _row_range(inner_op, rows)
+        if start_row < end_row:
+            _check_rows(start_row, end_row, rows)
+            if sources:
+                _within(target_col_index, cols, "target_col_index", "columns")
+                for source in sources:
+                    _within(source, cols, "source_col_index", "columns")
+
+    elif op_type == "delete_cols":
+        for inner_op in inner_ops:
+            col_indices = [_int(i, "col_index") for i in inner_op.get("col_indices", [])]
+            for col_index in sorted(col_indices, reverse=True):
+                if col_index < cols:
+                    if col_index < -cols:
+                        raise _Invalid(f"col_index {col_index} is out of range for {cols} columns")
+                    cols -= 1
+
+    return rows, cols, header_length
+
+
+def validate_program(operations, shape, handlers=None):
+    """
+    Dry-run a Gemini program on the shape of a page.
+
+    The number of rows, columns and headers is carried through the program
+    and every index, row range, regex and replacement template is checked
+    against the shape at that point, without touching the page data.
+    Problems are collected per operation; an operation that fails stops the
+    simulation because the shape after it is unknown. Once a program has
+    deleted every row the page is empty anyway and nothing more is checked.
+
+    Args:
+        operations (list|dict): Operations as returned by Gemini
+        shape (tuple): (rows, columns) of the raw page table
+        handlers (dict, optional): Known operation types, defaults to every cleaning operation
+
+    Returns:
+        ProgramValidation: Errors and the simulated shapes
+    """
+    if handlers is None:
+        from .vectorized_ops import VECTORIZED_HANDLERS as handlers
+
+    if isinstance(operations, dict):
+        operations = operations.get("operations", [])
+    validation = ProgramValidation(tuple(shape), operations)
+    rows, cols = shape
+    state = (rows, cols, cols)
+
+    for step, op in enumerate(operations):
+        if state[0] == 0:
+            break
+        op_type = op.get("operation_type") if isinstance(op, dict) else None
+        if op_type not in handlers:
+            # Skipped with a warning when the program runs
+            continue
+        try:
+            state = _simulate(op_type, _inner_ops(op_type, op.get("operation", {})), state)
+        except _Invalid as e:
+            validation.errors.append(ProgramError(step, op_type, str(e)))
+            break
+        validation.shapes.append(state[:2])
+
+    return validation
@@ -0,0 +1,445 @@
+import operator
+import os
+import numpy as np
+from ....utils.logger import get_logger
+from ....utils.regex_cache import compile_regex
+
+logger = get_logger(__name__)
+
+# Element-wise "left right" concatenation over object arrays; formats values
+# exactly like the f-strings of the reference handlers
+_join = np.frompyfunc(lambda left, right: f"{left} {right}", 2, 1)
+
+
+def cleaning_engine():
+    """
+    Engine that applies the cleaning operations (EXTRACTOR_CLEANING_ENGINE).
+
+    "vectorized" (default) uses the handlers of this module, "reference" the
+    cell-by-cell handlers of ``clean_using_response``. Both produce the same
+    matrix; the reference engine logs every cell it touches.
+    """
+    return os.getenv("EXTRACTOR_CLEANING_ENGINE", "vectorized").lower()
+
+
+def _position(index, size):
+    """Non-negative position of a numpy index, raising like numpy when out of bounds."""
+    index = operator.index(index)
+    if not -size <= index < size:
+        raise IndexError(f"index {index} is out of bounds for axis with size {size}")
+    return index % size
+
+
+def _distinct_runs(rows):
+    """
+    Split row positions into consecutive runs without repeated rows.
+
+    Rows of one run can be processed at once; runs are processed in order,
+    which keeps the row-by-row semantics when a negative range start makes
+    the reference handler visit a row twice.
+    """
+    runs, seen = [[]], set()
+    for row in rows:
+        if row in seen:
+            runs.append([])
+            seen = set()
+        runs[-1].append(row)
+        seen.add(row)
+    return [run for run in runs if run]
+
+
+def _row_range(op, matrix):
+    row_range = op.get("row_range", {})
+    start_row = row_range.get("start_row", 0)
+    end_row = row_range.get("end_row", len(matrix))
+    if end_row < 0:
+        end_row = len(matrix)
+    return start_row, end_row
+
+
+def handle_regex_replace(operations, matrix, page_logger):
+    """
+    Apply regex find-and-replace operations to all non-empty string cells.
+
+    Each pattern comes from the shared regex cache and is applied once per
+    distinct cell value; the results are scattered back over the matrix in a
+    single assignment.
+
+    Args:
+        operations (list): List containing operation dictionary with 'regex_replace' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Modified matrix with regex replacements applied
+    """
+    try:
+        if len(matrix) == 0:
+            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+        regex_replace_ops = operations[0]["regex_replace"]
+
+        values = matrix.ravel().tolist()
+        changed = False
+        for regex_replace in regex_replace_ops:
+            regex = regex_replace["regex"]
+            replacement = regex_replace["replacement"]
+            page_logger.info(f"Replacing {regex} with {replacement}")
+
+            distinct = {value for value in values if isinstance(value, str) and value}
+            if not distinct:
+                continue
+            pattern = compile_regex(regex)
+            replaced = {value: pattern.sub(replacement, value) for value in distinct}
+            replaced = {value: new for value, new in replaced.items() if new != value}
+            if replaced:
+                changed = True
+                values = [
+                    replaced.get(value, value) if isinstance(value, str) else value
+                    for value in values
+                ]
+
+        if changed:
+            matrix[:, :] = np.array(values, dtype=object).reshape(matrix.shape)
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_regex_replace: {e}")
+
+
+def handle_delete_rows(operations, matrix, page_logger):
+    """
+    Delete specified rows from the matrix.
+
+    Args:
+        operations (list): List containing operation dictionary with 'delete_rows' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with specified rows removed
+    """
+    try:
+        for delete_rows in operations[0]["delete_rows"]:
+            row_indices = delete_rows.get("row_indices", [])
+            valid_indices = [i for i in row_indices if 0 <= i < matrix.shape[0]]
+            page_logger.info(f"Deleting rows {valid_indices}")
+            if valid_indices:
+                matrix = np.delete(matrix, valid_indices, 0)
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_delete_rows: {e}")
+
+
+def handle_map_column(operations, matrix, page_logger, header):
+    """
+    Map column headers to specific positions in the header array.
+
+    Args:
+        operations (list): List containing operation dictionary with 'map_column' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+        header (numpy.ndarray): 1D array representing column headers
+
+    Returns:
+        tuple: (matrix, updated_header) - Matrix unchanged, header with new mappings
+    """
+    try:
+        for map_column_op in operations[0]["map_column"]:
+            header_name = map_column_op["header_name"]
+            col_indices = map_column_op["column_index"]
+            page_logger.info(f"Mapping {header_name} to index {col_indices}")
+
+            for col_index in col_indices:
+                if col_index < len(header):
+                    header[col_index] = header_name
+                else:
+                    header = np.insert(header, col_index, header_name)
+
+        return matrix, header
+
+    except Exception as e:
+        raise Exception(f"Error in handle_map_column: {e}")
+
+
+def handle_merge_rows(operations, matrix, page_logger):
+    """
+    Merge source rows into a target row, one whole row per step.
+
+    Args:
+        operations (list): List containing operation dictionary with 'merge_rows' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with rows merged (source rows remain but target updated)
+    """
+    merge_ops = operations[0]["merge_rows"]
+
+    try:
+        if len(matrix) == 0:
+            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+
+        for merge_op in merge_ops:
+            start_row, end_row = _row_range(merge_op, matrix)
+            source_row_indices = merge_op.get("source_row_indices", [])
+            target_row_index = merge_op.get("target_row_index")
+            page_logger.info(
+                f"Merging {source_row_indices} to {target_row_index} within the range of {start_row} to {end_row}"
+            )
+
+            for rows in source_row_indices:
+                if start_row <= rows <= end_row:
+                    if not (0 <= target_row_index < matrix.shape[0]):
+                        raise ValueError("Invalid target row index")
+                    if matrix.shape[1] == 0:
+                        continue
+                    source = matrix[_position(rows, matrix.shape[0])]
+                    target = matrix[target_row_index]
+                    # Later rows are appended to the target, earlier ones prepended
+                    matrix[target_row_index] = (
+                        _join(target, source)
+                        if rows > target_row_index
+                        else _join(source, target)
+                    )
+
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_merge_rows: {e}")
+
+
+def handle_split_cols(operations, matrix, page_logger):
+    """
+    Split a column into target columns with the capture groups of a regex.
+
+    The pattern is matched once per distinct cell value of the row range and
+    every target column is written with a single assignment.
+
+    Args:
+        operations (list): List containing operation dictionary with 'split_cols' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with source column data split into target columns
+    """
+    try:
+        for split_cols in operations[0]["split_cols"]:
+            start_row, end_row = _row_range(split_cols, matrix)
+            src_idx = split_cols.get("source_col_index")
+            split_logic = split_cols.get("split_logic", "")
+            num_target_cols = split_cols.get("num_target_cols")
+            index_created = split_cols.get("index_created", [])
+            page_logger.info(
+                f"Splitting column {src_idx} with logic '{split_logic}' into columns "
+                f"{index_created} for row range {start_row} to {end_row}"
+            )
+
+            pattern = compile_regex(split_logic)
+            rows = [_position(row, matrix.shape[0]) for row in range(start_row, end_row)]
+
+            for run in _distinct_runs(rows):
+                cells = matrix[run, _position(src_idx, matrix.shape[1])].tolist()
+                for cell in cells:
+                    if not isinstance(cell, (str, bytes)):
+                        raise TypeError("expected string or bytes-like object")
+
+                matches = {cell: pattern.match(cell) for cell in set(cells)}
+                if not all(matches.values()):
+                    # Rows without a match are filled with empty strings
+                    no_match = [""] * num_target_cols
+                groups = [
+                    list(matches[cell].groups()) if matches[cell] else no_match
+                    for cell in cells
+                ]
+
+                for i, destination_id in enumerate(index_created):
+                    selected = [
+                        (row, row_groups[i])
+                        for row, row_groups in zip(run, groups)
+                        if i < len(row_groups)
+                    ]
+                    if selected:
+                        destination = _position(destination_id, matrix.shape[1])
+                        target_rows, values = zip(*selected)
+                        column = np.empty(len(values), dtype=object)
+                        column[:] = values
+                        matrix[list(target_rows), destination] = column
+
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_split_cols: {e}")
+
+
+def handle_insert_column(operations, matrix, page_logger, header):
+    """
+    Insert new columns at specified positions with default values.
+
+    Args:
+        operations (list): List containing operation dictionary with 'insert_column' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+        header (numpy.ndarray): 1D array representing column headers
+
+    Returns:
+        tuple: (updated_matrix, updated_header) with new columns inserted
+    """
+    try:
+        for insert_column in operations[0]["insert_column"]:
+            column_name = insert_column["name"]
+            index = min(insert_column["position"], matrix.shape[1])
+            default_value = insert_column.get("default_value", "")
+            if default_value.lower() == "nan":
+                default_value = ""
+            page_logger.info(
+                f"Inserting column {column_name} at index {index} using default value '{default_value}'"
+            )
+
+            default_col = np.full((matrix.shape[0],), default_value, dtype=object)
+            matrix = np.insert(matrix, index, default_col, axis=1)
+            header = np.insert(header, index, column_name)
+
+        return matrix, header
+
+    except Exception as e:
+        raise Exception(f"Error in handle_insert_column: {e}")
+
+
+def handle_copy_item(operations, matrix, page_logger):
+    """
+    Copy individual cell values from one position to another.
+
+    Args:
+        operations (list): List containing operation dictionary with 'copy_item' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with copied values
+    """
+    try:
+        for copy_item in operations[0]["copy_item"]:
+            from_row = copy_item["from_row"]
+            from_col = copy_item["from_col"]
+            to_row = copy_item["to_row"]
+            to_col = copy_item["to_col"]
+            page_logger.info(
+                f"Copying item from row {from_row} and column {from_col} to row {to_row} and column {to_col}"
+            )
+
+            if not (
+                0 <= from_row < matrix.shape[0]
+                and 0 <= from_col < matrix.shape[1]
+                and 0 <= to_row < matrix.shape[0]
+                and 0 <= to_col < matrix.shape[1]
+            ):
+                raise ValueError("Copy indices out of range")
+            matrix[to_row, to_col] = matrix[from_row, from_col]
+
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_copy_item: {e}")
+
+
+def handle_merge_cols(operations, matrix, page_logger):
+    """
+    Merge source columns into a target column, one whole column per step.
+
+    As in the reference handler, only the parameters of the last operation
+    in the list are applied.
+
+    Args:
+        operations (list): List containing operation dictionary with 'merge_cols' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with merged column values
+    """
+    try:
+        merge_cols_ops = operations[0]["merge_cols"]
+        if not merge_cols_ops:
+            raise ValueError("No merge_cols operation given")
+
+        merge_cols = merge_cols_ops[-1]
+        target_col_index = merge_cols.get("target_col_index")
+        # Same de-duplication, and so the same order, as the reference handler
+        source_col_indices = list(
+            set(
+                i
+                for i in merge_cols.get("source_col_indices", [])
+                if i != target_col_index
+            )
+        )
+        start_row, end_row = _row_range(merge_cols, matrix)
+        page_logger.info(
+            f"Merging columns {source_col_indices} into {target_col_index} within the range of {start_row} to {end_row}"
+        )
+
+        rows = [_position(row, matrix.shape[0]) for row in range(start_row, end_row)]
+        for run in _distinct_runs(rows):
+            for source_col_index in source_col_indices:
+                source = _position(source_col_index, matrix.shape[1])
+                target = _position(target_col_index, matrix.shape[1])
+                if source_col_index < target_col_index:
+                    merged = _join(matrix[run, source], matrix[run, target])
+                else:
+                    merged = _join(matrix[run, target], matrix[run, source])
+                matrix[run, target] = merged
+
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_merge_cols: {e}")
+
+
+def handle_delete_cols(operations, matrix, page_logger):
+    """
+    Delete specified columns from the matrix with a single copy per operation.
+
+    The reference handler deletes the columns one at a time in reverse sorted
+    order, skipping indices beyond the current width. The same deletions are
+    simulated on the column positions and applied in one ``take``.
+
+    Args:
+        operations (list): List containing operation dictionary with 'delete_cols' key
+        matrix (numpy.ndarray): 2D array representing the data table
+        page_logger (Logger): Logger instance for operation tracking
+
+    Returns:
+        numpy.ndarray: Matrix with specified columns removed
+    """
+    try:
+        for delete_cols in operations[0]["delete_cols"]:
+            column_indices = delete_cols.get("col_indices", [])
+            page_logger.info(f"Deleting columns at index {column_indices}")
+
+            kept = np.arange(matrix.shape[1])
+            for col_index in sorted(column_indices, reverse=True):
+                if col_index < len(kept):
+                    if matrix.shape[0] == 0:
+                        raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+                    kept = np.delete(kept, col_index)
+            if len(kept) != matrix.shape[1]:
+                matrix = matrix[:, kept]
+
+        return matrix
+
+    except Exception as e:
+        raise Exception(f"Error in handle_delete_cols: {e}")
+
+
+VECTORIZED_HANDLERS = {
+    "regex_replace": handle_regex_replace,
+    "delete_rows": handle_delete_rows,
+    "map_column": handle_map_column,
+    "merge_rows": handle_merge_rows,
+    "split_cols": handle_split_cols,
+    "insert_column": handle_insert_column,
+    "copy_item": handle_copy_item,
+    "merge_cols": handle_merge_cols,
+    "delete_cols": handle_delete_cols,
+}
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import httpx
+from google import genai
+from google.genai import types
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Model and connection settings per call site; every value can be overridden
+# with GEMINI_<PURPOSE>_<SETTING>, e.g. GEMINI_CLEANING_MODEL or GEMINI_HEADER_TIMEOUT_MS.
+GEMINI_MODELS = {
+    "header": {"model": "gemini-2.0-flash-001", "timeout_ms": 120_000},
+    "cleaning": {"model": "gemini-2.5-flash", "timeout_ms": 600_000},
+}
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY_SECONDS = 120
+
+# Rough stand-in for the Gemini tokenizer: words, single punctuation marks and whitespace runs
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def gemini_model_config(purpose):
+    """
+    Resolve the model configuration of a Gemini call site.
+
+    Args:
+        purpose (str): "header" or "cleaning"
+
+    Returns:
+        dict: model name and request timeout in milliseconds
+    """
+    defaults = GEMINI_MODELS[purpose]
+    prefix = f"GEMINI_{purpose.upper()}"
+    return {
+        "model": os.getenv(f"{prefix}_MODEL", defaults["model"]),
+        "timeout_ms": int(os.getenv(f"{prefix}_TIMEOUT_MS", defaults["timeout_ms"])),
+    }
+
+
+def get_gemini_client(purpose):
+    """
+    Return the process-wide ``genai.Client`` for a call site.
+
+    Clients are created once per API key and timeout and then shared by every
+    page worker and request. The underlying httpx client is thread-safe and
+    keeps connections alive, so pages after the first skip client construction
+    and the TCP/TLS handshake.
+
+    Args:
+        purpose (str): "header" or "cleaning"
+
+    Returns:
+        google.genai.Client: Shared client
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    timeout_ms = gemini_model_config(purpose)["timeout_ms"]
+    key = (api_key, timeout_ms)
+
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(
+                    timeout=timeout_ms,
+                    client_args={
+                        "limits": httpx.Limits(
+                            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                        )
+                    },
+                ),
+            )
+            logger.info(
+                f"[DEBUG] [GEMINI_CLIENT] Created pooled Gemini client for {purpose} "
+                f"(timeout {timeout_ms} ms)"
+            )
+        return _clients[key]
+
+
+def estimate_tokens(text):
+    """
+    Offline estimate of the prompt tokens of a text.
+
+    Only meant for comparing prompt formats with each other; use
+    ``count_tokens`` for the figure Gemini bills.
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def count_tokens(purpose, text):
+    """
+    Count the tokens of a text with the model of a call site.
+
+    Args:
+        purpose (str): "header" or "cleaning"
+        text (str): Prompt text
+
+    Returns:
+        int: Total tokens reported by the Gemini API
+    """
+    response = get_gemini_client(purpose).models.count_tokens(
+        model=gemini_model_config(purpose)["model"], contents=text
+    )
+    return response.total_tokens
@@ -1,10 +1,9 @@
 from typing import List
-from google import genai
 from google.genai import types
 from pydantic import BaseModel
-import os
 import json
-from PIL import Image
+from .client import gemini_model_config, get_gemini_client
+from ...utils.rate_limiter import call_with_backoff, get_rate_limiter
 
 
 class Header(BaseModel):
@@ -42,21 +41,29 @@ def prompt():
     """
 
 
-def extract_header_using_gemini(image, page_logger):
-    client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    model = "gemini-2.0-flash-001"
+def extract_header_using_gemini(image, page_logger, retries=3, retry_budget=None):
+    client = get_gemini_client("header")
+    model = gemini_model_config("header")["model"]
 
-    image = Image.open(image)
-    content = [prompt(), image]
-    page_logger.info(f"content: {content}")
+    # Shares the page's PNG bytes instead of re-reading the image from disk
+    image_part = types.Part.from_bytes(data=image.png_bytes, mime_type="image/png")
+    content = [prompt(), image_part]
+    page_logger.info(f"content: {[prompt(), f'<page {image.page_num} image>']}")
 
-    response = client.models.generate_content(
-        model=model,
-        contents=content,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=Response,
+    response = call_with_backoff(
+        get_rate_limiter("gemini", model),
+        lambda: client.models.generate_content(
+            model=model,
+            contents=content,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=Response,
+            ),
         ),
+        retries=retries,
+        retry_budget=retry_budget,
+        page_logger=page_logger,
+        label=f"Gemini header call ({model})",
     )
 
     response = json.loads(response.text)
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from django.db import connection
+from .page_task import detect_header, set_column_map
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_HEADER_WINDOW = 3
+
+
+def header_window():
+    """Pages tried at once during header search (EXTRACTOR_HEADER_WINDOW)."""
+    try:
+        return max(1, int(os.getenv("EXTRACTOR_HEADER_WINDOW", DEFAULT_HEADER_WINDOW)))
+    except ValueError:
+        logger.warning(
+            "[WARNING] [HEADER_SEARCH] Invalid EXTRACTOR_HEADER_WINDOW, "
+            f"falling back to {DEFAULT_HEADER_WINDOW}"
+        )
+        return DEFAULT_HEADER_WINDOW
+
+
+def find_header_page(job, num_pages, window=None):
+    """
+    Find the first transaction page and set the job's header map from it.
+
+    Header detection runs on ``window`` pages at once. Results are taken in
+    page order, so the earliest valid page always wins; when a page turns out
+    not to be a transaction page the next one is started. Once a winner is
+    known, queued pages are cancelled and running ones stop before their next
+    provider call. Running detections are waited for, so none of them renders
+    or stores tables into the job once the page pipeline has taken over. A
+    page whose detection raises counts as having no header and is recorded in
+    ``job.failed_pages``, so the search moves on to the next page and the
+    result is not cached. A window of 1 reproduces the sequential search.
+
+    Args:
+        job (StatementJob): Statement to search
+        num_pages (int): Number of pages of the statement
+        window (int, optional): Pages tried at once, defaults to ``header_window()``
+
+    Returns:
+        int: The header page, or None when no page holds transactions
+    """
+    window = window or header_window()
+    cancelled = threading.Event()
+    pages = iter(range(1, num_pages + 1))
+    in_flight = {}
+
+    def detect(page_num):
+        try:
+            return detect_header(job, page_num, cancelled)
+        except Exception as e:
+            logger.error(
+                f"[ERROR] [HEADER_SEARCH] Header detection failed for page {page_num}: {e}"
+            )
+            job.failed_pages.add(page_num)
+            return None
+        finally:
+            # The layout index opens a connection per worker thread
+            connection.close()
+
+    def submit_next():
+        page_num = next(pages, None)
+        if page_num is not None:
+            in_flight[page_num] = executor.submit(detect, page_num)
+
+    executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix="header")
+    try:
+        for _ in range(window):
+            submit_next()
+
+        while in_flight:
+            page_num = min(in_flight)
+            header = in_flight.pop(page_num).result()
+            if header:
+                logger.info(
+                    f"[DEBUG] [HEADER_SEARCH] Page {page_num} holds the header, "
+                    f"cancelling pages {sorted(in_flight)}"
+                )
+                set_column_map(job, page_num, header)
+                # Pages before the header are not processed any further
+                for earlier_page in range(1, page_num):
+                    job.page_images.pop(earlier_page, None)
+                    job.page_tables.pop(earlier_page, None)
+                return page_num
+            submit_next()
+        return None
+    finally:
+        # Running detections see the event and stop before their next call;
+        # their rendered pages and tables are then reused by the page pipeline
+        cancelled.set()
+        executor.shutdown(wait=True, cancel_futures=True)
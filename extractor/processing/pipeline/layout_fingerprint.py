@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+from django.db import transaction
+from django.db.models import F
+from ..azure.ocr_tool import column_header_cells
+from ...models import LayoutFingerprint
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Share of the page height hashed as the letterhead
+HEADER_BAND = 0.2
+DEFAULT_MAX_DISTANCE = 10
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of an image.
+
+    Args:
+        image (PIL.Image.Image): Image to hash
+        hash_size (int): Hash width and height in bits
+
+    Returns:
+        str: ``hash_size ** 2`` bit hash as hex
+    """
+    pixels = list(
+        image.convert("L").resize((hash_size + 1, hash_size)).getdata()
+    )
+    bits = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left = pixels[row * (hash_size + 1) + column]
+            right = pixels[row * (hash_size + 1) + column + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(first_hash, second_hash):
+    return bin(int(first_hash, 16) ^ int(second_hash, 16)).count("1")
+
+
+class PageLayout:
+    """Fingerprint of a page: its Azure column headers and a perceptual hash of its letterhead."""
+
+    def __init__(self, header_cells, image_hash):
+        self.header_cells = header_cells
+        self.image_hash = image_hash
+        normalised = [cell.lower() for cell in header_cells]
+        self.header_signature = hashlib.sha256(
+            json.dumps(normalised).encode("utf-8")
+        ).hexdigest()
+
+    @classmethod
+    def from_page(cls, page_image, tables):
+        """
+        Fingerprint a rendered page from its OCR tables.
+
+        Returns:
+            PageLayout: The fingerprint, or None when Azure found no column headers
+        """
+        header_cells = column_header_cells(tables or [])
+        if not header_cells:
+            return None
+        image = page_image.image
+        band = image.crop((0, 0, image.width, int(image.height * HEADER_BAND)))
+        return cls(header_cells, dhash(band))
+
+
+def layout_index_enabled():
+    """Whether known layouts may skip the Gemini header call (LAYOUT_FINGERPRINTS)."""
+    return os.getenv("LAYOUT_FINGERPRINTS", "true").lower() in ("1", "true", "yes")
+
+
+def _max_distance():
+    return int(os.getenv("LAYOUT_FINGERPRINT_MAX_DISTANCE", DEFAULT_MAX_DISTANCE))
+
+
+def _closest(layout):
+    candidates = [
+        (hamming_distance(layout.image_hash, fingerprint.image_hash), fingerprint)
+        for fingerprint in LayoutFingerprint.objects.filter(
+            header_signature=layout.header_signature
+        )
+    ]
+    candidates = [item for item in candidates if item[0] <= _max_distance()]
+    return min(candidates, key=lambda item: item[0])[1] if candidates else None
+
+
+def lookup_layout(layout, page_logger=None):
+    """
+    Find the confirmed header map of a known layout.
+
+    Args:
+        layout (PageLayout): Fingerprint of the page
+        page_logger (Logger, optional): Logger instance for the page
+
+    Returns:
+        list: Header items as returned by Gemini, or None for an unknown layout
+    """
+    page_logger = page_logger or logger
+    fingerprint = _closest(layout)
+    if fingerprint is None:
+        page_logger.info(
+            f"[DEBUG] [LAYOUT] No known layout for headers {layout.header_cells}"
+        )
+        return None
+
+    LayoutFingerprint.objects.filter(pk=fingerprint.pk).update(hits=F("hits") + 1)
+    page_logger.info(
+        f"[DEBUG] [LAYOUT] Matched layout {fingerprint.pk} "
+        f"({fingerprint.bank_name or 'unnamed'}), skipping Gemini header call"
+    )
+    return fingerprint.column_map
+
+
+def record_layout(layout, column_map, page_logger=None):
+    """
+    Store the header map Gemini confirmed for a layout that was not matched.
+
+    Args:
+        layout (PageLayout): Fingerprint of the page
+        column_map (list): Header items as returned by Gemini
+        page_logger (Logger, optional): Logger instance for the page
+    """
+    page_logger = page_logger or logger
+    with transaction.atomic():
+        fingerprint = _closest(layout)
+        if fingerprint is None:
+            fingerprint = LayoutFingerprint.objects.create(
+                header_signature=layout.header_signature,
+                header_cells=layout.header_cells,
+                image_hash=layout.image_hash,
+                column_map=column_map,
+            )
+        else:
+            # Recorded meanwhile by a concurrent job
+            fingerprint.column_map = column_map
+            fingerprint.save(update_fields=["column_map", "updated_at"])
+        LayoutFingerprint.objects.filter(pk=fingerprint.pk).update(
+            misses=F("misses") + 1
+        )
+    page_logger.info(f"[DEBUG] [LAYOUT] Recorded layout {fingerprint.pk}")
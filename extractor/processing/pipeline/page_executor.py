@@ -0,0 +1,19 @@
+import os
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_PAGE_WORKERS = 4
+
+
+def get_page_workers():
+    """Number of pages processed concurrently, configurable via EXTRACTOR_PAGE_WORKERS."""
+    try:
+        return max(1, int(os.getenv("EXTRACTOR_PAGE_WORKERS", DEFAULT_PAGE_WORKERS)))
+    except ValueError:
+        logger.warning(
+            "[WARNING] [PAGE_EXECUTOR] Invalid EXTRACTOR_PAGE_WORKERS, "
+            f"falling back to {DEFAULT_PAGE_WORKERS}"
+        )
+        return DEFAULT_PAGE_WORKERS
+
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def save_artifacts():
+    """
+    Whether intermediate page tables are also written to disk (EXTRACTOR_SAVE_ARTIFACTS).
+
+    When set, the OCR table of every page is saved to ``temp_csv`` and its XML
+    to ``xml`` for debugging; the pipeline itself never reads them back.
+    """
+    return os.getenv("EXTRACTOR_SAVE_ARTIFACTS", "false").lower() in ("1", "true", "yes")
+
+
+class PageTable:
+    """
+    The OCR table of one page, handed from OCR to XML conversion and cleaning in memory.
+
+    Cells are kept as the exact strings OCR produced; missing cells are empty
+    strings. Unlike a round trip through ``pd.read_csv`` nothing is coerced to
+    float or NaN, so "0012" or "3.50" reach the cleaning stage unchanged.
+    """
+
+    def __init__(self, page_num, rows):
+        self.page_num = page_num
+        self.rows = rows
+
+    @classmethod
+    def from_dataframe(cls, page_num, df):
+        """Build the table from the DataFrame produced by ``tables_to_dataframe``."""
+        rows = [
+            ["" if value is None or value != value else str(value) for value in row]
+            for row in df.itertuples(index=False, name=None)
+        ]
+        return cls(page_num, rows)
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.rows[0]) if self.rows else 0
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows)
+
+    def to_matrix(self):
+        """2D object array of the cells, as used by the cleaning operations."""
+        matrix = np.empty(self.shape, dtype=object)
+        for row_index, row in enumerate(self.rows):
+            matrix[row_index, :] = row
+        return matrix
+
+    def save_csv(self, path):
+        """Write the table in the format of the former temp CSV."""
+        self.to_dataframe().to_csv(path, index=False)
+        return path
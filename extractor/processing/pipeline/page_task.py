@@ -0,0 +1,479 @@
+from functools import partial
+from ..azure.local_header import (
+    detect_header_locally,
+    local_header_mode,
+    local_headers_enabled,
+    min_confidence,
+)
+from ..azure.ocr_tool import AzureAgent, ChunkedDocumentOcr, ocr_mode
+from ..gemini.cleaning.gemini_response import GeminiAgent
+from ..gemini.extract_header import extract_header_using_gemini
+from ..gemini.cleaning.clean_using_response import (
+    NoTransactionsError,
+    process_gemini_response,
+)
+from ..gemini.cleaning.operation_trace import operation_trace_mode
+from ..gemini.cleaning.validate_program import reprompt_attempts, validate_program
+from ..post.table_encoding import EXTENSIONS, encode_table, table_encoding
+from ..pre.classify_page import PageClassifier
+from ..pre.page_image import PageImage, save_page_images
+from ..pre.render_pdf import iter_rendered_pages, render_page_range
+from ..pre.text_layer import TextLayer, text_layer_enabled
+from .layout_fingerprint import (
+    PageLayout,
+    layout_index_enabled,
+    lookup_layout,
+    record_layout,
+)
+from .page_executor import get_page_workers
+from .page_table import PageTable, save_artifacts
+from .staged_pipeline import Stage, StagedPipeline, completed_future, then
+from ...utils.logger import get_logger, setup_logging_for_each_page
+from ...utils.rate_limiter import RetryBudget
+
+logger = get_logger(__name__)
+
+
+class StatementJob:
+    """
+    State of a single statement shared by all of its page workers.
+
+    Holds the uploaded PDF, the working directories created by ``create_dirs``,
+    the retry budget shared by every provider call of the statement and the
+    header map detected on the first transaction page. The header map is
+    written once before any page worker starts and is only read afterwards.
+    Tables OCR'd during header detection are kept for the page pipeline, and
+    the page classifier keeps the label of every page it has looked at. The
+    operation trace mode and the table encoding apply to the cleaning of
+    every page of the job.
+    Pages whose OCR or cleaning failed are collected in ``failed_pages``;
+    pages without transactions are not failures.
+    """
+
+    def __init__(
+        self,
+        pdf_path,
+        storage_dir,
+        image_dir,
+        temp_csv_dir,
+        xml_dir,
+        extracted_data_dir,
+        operation_trace=None,
+        encoding=None,
+    ):
+        self.pdf_path = pdf_path
+        self.storage_dir = storage_dir
+        self.image_dir = image_dir
+        self.temp_csv_dir = temp_csv_dir
+        self.xml_dir = xml_dir
+        self.extracted_data_dir = extracted_data_dir
+        self.column_map = []
+        self.column_map_with_index = {}
+        self.page_images = {}
+        self.page_tables = {}
+        self.failed_pages = set()
+        self.retry_budget = RetryBudget()
+        self.azure_agent = AzureAgent(retry_budget=self.retry_budget)
+        self.text_layer = TextLayer(pdf_path)
+        self.page_classifier = PageClassifier(self.text_layer)
+        # Trace mode of the cleaning operations of every page ("diff", "full" or "off")
+        self.operation_trace = operation_trace or operation_trace_mode()
+        # Encoding of the raw table in the cleaning prompt ("xml", "tsv" or "json")
+        self.encoding = encoding or table_encoding()
+
+    def page_logger(self, page_num):
+        return setup_logging_for_each_page(self.storage_dir, page_num)
+
+    def temp_path(self, page_num):
+        return f"{self.temp_csv_dir}/page_{page_num}.csv"
+
+    def table_path(self, page_num, encoding="xml"):
+        return f"{self.xml_dir}/page_{page_num}.{EXTENSIONS[encoding]}"
+
+    def extracted_data_path(self, page_num):
+        return f"{self.extracted_data_dir}/page_{page_num}.csv"
+
+
+def render_range_in_memory(job, pdf_path, first_page, last_page):
+    """
+    Render a page range of the uploaded PDF into in-memory page images.
+
+    The PNGs are only written to ``image_dir`` when EXTRACTOR_SAVE_PAGE_IMAGES is set.
+
+    Returns:
+        dict: page number -> PageImage
+    """
+    page_images = {}
+    for page_num, image in render_page_range(pdf_path, first_page, last_page).items():
+        page_image = PageImage(page_num, image)
+        if save_page_images():
+            page_image.save(f"{job.image_dir}/page_{page_num}.png")
+        page_images[page_num] = page_image
+    return page_images
+
+
+def render_page(job, page_num):
+    """
+    Render a single page of the uploaded PDF, keeping it for the page pipeline.
+
+    Returns:
+        PageImage: The rendered page
+    """
+    if page_num not in job.page_images:
+        job.page_images.update(
+            render_range_in_memory(job, job.pdf_path, page_num, page_num)
+        )
+    return job.page_images[page_num]
+
+
+def iter_page_images(job, page_numbers):
+    """
+    Yield ``(page_num, PageImage)`` for the given pages, rendering missing ones in parallel ranges.
+
+    Pages already rendered during header detection are handed over and
+    released from the job, so only pages in flight are held in memory.
+    """
+    to_render = [
+        page_num for page_num in page_numbers if page_num not in job.page_images
+    ]
+    for page_num in page_numbers:
+        if page_num in job.page_images:
+            yield page_num, job.page_images.pop(page_num)
+    yield from iter_rendered_pages(
+        job.pdf_path, to_render, render_range=partial(render_range_in_memory, job)
+    )
+
+
+def detect_header(job, page_num, cancelled=None):
+    """
+    Try to extract the statement headers from a page.
+
+    The job's header map is not changed, so several pages can be tried at
+    once; the caller applies the winner with ``set_column_map``.
+
+    Args:
+        job (StatementJob): Statement the page belongs to
+        page_num (int): 1-based page number
+        cancelled (threading.Event, optional): Set once an earlier page has won,
+            checked before every provider call
+
+    Returns:
+        list: Header items as returned by Gemini, or None when the page is not a
+        transaction page or the search was cancelled
+    """
+    page_logger = job.page_logger(page_num)
+    page_logger.info(f"Starting header detection for page {page_num}")
+
+    def is_cancelled():
+        if cancelled is not None and cancelled.is_set():
+            page_logger.info(f"Header detection for page {page_num} cancelled")
+            return True
+        return False
+
+    # Cover pages and terms are recognised from the text layer without any call
+    if job.page_classifier.should_skip(page_num, page_logger=page_logger):
+        return None
+    if is_cancelled():
+        return None
+    page_image = render_page(job, page_num)
+
+    tables = None
+    if layout_index_enabled() or local_header_mode() != "off":
+        if is_cancelled():
+            return None
+        tables = read_page_tables(
+            job, job.azure_agent, page_num, page_image, page_logger
+        )
+        if tables is not None:
+            if job.page_classifier.should_skip(page_num, tables, page_logger):
+                return None
+            job.page_tables[page_num] = tables
+
+    # Statements from a known bank layout reuse its confirmed header map
+    layout = None
+    if tables is not None and layout_index_enabled():
+        layout = PageLayout.from_page(page_image, tables)
+    if layout is not None:
+        header = lookup_layout(layout, page_logger)
+        if header is not None:
+            return header
+
+    # Azure's own header cells are enough when they clearly name a transaction
+    # table; in shadow mode they are only compared with Gemini's header
+    local_header = None
+    if tables is not None and local_header_mode() != "off":
+        header, confidence = detect_header_locally(tables, page_logger)
+        if header and confidence >= min_confidence():
+            if local_headers_enabled():
+                page_logger.info(
+                    f"Header read locally with confidence {confidence}, skipping Gemini"
+                )
+                return header
+            local_header = [item["headers"] for item in header]
+
+    if is_cancelled():
+        return None
+
+    # Extract headers using Gemini
+    header, is_valid_page = extract_header_using_gemini(
+        image=page_image, page_logger=page_logger, retry_budget=job.retry_budget
+    )
+    page_logger.info(f"header: {header}")
+    if local_header is not None:
+        gemini_header = [item["headers"] for item in header] if is_valid_page else []
+        page_logger.info(
+            f"[DEBUG] [LOCAL_HEADER] Would skip Gemini with {local_header}, "
+            f"Gemini returned {gemini_header}, "
+            f"{'match' if local_header == gemini_header else 'mismatch'}"
+        )
+
+    if not is_valid_page:
+        page_logger.info(f"Page {page_num} is not a valid page, skipping.")
+        return None
+    if layout is not None:
+        record_layout(layout, header, page_logger)
+    return header
+
+
+def set_column_map(job, page_num, header):
+    """Set the job's header map from header items as returned by Gemini."""
+    job.page_classifier.confirm(page_num, "header page")
+    # Dict mapping index to header
+    job.column_map_with_index = {item["index"]: item["headers"] for item in header}
+    # List of headers
+    job.column_map = [item["headers"] for item in header]
+    job.page_logger(page_num).info(f"column_map: {job.column_map}")
+
+
+def filter_pages(job, page_numbers):
+    """
+    Drop pages whose text layer shows they hold no transactions.
+
+    Returns:
+        list: Pages that go through rendering, OCR and cleaning
+    """
+    return [
+        page_num
+        for page_num in page_numbers
+        if not job.page_classifier.should_skip(page_num, page_logger=logger)
+    ]
+
+
+def submit_page_tables(job, agent, page_num, page_image, page_logger):
+    """
+    Start reading the tables of one page, from the PDF text layer when
+    EXTRACTOR_TEXT_LAYER is set and the page has a usable one, otherwise
+    from Azure OCR.
+
+    Returns:
+        concurrent.futures.Future: Resolves to tables in the format of
+        ``compact_tables``, or None if OCR failed
+    """
+    if text_layer_enabled():
+        tables = job.text_layer.page_tables(page_num, page_logger)
+        if tables is not None:
+            return completed_future(tables)
+    if isinstance(agent, ChunkedDocumentOcr):
+        # Chunks are read from the PDF, so the page is never encoded for OCR
+        return agent.submit_page_tables(page_num, page_logger=page_logger)
+    return agent.submit_page_tables(
+        page_num, page_image.png_bytes, page_logger=page_logger
+    )
+
+
+def read_page_tables(job, agent, page_num, page_image, page_logger):
+    """
+    Tables of one page, waiting for ``submit_page_tables``.
+
+    Returns:
+        list: Tables in the format of ``compact_tables``, or None if OCR failed
+    """
+    return submit_page_tables(job, agent, page_num, page_image, page_logger).result()
+
+
+def ocr_page(job, agent, page_num, page_image):
+    """
+    Start OCR of one rendered page with a shared ``AzureAgent`` or ``ChunkedDocumentOcr``.
+
+    With the async backend the analysis runs on the event loop and a future
+    is returned at once, so the OCR stage only needs a few threads.
+
+    Returns:
+        tuple: (PageImage, tables) for ``build_page_table``, or a Future of it;
+        tables are None if OCR failed
+    """
+    # Pages OCR'd during header detection are not sent again
+    tables = job.page_tables.pop(page_num, None)
+    if tables is not None:
+        return page_image, tables
+    future = submit_page_tables(
+        job, agent, page_num, page_image, job.page_logger(page_num)
+    )
+    if future.done():
+        return page_image, future.result()
+    return then(future, lambda tables: (page_image, tables))
+
+
+def build_page_table(job, page_num, ocr_result):
+    """
+    Turn the OCR tables of one page into its PageTable.
+
+    Pages whose tables show they hold no transactions stop here, before cleaning.
+    The page table is handed to the cleaning stage in memory and only saved to
+    ``temp_csv`` when EXTRACTOR_SAVE_ARTIFACTS is set.
+
+    Returns:
+        tuple: (PageImage, PageTable) for the cleaning stage, or None if OCR failed
+    """
+    page_image, tables = ocr_result
+    page_logger = job.page_logger(page_num)
+    if tables is None:
+        job.failed_pages.add(page_num)
+        return None
+    if job.page_classifier.should_skip(page_num, tables, page_logger):
+        return None
+
+    temp_path = job.temp_path(page_num) if save_artifacts() else None
+    df = job.azure_agent.build_page_dataframe(page_num, tables, temp_path, page_logger)
+    if df is None:
+        return None
+    return page_image, PageTable.from_dataframe(page_num, df)
+
+
+def build_page_pipeline(job, page_numbers):
+    """
+    Build the OCR -> table -> clean pipeline for the pages after header detection.
+
+    It is fed by ``iter_page_images``, which renders page ranges in parallel
+    while earlier pages are in OCR and cleaning. OCR and cleaning wait on the
+    network, so each stage gets its own pool and the stages overlap across pages.
+    With AZURE_OCR_BACKEND=async the OCR stage only submits analyses; up to
+    ``max_in_flight`` of them are awaited on the event loop instead of by a
+    thread each.
+
+    With AZURE_OCR_MODE=chunked every chunk of the PDF is submitted while the
+    pipeline is built, and the OCR stage reads pages from those analyses
+    instead of sending every page image to Azure.
+
+    Args:
+        job (StatementJob): Statement the pages belong to
+        page_numbers (list): Pages that will be fed to the pipeline
+
+    Returns:
+        StagedPipeline: Pipeline taking ``(page_num, PageImage)`` items
+    """
+    agent = job.azure_agent
+    ocr = agent
+    if ocr_mode() == "chunked":
+        # Pages OCR'd during header detection or read from the text layer are
+        # not part of any chunk
+        ocr_pages = []
+        for page_num in page_numbers:
+            if page_num not in job.page_tables and text_layer_enabled():
+                tables = job.text_layer.page_tables(page_num, job.page_logger(page_num))
+                if tables is not None:
+                    job.page_tables[page_num] = tables
+            if page_num not in job.page_tables:
+                ocr_pages.append(page_num)
+        ocr = ChunkedDocumentOcr(agent, job.pdf_path, ocr_pages)
+    return StagedPipeline(
+        [
+            Stage(
+                "ocr",
+                partial(ocr_page, job, ocr),
+                workers=agent.max_workers,
+                max_pending=agent.max_in_flight,
+            ),
+            Stage("table", partial(build_page_table, job), workers=2),
+            Stage("clean", partial(process_page, job), workers=get_page_workers()),
+        ]
+    )
+
+
+def process_page(job, page_num, ocr_result):
+    """
+    Run table encoding and Gemini cleaning for one OCR'd page.
+
+    Pages are independent once the header map is known, so this is the last
+    stage of the page pipeline.
+
+    Args:
+        job (StatementJob): Statement the page belongs to
+        page_num (int): 1-based page number
+        ocr_result (tuple): Rendered page and its PageTable
+
+    Returns:
+        str: Path to the cleaned per-page CSV, or None if the page was skipped
+    """
+    page_logger = job.page_logger(page_num)
+    page_logger.info(f"Starting processing for page {page_num}")
+
+    page_image, page_table = ocr_result
+
+    if not page_table.rows:
+        page_logger.warning(f"No table rows found for page {page_num}, skipping.")
+        return None
+
+    page_logger.info(f"[DEBUG] page table shape: {page_table.shape}")
+
+    encoding = job.encoding
+    page_logger.info(f"Converting to {encoding.upper()} format")
+    # Encode the page table for the cleaning prompt
+    table_data = encode_table(page_table.rows, encoding)
+    if save_artifacts():
+        with open(job.table_path(page_num, encoding), "w", encoding="utf-8") as f:
+            f.write(table_data)
+    page_logger.info(f"{encoding}_data:\n {table_data}")
+
+    # Call Gemini agent for data cleaning
+    page_logger.info("Calling Gemini agent for data cleaning")
+    gemini_agent = GeminiAgent(retry_budget=job.retry_budget)
+    json_response = gemini_agent.call_gemini(
+        image=page_image,
+        xml_output=table_data,
+        headers=job.column_map_with_index,
+        page_logger=page_logger,
+        encoding=encoding,
+    )
+
+    # Broken programs are answered with their errors instead of losing the page
+    for attempt in range(reprompt_attempts()):
+        validation = validate_program(json_response, page_table.shape)
+        if validation.ok:
+            break
+        page_logger.warning(
+            f"[DEBUG] [PROGRAM_CHECK] Operations rejected for page {page_num}, "
+            f"re-prompting (attempt {attempt + 1}): "
+            f"{[error.as_dict() for error in validation.errors]}"
+        )
+        json_response = gemini_agent.call_gemini(
+            image=page_image,
+            xml_output=table_data,
+            headers=job.column_map_with_index,
+            page_logger=page_logger,
+            encoding=encoding,
+            feedback=validation.feedback(),
+        )
+
+    # Process Gemini response
+    extracted_data_path = job.extracted_data_path(page_num)
+    page_logger.info("Processing Gemini response")
+    try:
+        process_gemini_response(
+            json_response,
+            page_table,
+            extracted_data_path,
+            page_logger,
+            trace=job.operation_trace,
+        )
+    except NoTransactionsError as e:
+        page_logger.info(f"No transactions on page {page_num}: {e}")
+        return None
+    except Exception as e:
+        page_logger.error(f"Error in process_gemini_response: {e}")
+        job.failed_pages.add(page_num)
+        return None
+
+    gemini_agent.cache_response(json_response)
+    page_logger.info(f"Completed processing for page {page_num}")
+    return extracted_data_path
@@ -0,0 +1,291 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Marks the end of a stage's input; each worker consumes exactly one
+_DONE = object()
+
+
+def stage_setting(stage_name, setting, default):
+    """Read EXTRACTOR_<STAGE>_<SETTING> from the environment, e.g. EXTRACTOR_OCR_WORKERS."""
+    value = os.getenv(f"EXTRACTOR_{stage_name.upper()}_{setting.upper()}")
+    try:
+        return max(1, int(value)) if value else default
+    except ValueError:
+        logger.warning(
+            f"[WARNING] [STAGED_PIPELINE] Invalid value {value!r} for "
+            f"{stage_name} {setting}, using {default}"
+        )
+        return default
+
+
+def completed_future(result):
+    """A future that is already done with ``result``."""
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def then(future, fn):
+    """
+    Future of ``fn(future.result())``.
+
+    ``fn`` runs in the thread that completes ``future``, so it must be cheap.
+    """
+    chained = Future()
+
+    def done(future):
+        try:
+            chained.set_result(fn(future.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
+
+
+class Stage:
+    """
+    One step of a ``StagedPipeline``.
+
+    ``task(page_num, payload)`` is run by ``workers`` threads reading from a
+    bounded input queue of ``queue_size`` items. Its return value is the
+    payload of the next stage; returning None drops the page. A task may also
+    return a ``concurrent.futures.Future`` for work running elsewhere (e.g. on
+    an event loop): the worker moves on to the next page at once, and the
+    stage's collector thread forwards the result once the future is done. At
+    most ``max_pending`` such futures are outstanding per stage. The sizes can
+    be overridden per stage through EXTRACTOR_<STAGE>_WORKERS,
+    EXTRACTOR_<STAGE>_QUEUE_SIZE and EXTRACTOR_<STAGE>_MAX_PENDING.
+    """
+
+    def __init__(self, name, task, workers=1, queue_size=None, max_pending=None):
+        self.name = name
+        self.task = task
+        self.workers = stage_setting(name, "workers", workers)
+        self.queue_size = stage_setting(
+            name, "queue_size", queue_size or 2 * self.workers
+        )
+        self.max_pending = stage_setting(
+            name, "max_pending", max_pending or self.queue_size
+        )
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.peak_depth = 0
+        self.peak_pending = 0
+        self.busy_seconds = 0.0
+        self._finished_workers = 0
+        self._pending = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # Finished futures, put by their callbacks; unbounded so a callback never blocks
+        self._completed = queue.SimpleQueue()
+        self._lock = threading.Lock()
+
+    def depth(self):
+        return self.queue.qsize()
+
+
+class StagedPipeline:
+    """
+    Producer/consumer pipeline where every stage has its own pool and queue.
+
+    Pages stream through the stages independently, so page N+1 can render
+    while page N is in OCR and page N-1 is being cleaned. Queues are bounded,
+    so a slow stage blocks the stages feeding it (backpressure) and at most
+    ``queue_size + workers`` pages are in flight per stage, whatever the
+    length of the statement.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.results = {}
+        # page number -> name of the stage that raised for it
+        self.errors = {}
+        self._results_lock = threading.Lock()
+
+    def queue_depths(self):
+        """Current number of pages waiting in front of each stage."""
+        return {stage.name: stage.depth() for stage in self.stages}
+
+    def stats(self):
+        """Per-stage counters used to tune worker and queue sizes."""
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "queue_size": stage.queue_size,
+                "depth": stage.depth(),
+                "peak_depth": stage.peak_depth,
+                "peak_pending": stage.peak_pending,
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_seconds": round(stage.busy_seconds, 3),
+            }
+            for stage in self.stages
+        }
+
+    def _put(self, index, item):
+        stage = self.stages[index]
+        stage.queue.put(item)
+        with stage._lock:
+            stage.peak_depth = max(stage.peak_depth, stage.depth())
+
+    def _emit(self, index, page_num, payload):
+        if index + 1 < len(self.stages):
+            self._put(index + 1, (page_num, payload))
+        else:
+            with self._results_lock:
+                self.results[page_num] = payload
+
+    def _drop(self, page_num):
+        with self._results_lock:
+            self.results[page_num] = None
+
+    def _close(self, index):
+        """Signal the end of input to the stage after ``index``."""
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self._put(index + 1, _DONE)
+
+    def _finish(self, index, page_num, result, failed=False):
+        stage = self.stages[index]
+        if failed:
+            with self._results_lock:
+                self.errors[page_num] = stage.name
+            result = None
+
+        with stage._lock:
+            if result is None:
+                stage.failed += 1
+            else:
+                stage.processed += 1
+
+        if result is None:
+            self._drop(page_num)
+        else:
+            self._emit(index, page_num, result)
+
+        logger.info(
+            f"[DEBUG] [STAGED_PIPELINE] Page {page_num} left {stage.name}, "
+            f"queue depths: {self.queue_depths()}"
+        )
+
+    def _collector(self, index):
+        """Forward the results of a stage's futures in the order they finish."""
+        stage = self.stages[index]
+        while True:
+            item = stage._completed.get()
+            if item is _DONE:
+                self._close(index)
+                return
+            page_num, future = item
+            stage._slots.release()
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(
+                    f"[ERROR] [STAGED_PIPELINE] Stage {stage.name} failed for page {page_num}: {e}"
+                )
+                self._finish(index, page_num, None, failed=True)
+            else:
+                self._finish(index, page_num, result)
+
+    def _settle(self, stage, item=None):
+        """Queue a finished future and close the collector once nothing is left."""
+        with stage._lock:
+            if item is not None:
+                stage._completed.put(item)
+                stage._pending -= 1
+            if stage._finished_workers == stage.workers and stage._pending == 0:
+                stage._completed.put(_DONE)
+
+    def _future_done(self, stage, page_num, future):
+        # Runs in whichever thread finished the future, so it must not block
+        self._settle(stage, (page_num, future))
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        while True:
+            item = stage.queue.get()
+            if item is _DONE:
+                with stage._lock:
+                    stage._finished_workers += 1
+                # The collector closes the next stage once the last worker is
+                # done and every future has been forwarded
+                self._settle(stage)
+                return
+
+            page_num, payload = item
+            stage._slots.acquire()
+            started = time.monotonic()
+            try:
+                result = stage.task(page_num, payload)
+            except Exception as e:
+                logger.error(
+                    f"[ERROR] [STAGED_PIPELINE] Stage {stage.name} failed for page {page_num}: {e}"
+                )
+                result, failed = None, True
+            else:
+                failed = False
+            elapsed = time.monotonic() - started
+
+            with stage._lock:
+                stage.busy_seconds += elapsed
+
+            if isinstance(result, Future):
+                with stage._lock:
+                    stage._pending += 1
+                    stage.peak_pending = max(stage.peak_pending, stage._pending)
+                result.add_done_callback(partial(self._future_done, stage, page_num))
+            else:
+                stage._slots.release()
+                self._finish(index, page_num, result, failed)
+
+    def run(self, items):
+        """
+        Stream ``(page_num, payload)`` items through every stage.
+
+        Args:
+            items (iterable): Pairs of page number and first-stage payload
+
+        Returns:
+            dict: page number -> last stage result (None for dropped pages), in page order
+        """
+        threads = [
+            threading.Thread(
+                target=self._worker,
+                args=(index,),
+                name=f"{stage.name}-{worker}",
+                daemon=True,
+            )
+            for index, stage in enumerate(self.stages)
+            for worker in range(stage.workers)
+        ] + [
+            threading.Thread(
+                target=self._collector,
+                args=(index,),
+                name=f"{stage.name}-collector",
+                daemon=True,
+            )
+            for index, stage in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Blocks whenever the first queue is full
+        for item in items:
+            self._put(0, item)
+        for _ in range(self.stages[0].workers):
+            self._put(0, _DONE)
+
+        for thread in threads:
+            thread.join()
+
+        logger.info(f"[DEBUG] [STAGED_PIPELINE] Stage stats: {self.stats()}")
+        return {page_num: self.results[page_num] for page_num in sorted(self.results)}
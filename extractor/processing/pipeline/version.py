@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+from ..azure.local_header import local_headers_enabled, min_confidence
+from ..azure.ocr_tool import AZURE_MODEL_ID, ocr_mode
+from ..gemini.client import gemini_model_config
+from ..gemini.extract_header import Response, prompt as header_prompt
+from ..gemini.cleaning.create_pydantic_model import DynamicModel
+from ..gemini.cleaning.gemini_response import (
+    GENERATION_SETTINGS,
+    feedback_section,
+    prompt as cleaning_prompt,
+)
+from ..post.handle_csv_to_xml import compact_xml
+from ..post.table_encoding import table_encoding
+from ..pre.classify_page import page_filter_mode
+from ..pre.text_layer import text_layer_enabled
+from .layout_fingerprint import layout_index_enabled
+
+
+def content_hash(clean_bytes):
+    """SHA-256 of the uploaded PDF after junk before ``%PDF-`` has been trimmed."""
+    return hashlib.sha256(clean_bytes).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _pipeline_fingerprint(
+    header_model,
+    cleaning_model,
+    encoding,
+    xml_compact,
+    revision,
+    azure_ocr_mode,
+    text_layer,
+    page_filter,
+    local_header_confidence,
+    layout_index,
+):
+    settings = {
+        "azure_model": AZURE_MODEL_ID,
+        "ocr_mode": azure_ocr_mode,
+        "text_layer": text_layer,
+        "page_filter": page_filter,
+        # None when headers always come from Gemini
+        "local_header_confidence": local_header_confidence,
+        # Header maps of known layouts are reused instead of asking Gemini
+        "layout_index": layout_index,
+        "header_model": header_model,
+        "header_prompt": header_prompt(),
+        "header_schema": Response.model_json_schema(),
+        "cleaning_model": cleaning_model,
+        # Rendered with placeholders so only the template itself is hashed
+        "cleaning_prompt": cleaning_prompt("{target_schema}", "{xml_output}", encoding),
+        "cleaning_feedback": feedback_section("{feedback}"),
+        "cleaning_schema": DynamicModel.model_json_schema(),
+        "generation": GENERATION_SETTINGS,
+        "table_encoding": encoding,
+        "xml_compact": xml_compact,
+        "revision": revision,
+    }
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def pipeline_version(encoding=None):
+    """
+    Identify the prompts, schemas and models a statement is processed with.
+
+    Stored next to the content hash of every extraction; a cached result is
+    only reused while this value is unchanged, so editing a prompt, switching
+    a model or changing how tables are read (OCR mode, text layer, page
+    filter, local headers, layout index) invalidates earlier results.
+    EXTRACTOR_PIPELINE_REVISION can be bumped to invalidate them for changes
+    that are not covered here.
+
+    Args:
+        encoding (str, optional): Table encoding of the run, defaults to ``table_encoding()``
+
+    Returns:
+        str: Short hex digest
+    """
+    return _pipeline_fingerprint(
+        gemini_model_config("header")["model"],
+        gemini_model_config("cleaning")["model"],
+        encoding or table_encoding(),
+        compact_xml(),
+        os.getenv("EXTRACTOR_PIPELINE_REVISION", ""),
+        ocr_mode(),
+        text_layer_enabled(),
+        page_filter_mode(),
+        min_confidence() if local_headers_enabled() else None,
+        layout_index_enabled(),
+    )
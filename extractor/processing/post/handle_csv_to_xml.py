@@ -2,6 +2,15 @@ import pandas as pd
 import xml.etree.ElementTree as ET
 from xml.dom import minidom
 import os
+import re
+
+# Characters XML 1.0 cannot represent; minidom fails to parse a document containing them
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+
+def compact_xml():
+    """Whether the table XML sent to Gemini omits indentation (EXTRACTOR_XML_COMPACT)."""
+    return os.getenv("EXTRACTOR_XML_COMPACT", "false").lower() in ("1", "true", "yes")
 
 
 def file_to_xml(file_path):
@@ -30,6 +39,30 @@ def file_to_xml(file_path):
             print("Error: Unsupported file format. Please upload a .csv or .xlsx file.")
             return None
 
+        return dataframe_to_xml(df)
+
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}")
+        return None
+    except pd.errors.EmptyDataError:
+        print("Error: The uploaded file is empty.")
+        return None
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return None
+
+
+def dataframe_to_xml(df):
+    """
+    Converts a DataFrame to the XML string sent to Gemini.
+
+    Args:
+        df (pandas.DataFrame): Table to convert
+
+    Returns:
+        str: A pretty-printed XML string, or None if an error occurs.
+    """
+    try:
         # Create the root element for the XML
         table_element = ET.Element("table")
         rows_element = ET.SubElement(table_element, "rows")
@@ -56,17 +89,65 @@ def file_to_xml(file_path):
 
         return pretty_xml_str
 
-    except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
-        return None
-    except pd.errors.EmptyDataError:
-        print("Error: The uploaded file is empty.")
-        return None
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return None
 
 
+def _escape_text(value):
+    # What the ElementTree -> minidom round trip does to a text node: the parser
+    # normalises line endings and minidom escapes &, <, > and double quotes
+    value = INVALID_XML_CHARS.sub("", value)
+    value = value.replace("\r\n", "\n").replace("\r", "\n")
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+def table_to_xml(rows, compact=False):
+    """
+    Serialize table rows to the XML sent to Gemini in a single pass.
+
+    Produces the same document as ``dataframe_to_xml`` without building an
+    ElementTree and re-parsing it through minidom. Characters XML cannot hold
+    are dropped instead of failing the whole page.
+
+    Args:
+        rows (list): Rows of cell strings, e.g. ``PageTable.rows``
+        compact (bool): Leave out the indentation and line breaks
+
+    Returns:
+        str: XML string
+    """
+    indent, newline = ("", "") if compact else ("  ", "\n")
+    row_indent, col_indent = indent * 2, indent * 3
+    parts = ['<?xml version="1.0" ?>', newline, "<table>", newline]
+
+    if not rows:
+        parts += [indent, "<rows/>", newline]
+    else:
+        parts += [indent, "<rows>", newline]
+        for r_idx, row in enumerate(rows):
+            if not row:
+                parts += [row_indent, f"<row_{r_idx}/>", newline]
+                continue
+            parts += [row_indent, f"<row_{r_idx}>", newline]
+            for c_idx, value in enumerate(row):
+                text = _escape_text(value) if value else ""
+                if text:
+                    parts.append(f"{col_indent}<col_{c_idx}>{text}</col_{c_idx}>{newline}")
+                else:
+                    parts.append(f"{col_indent}<col_{c_idx}/>{newline}")
+            parts += [row_indent, f"</row_{r_idx}>", newline]
+        parts += [indent, "</rows>", newline]
+
+    parts += ["</table>", newline]
+    return "".join(parts)
+
+
 def run_file_to_xml_converter(file_path, xml_dir):
     """
     Main function to handle file upload, conversion, and download in Colab.
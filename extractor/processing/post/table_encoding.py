@@ -0,0 +1,80 @@
+import json
+import os
+from .handle_csv_to_xml import compact_xml, table_to_xml
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ENCODINGS = ("xml", "tsv", "json")
+# File extension of the saved artifact per encoding
+EXTENSIONS = {"xml": "xml", "tsv": "tsv", "json": "json"}
+
+
+def table_encoding():
+    """
+    Encoding of the raw table in the cleaning prompt (EXTRACTOR_TABLE_ENCODING).
+
+    "xml" (default) is the original format; "tsv" and "json" carry the same
+    cells with far fewer tokens. Unknown values fall back to "xml".
+    """
+    encoding = os.getenv("EXTRACTOR_TABLE_ENCODING", "xml").lower()
+    if encoding not in ENCODINGS:
+        logger.warning(
+            f"[WARNING] [TABLE_ENCODING] Unknown encoding {encoding!r}, using xml"
+        )
+        return "xml"
+    return encoding
+
+
+def _escape_tsv(value):
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\r\n", "\\n")
+        .replace("\r", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def table_to_tsv(rows):
+    """
+    Tab-separated table with a leading row index column.
+
+    The first line names the columns ``col_0``, ``col_1``, ... and every
+    following line starts with the 0-based row index, so indices read exactly
+    as in the XML. Tabs, line breaks and backslashes inside cells are escaped
+    as ``\\t``, ``\\n`` and ``\\\\``.
+    """
+    width = max((len(row) for row in rows), default=0)
+    lines = ["\t".join(["row"] + [f"col_{c_idx}" for c_idx in range(width)])]
+    for r_idx, row in enumerate(rows):
+        lines.append("\t".join([str(r_idx)] + [_escape_tsv(value) for value in row]))
+    return "\n".join(lines) + "\n"
+
+
+def table_to_json(rows):
+    """JSON array with one array of cells per row, one row per line."""
+    return (
+        "[\n"
+        + ",\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        + "\n]\n"
+    )
+
+
+def encode_table(rows, encoding=None):
+    """
+    Encode table rows for the cleaning prompt.
+
+    Args:
+        rows (list): Rows of cell strings, e.g. ``PageTable.rows``
+        encoding (str, optional): One of ``ENCODINGS``, defaults to ``table_encoding()``
+
+    Returns:
+        str: Encoded table
+    """
+    encoding = encoding or table_encoding()
+    if encoding == "tsv":
+        return table_to_tsv(rows)
+    if encoding == "json":
+        return table_to_json(rows)
+    return table_to_xml(rows, compact=compact_xml())
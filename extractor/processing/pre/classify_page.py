@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRANSACTION = "transaction"
+NON_TRANSACTION = "non-transaction"
+UNCERTAIN = "uncertain"
+
+# Fewer extracted characters than this means the page has no usable text layer
+MIN_TEXT_LAYER_CHARS = 50
+MIN_TRANSACTION_ROWS = 3
+
+DATE_PATTERN = re.compile(
+    r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}"
+    r"|\d{4}-\d{2}-\d{2}"
+    r"|\d{1,2}[ -]?(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*(?:[ -,]*\d{2,4})?)\b",
+    re.IGNORECASE,
+)
+# Amounts in any notation: 1,234.56, 1.234,56, 1 234,56, 1234.5, 12,50 or a
+# whole number of three or more digits
+AMOUNT_PATTERN = re.compile(
+    r"(?<![\d.,])(?:\d{1,3}(?:[,.' \u00a0]\d{3})+(?:[.,]\d{1,2})?|\d+[.,]\d{1,2}|\d{3,})(?!\d)"
+)
+# A cell holding nothing but a short number, e.g. "12", "(5)", "USD 12" or "7 CR"
+SHORT_NUMBER_PATTERN = re.compile(r"\W*(?:[A-Z]{3})?\W*\d+\W*(?:[A-Z]{2,3})?\W*")
+HEADER_KEYWORDS = ("date", "balance", "debit", "credit", "withdrawal", "deposit")
+BOILERPLATE_KEYWORDS = (
+    "terms and conditions",
+    "schedule of charges",
+    "important information",
+    "important notice",
+    "customer service",
+)
+
+
+def page_filter_mode():
+    """
+    Page pre-filter mode from EXTRACTOR_PAGE_FILTER.
+
+    "shadow" (default) only logs what would be skipped, "on" skips
+    non-transaction pages, and "off" disables classification.
+    """
+    return os.getenv("EXTRACTOR_PAGE_FILTER", "shadow").lower()
+
+
+def is_numeric(content):
+    """Whether a cell holds a number in any format, ignoring dates."""
+    content = DATE_PATTERN.sub(" ", content)
+    return bool(AMOUNT_PATTERN.search(content) or SHORT_NUMBER_PATTERN.fullmatch(content.strip()))
+
+
+def classify_text(text):
+    """
+    Classify a page from its PDF text layer.
+
+    Transaction pages carry a date and an amount on every row, so a page
+    with several of both is a transaction page. Only a page with neither a
+    date nor an amount in any notation is a non-transaction page; everything
+    in between is left uncertain.
+
+    Args:
+        text (str): Extracted page text
+
+    Returns:
+        tuple: (label, reason)
+    """
+    if len(text.strip()) < MIN_TEXT_LAYER_CHARS:
+        return UNCERTAIN, "no text layer"
+
+    dates = len(DATE_PATTERN.findall(text))
+    # Years and days of dates are not amounts
+    amounts = len(AMOUNT_PATTERN.findall(DATE_PATTERN.sub(" ", text)))
+    boilerplate = [keyword for keyword in BOILERPLATE_KEYWORDS if keyword in text.lower()]
+    reason = f"text layer: {dates} dates, {amounts} amounts, boilerplate {boilerplate}"
+
+    if dates >= MIN_TRANSACTION_ROWS and amounts >= MIN_TRANSACTION_ROWS:
+        return TRANSACTION, reason
+    if amounts == 0 and dates == 0:
+        return NON_TRANSACTION, reason
+    return UNCERTAIN, reason
+
+
+def classify_tables(tables):
+    """
+    Classify a page from the shape of its Azure tables.
+
+    A row with a date and a number (not part of the date) is a transaction row.
+    Tables without any date, numeric cell or header keyword cannot hold
+    transactions.
+
+    Args:
+        tables (list): Tables in the format of ``compact_tables``
+
+    Returns:
+        tuple: (label, reason)
+    """
+    if not tables:
+        return NON_TRANSACTION, "no tables"
+
+    transaction_rows = 0
+    keyword_cells = 0
+    date_cells = 0
+    numeric_cells = 0
+    for table in tables:
+        rows = {}
+        for cell in table["cells"]:
+            content = cell["content"]
+            has_date = bool(DATE_PATTERN.search(content))
+            numeric = is_numeric(content)
+            rows.setdefault(cell["rowIndex"], []).append((has_date, numeric))
+            date_cells += has_date
+            numeric_cells += numeric
+            keyword_cells += any(keyword in content.lower() for keyword in HEADER_KEYWORDS)
+        if (table["columnCount"] or 0) < 3:
+            continue
+        transaction_rows += sum(
+            1
+            for cells in rows.values()
+            if any(has_date for has_date, _ in cells)
+            and any(numeric for _, numeric in cells)
+        )
+
+    reason = (
+        f"tables: {len(tables)} tables, {transaction_rows} transaction rows, "
+        f"{date_cells} date cells, {numeric_cells} numeric cells, "
+        f"{keyword_cells} header keyword cells"
+    )
+    if transaction_rows >= MIN_TRANSACTION_ROWS:
+        return TRANSACTION, reason
+    if date_cells == 0 and numeric_cells == 0 and keyword_cells == 0:
+        return NON_TRANSACTION, reason
+    return UNCERTAIN, reason
+
+
+class PageClassifier:
+    """
+    Cheap local classification of the pages of one statement.
+
+    Pages are classified from the PDF text layer first; scanned pages without
+    text stay uncertain until their Azure tables are available. Decisions are
+    logged so skipped pages can be audited for false negatives.
+    """
+
+    def __init__(self, text_layer, mode=None):
+        self.text_layer = text_layer
+        self.mode = mode or page_filter_mode()
+        self.labels = {}
+        self.skipped = {}
+        self._lock = threading.Lock()
+
+    def classify(self, page_num, tables=None):
+        """
+        Classify a page, refining an uncertain text-layer label with its tables.
+
+        Returns:
+            str: TRANSACTION, NON_TRANSACTION or UNCERTAIN
+        """
+        if self.mode == "off":
+            return UNCERTAIN
+        with self._lock:
+            if page_num not in self.labels:
+                self.labels[page_num] = classify_text(self.text_layer.text(page_num))
+            label, reason = self.labels[page_num]
+            if label == UNCERTAIN and tables is not None:
+                label, reason = self.labels[page_num] = classify_tables(tables)
+        logger.info(f"[DEBUG] [PAGE_FILTER] Page {page_num}: {label} ({reason})")
+        return label
+
+    def confirm(self, page_num, reason):
+        """Record a page known to hold transactions, e.g. the header page."""
+        with self._lock:
+            self.labels[page_num] = (TRANSACTION, reason)
+
+    def should_skip(self, page_num, tables=None, page_logger=None):
+        """
+        Whether a page can be left out of the expensive stages.
+
+        In shadow mode the decision is logged but the page is kept.
+        """
+        if self.classify(page_num, tables) != NON_TRANSACTION:
+            return False
+        reason = self.labels[page_num][1]
+        (page_logger or logger).info(
+            f"[DEBUG] [PAGE_FILTER] {'Would skip' if self.mode == 'shadow' else 'Skipping'} "
+            f"page {page_num} as non-transaction ({reason})"
+        )
+        if self.mode == "shadow":
+            return False
+        self.skipped[page_num] = reason
+        return True
@@ -0,0 +1,47 @@
+from functools import cached_property
+import hashlib
+import io
+import os
+import threading
+
+
+def save_page_images():
+    """Whether rendered pages are also written to disk as debug artifacts (EXTRACTOR_SAVE_PAGE_IMAGES)."""
+    return os.getenv("EXTRACTOR_SAVE_PAGE_IMAGES", "false").lower() in ("1", "true", "yes")
+
+
+class PageImage:
+    """
+    A rendered page kept in memory.
+
+    The PNG encoding is produced once, on first use, and the same bytes are
+    handed by reference to Azure OCR and to every Gemini call for the page,
+    so nothing has to be written to or re-read from disk.
+    """
+
+    def __init__(self, page_num, image):
+        self.page_num = page_num
+        self.image = image
+        self._png_bytes = None
+        self._lock = threading.Lock()
+
+    @property
+    def png_bytes(self):
+        """PNG encoding of the page, computed once and shared."""
+        if self._png_bytes is None:
+            with self._lock:
+                if self._png_bytes is None:
+                    buffer = io.BytesIO()
+                    self.image.save(buffer, "PNG")
+                    self._png_bytes = buffer.getvalue()
+        return self._png_bytes
+
+    @cached_property
+    def sha256(self):
+        return hashlib.sha256(self.png_bytes).hexdigest()
+
+    def save(self, path):
+        """Write the encoded page to disk as a debug artifact."""
+        with open(path, "wb") as f:
+            f.write(self.png_bytes)
+        return path
@@ -0,0 +1,96 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pdf2image import convert_from_path
+from ..pipeline.staged_pipeline import stage_setting
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CHUNK_SIZE = 4
+DEFAULT_RENDER_WORKERS = 2
+
+
+def render_page_range(pdf_path, first_page, last_page):
+    """
+    Render a contiguous page range of the original PDF with a single poppler call.
+
+    Args:
+        pdf_path (str): Path to the uploaded PDF
+        first_page (int): First page to render (1-based, inclusive)
+        last_page (int): Last page to render (inclusive)
+
+    Returns:
+        dict: page number -> PIL image
+    """
+    images = convert_from_path(pdf_path, first_page=first_page, last_page=last_page)
+    return dict(zip(range(first_page, first_page + len(images)), images))
+
+
+def group_page_ranges(page_numbers, chunk_size):
+    """
+    Group sorted page numbers into contiguous ranges of at most chunk_size pages.
+
+    Example:
+        group_page_ranges([2, 3, 4, 5, 7], 3) -> [(2, 4), (5, 5), (7, 7)]
+    """
+    ranges = []
+    for page_num in sorted(page_numbers):
+        if (
+            ranges
+            and ranges[-1][1] == page_num - 1
+            and ranges[-1][1] - ranges[-1][0] + 1 < chunk_size
+        ):
+            ranges[-1] = (ranges[-1][0], page_num)
+        else:
+            ranges.append((page_num, page_num))
+    return ranges
+
+
+def iter_rendered_pages(
+    pdf_path, page_numbers, render_range=render_page_range, chunk_size=None, max_workers=None
+):
+    """
+    Render pages of the original PDF in parallel page ranges, yielding them in order.
+
+    The PDF is never split: each range is one poppler process reading the
+    uploaded file. At most ``max_workers`` ranges are in flight, so a consumer
+    that stops pulling (e.g. a full pipeline queue) also stops rendering.
+
+    Args:
+        pdf_path (str): Path to the uploaded PDF
+        page_numbers (iterable): Pages to render (1-based)
+        render_range (callable): ``render_range(pdf_path, first, last)`` returning
+            page number -> rendered result
+        chunk_size (int, optional): Pages per poppler call (EXTRACTOR_RENDER_CHUNK_SIZE)
+        max_workers (int, optional): Ranges rendered concurrently (EXTRACTOR_RENDER_WORKERS)
+
+    Yields:
+        tuple: (page number, rendered result)
+    """
+    # Read like the stage settings, so bad or zero values never stop rendering
+    chunk_size = chunk_size or stage_setting("render", "chunk_size", DEFAULT_CHUNK_SIZE)
+    max_workers = max_workers or stage_setting("render", "workers", DEFAULT_RENDER_WORKERS)
+    ranges = group_page_ranges(page_numbers, chunk_size)
+    logger.info(
+        f"[DEBUG] [RENDER_PDF] Rendering {len(ranges)} page ranges of {pdf_path} "
+        f"with {max_workers} workers"
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        pending = iter(ranges)
+
+        for first_page, last_page in pending:
+            in_flight.append(
+                executor.submit(render_range, pdf_path, first_page, last_page)
+            )
+            if len(in_flight) >= max_workers:
+                break
+
+        while in_flight:
+            rendered = in_flight.popleft().result()
+            next_range = next(pending, None)
+            if next_range:
+                in_flight.append(executor.submit(render_range, pdf_path, *next_range))
+            for page_num in sorted(rendered):
+                yield page_num, rendered[page_num]
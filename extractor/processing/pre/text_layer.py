@@ -0,0 +1,340 @@
+import os
+import threading
+from PyPDF2 import PdfReader
+from ...utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+HEADER_KEYWORDS = (
+    "date",
+    "description",
+    "details",
+    "particulars",
+    "debit",
+    "credit",
+    "balance",
+)
+# Pages need at least this many rows of three or more cells to skip OCR
+MIN_TABLE_ROWS = 3
+# Average glyph width as a share of the font size, used to estimate text extents
+GLYPH_WIDTH = 0.5
+
+
+def text_layer_enabled():
+    """Whether tables of pages with a text layer are read from the PDF (EXTRACTOR_TEXT_LAYER)."""
+    return os.getenv("EXTRACTOR_TEXT_LAYER", "false").lower() in ("1", "true", "yes")
+
+
+def _multiply(first, second):
+    """Product of two PDF transformation matrices given as 6-element lists."""
+    a, b, c, d, e, f = first
+    return [
+        a * second[0] + b * second[2],
+        a * second[1] + b * second[3],
+        c * second[0] + d * second[2],
+        c * second[1] + d * second[3],
+        e * second[0] + f * second[2] + second[4],
+        e * second[1] + f * second[3] + second[5],
+    ]
+
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, "get_object") else value
+
+
+def glyph_widths(font_dict):
+    """
+    Glyph widths of a font in thousandths of the font size.
+
+    Simple fonts list them in /Widths from /FirstChar. For composite (Type0)
+    fonts the decoded text cannot be mapped back to glyph ids, so their
+    default or average width is used for every character.
+
+    Returns:
+        tuple: (first char code, widths, width of any other character), or
+        None when the font has no usable metrics
+    """
+    try:
+        font_dict = _resolve(font_dict)
+        widths = _resolve(font_dict.get("/Widths"))
+        if widths:
+            widths = [float(_resolve(width)) for width in widths]
+            descriptor = _resolve(font_dict.get("/FontDescriptor")) or {}
+            missing = float(descriptor.get("/MissingWidth", 0)) or sum(widths) / len(widths)
+            return int(font_dict.get("/FirstChar", 0)), widths, missing
+        descendant = _resolve(_resolve(font_dict["/DescendantFonts"])[0])
+        entries = [_resolve(entry) for entry in _resolve(descendant.get("/W", []))]
+        cid_widths = [
+            float(_resolve(width))
+            for entry in entries
+            if isinstance(entry, list)
+            for width in entry
+        ]
+        default = float(descendant.get("/DW", 1000))
+        return 0, [], sum(cid_widths) / len(cid_widths) if cid_widths else default
+    except Exception:
+        return None
+
+
+def text_width(text, metrics, font_size):
+    """Width of ``text`` in text space, or None without font metrics."""
+    if metrics is None:
+        return None
+    first_char, widths, missing = metrics
+    total = 0.0
+    for char in text:
+        index = ord(char) - first_char
+        total += widths[index] if 0 <= index < len(widths) else missing
+    return total / 1000 * font_size
+
+
+class Fragment:
+    """
+    A run of text at a position on the page, in PDF points.
+
+    ``width`` comes from the font metrics when the PDF has them; otherwise
+    it is estimated from ``GLYPH_WIDTH``.
+    """
+
+    def __init__(self, text, x, y, size, width=None):
+        self.text = text
+        self.x0 = x
+        self.x1 = x + (width if width is not None else len(text) * size * GLYPH_WIDTH)
+        self.y = y
+        self.size = size
+
+
+def group_rows(fragments):
+    """
+    Cluster fragments into text lines by their baseline, top to bottom.
+
+    Fragments of a line that nearly touch are merged into one cell.
+
+    Returns:
+        list: Rows, each a list of fragments ordered left to right
+    """
+    rows = []
+    for fragment in sorted(fragments, key=lambda item: (-item.y, item.x0)):
+        if rows and abs(rows[-1][0].y - fragment.y) <= fragment.size * 0.5:
+            rows[-1].append(fragment)
+        else:
+            rows.append([fragment])
+
+    merged_rows = []
+    for row in rows:
+        cells = []
+        for fragment in sorted(row, key=lambda item: item.x0):
+            if cells and fragment.x0 - cells[-1].x1 < fragment.size * GLYPH_WIDTH:
+                cells[-1].text = f"{cells[-1].text} {fragment.text}"
+                cells[-1].x1 = max(cells[-1].x1, fragment.x1)
+            else:
+                # A copy, so merging never alters the fragments cached per page
+                cells.append(
+                    Fragment(
+                        fragment.text,
+                        fragment.x0,
+                        fragment.y,
+                        fragment.size,
+                        fragment.x1 - fragment.x0,
+                    )
+                )
+        merged_rows.append(cells)
+    return merged_rows
+
+
+def column_spans(rows):
+    """
+    Column extents from the union of overlapping cell extents.
+
+    Columns are separated by vertical whitespace: left-, right- and
+    centre-aligned values of one column overlap each other, so every
+    overlapping group becomes one column.
+
+    Returns:
+        list: (x0, x1) per column, left to right
+    """
+    spans = []
+    for cell in sorted((cell for row in rows for cell in row), key=lambda item: item.x0):
+        if spans and cell.x0 <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], cell.x1)
+        else:
+            spans.append([cell.x0, cell.x1])
+    return [tuple(span) for span in spans]
+
+
+def merge_split_columns(spans, rows, header):
+    """
+    Merge neighbouring columns that sit under the same header cell and never share a row.
+
+    Where extents had to be estimated, a right-aligned column whose values
+    differ a lot in length can fall apart into two spans; the header row
+    tells them apart from real neighbouring columns such as debit and credit.
+
+    Args:
+        spans (list): (x0, x1) per column from ``column_spans``
+        rows (list): Table rows of fragments, the header row included
+        header (list): Fragments of the header row
+
+    Returns:
+        list: (x0, x1) per column, left to right
+    """
+    if len(spans) < 2 or not header:
+        return spans
+
+    def distance(cell, span):
+        return max(0.0, span[0] - cell.x1, cell.x0 - span[1])
+
+    owners = [
+        min(range(len(header)), key=lambda index: distance(header[index], span))
+        for span in spans
+    ]
+    occupied = [set() for _ in spans]
+    for row_index, row in enumerate(rows):
+        for cell in row:
+            occupied[_column_of(cell, spans)].add(row_index)
+
+    merged = [[*spans[0]]]
+    merged_rows = set(occupied[0])
+    for index in range(1, len(spans)):
+        if owners[index] == owners[index - 1] and not merged_rows & occupied[index]:
+            merged[-1][1] = max(merged[-1][1], spans[index][1])
+            merged_rows |= occupied[index]
+        else:
+            merged.append([*spans[index]])
+            merged_rows = set(occupied[index])
+    return [tuple(span) for span in merged]
+
+
+def _column_of(cell, spans):
+    centre = (cell.x0 + cell.x1) / 2
+    for index, (x0, x1) in enumerate(spans):
+        if x0 <= centre <= x1:
+            return index
+    return min(range(len(spans)), key=lambda index: abs(spans[index][0] - cell.x0))
+
+
+def build_table(rows):
+    """
+    Rebuild the transaction table of a page from its text lines.
+
+    The table runs from the header row (or the first row of three or more
+    cells) to the last such row; single-cell lines in between, such as
+    wrapped descriptions, stay in the table.
+
+    Returns:
+        dict: Table in the format of ``compact_tables``, or None without a usable table
+    """
+    wide_rows = [index for index, row in enumerate(rows) if len(row) >= 3]
+    if len(wide_rows) < MIN_TABLE_ROWS:
+        return None
+
+    header_row = next(
+        (
+            index
+            for index in wide_rows
+            if sum(
+                any(keyword in cell.text.lower() for keyword in HEADER_KEYWORDS)
+                for cell in rows[index]
+            )
+            >= 2
+        ),
+        None,
+    )
+    first_row = header_row if header_row is not None else wide_rows[0]
+    table_rows = rows[first_row : wide_rows[-1] + 1]
+    spans = column_spans(row for row in table_rows if len(row) >= 3)
+    if header_row is not None:
+        spans = merge_split_columns(spans, table_rows, table_rows[0])
+
+    cells = {}
+    for row_index, row in enumerate(table_rows):
+        for cell in row:
+            column_index = _column_of(cell, spans)
+            key = (row_index, column_index)
+            cells[key] = f"{cells[key]} {cell.text}" if key in cells else cell.text
+
+    return {
+        "rowCount": len(table_rows),
+        "columnCount": len(spans),
+        "cells": [
+            {
+                "rowIndex": row_index,
+                "columnIndex": column_index,
+                "content": content,
+                "kind": (
+                    "columnHeader"
+                    if header_row is not None and row_index == 0
+                    else "content"
+                ),
+            }
+            for (row_index, column_index), content in sorted(cells.items())
+        ],
+    }
+
+
+class TextLayer:
+    """
+    Text layer of the uploaded PDF, read once per page and shared by the job.
+
+    Provides the plain text used by the page classifier and positioned text
+    fragments from which the transaction table is rebuilt without OCR.
+    """
+
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self._reader = None
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _extract(self, page_num):
+        fragments = []
+        metrics = {}
+
+        def visitor(text, cm, tm, font_dict, font_size):
+            text = " ".join(text.split())
+            if not text:
+                return
+            matrix = _multiply(tm, cm)
+            size = (font_size or 1) * (abs(matrix[3]) or 1)
+            if id(font_dict) not in metrics:
+                metrics[id(font_dict)] = glyph_widths(font_dict) if font_dict else None
+            width = text_width(
+                text, metrics[id(font_dict)], (font_size or 1) * (abs(matrix[0]) or 1)
+            )
+            fragments.append(Fragment(text, matrix[4], matrix[5], size, width))
+
+        with self._lock:
+            if page_num not in self._pages:
+                if self._reader is None:
+                    self._reader = PdfReader(self.pdf_path, strict=False)
+                try:
+                    page = self._reader.pages[page_num - 1]
+                    text = page.extract_text(visitor_text=visitor) or ""
+                except Exception as e:
+                    logger.warning(
+                        f"[WARNING] [TEXT_LAYER] No text for page {page_num}: {e}"
+                    )
+                    text, fragments = "", []
+                self._pages[page_num] = (text, fragments)
+            return self._pages[page_num]
+
+    def text(self, page_num):
+        """Plain text of a page, empty for scanned pages."""
+        return self._extract(page_num)[0]
+
+    def page_tables(self, page_num, page_logger=None):
+        """
+        Tables of a page rebuilt from its positioned text.
+
+        Returns:
+            list: Tables in the format of ``compact_tables``, or None when the
+            page has no usable text layer and has to be OCR'd
+        """
+        table = build_table(group_rows(self._extract(page_num)[1]))
+        if table is None:
+            return None
+        (page_logger or logger).info(
+            f"[DEBUG] [TEXT_LAYER] Page {page_num} read from the text layer: "
+            f"{table['rowCount']}x{table['columnCount']}"
+        )
+        return [table]
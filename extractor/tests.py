@@ -1,3 +1,1790 @@
-from django.test import TestCase
+import logging
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+from unittest import mock
+import numpy as np
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from .processing.gemini.cleaning import clean_using_response as reference
+from .processing.gemini.cleaning import vectorized_ops as vectorized
+from .processing.gemini.cleaning.operation_plan import OperationPlan
+from .processing.gemini.cleaning.operation_trace import OperationTrace
+from .processing.gemini.cleaning.validate_program import validate_program
+from .processing.pipeline.page_table import PageTable
+from .utils.regex_cache import RegexCache, UnsafePatternError, check_pattern
 
-# Create your tests here.
+quiet_logger = logging.getLogger("extractor.tests.cleaning")
+quiet_logger.addHandler(logging.NullHandler())
+quiet_logger.propagate = False
+
+CELL_VALUES = [
+    "",
+    "",
+    "01/02/2024",
+    "02 Feb",
+    "Coffee Shop",
+    "POS 1234 CARD",
+    "1,234.50",
+    "-3.00",
+    "CR",
+    " padded ",
+    "a&b",
+    None,
+]
+
+
+def random_matrix(rng, max_rows=8, max_cols=6):
+    rows = rng.randint(0, max_rows)
+    cols = rng.randint(0, max_cols) if rows else rng.randint(0, max_cols)
+    matrix = np.empty((rows, cols), dtype=object)
+    for r in range(rows):
+        for c in range(cols):
+            matrix[r, c] = rng.choice(CELL_VALUES)
+    return matrix
+
+
+def random_index(rng, size):
+    """Mostly valid indices, with negative and out-of-range ones mixed in."""
+    return rng.choice([rng.randint(0, max(size - 1, 0))] * 4 + [-1, -size - 1, size, size + 2])
+
+
+def random_range(rng, size):
+    return {
+        "start_row": rng.choice([0, 0, 1, -2, size]),
+        "end_row": rng.choice([size, size, size - 1, -1, size + 1, 2]),
+    }
+
+
+def random_operation(rng, op_type, matrix):
+    rows, cols = matrix.shape
+    if op_type == "regex_replace":
+        return {
+            "regex": rng.choice([r",", r"^\s+|\s+$", r"(\d+)\.(\d+)", r"[A-Z]+", r"x*"]),
+            "replacement": rng.choice(["", " ", r"\2.\1", "#"]),
+        }
+    if op_type == "delete_rows":
+        return {"row_indices": [random_index(rng, rows) for _ in range(rng.randint(0, 3))]}
+    if op_type == "map_column":
+        return {
+            "header_name": rng.choice(["Date", "Description", "Balance"]),
+            "column_index": [rng.randint(0, cols + 1) for _ in range(rng.randint(1, 3))],
+            "row_range": random_range(rng, rows),
+        }
+    if op_type == "merge_rows":
+        return {
+            "source_row_indices": [random_index(rng, rows) for _ in range(rng.randint(1, 3))],
+            "target_row_index": random_index(rng, rows),
+            **({"row_range": random_range(rng, rows)} if rng.random() < 0.5 else {}),
+        }
+    if op_type == "split_cols":
+        return {
+            "source_col_index": random_index(rng, cols),
+            "num_target_cols": 2,
+            "split_logic": rng.choice([r"(\d+)/(\d+)", r"(\S+)\s*(.*)", r"(\d+)?(\D*)", r"x"]),
+            "method": "regex",
+            "row_range": random_range(rng, rows),
+            "index_created": [random_index(rng, cols) for _ in range(rng.randint(1, 3))],
+        }
+    if op_type == "insert_column":
+        return {
+            "name": "New",
+            "position": rng.choice([0, cols, cols + 3, -1]),
+            "default_value": rng.choice(["", "NaN", "0.00"]),
+        }
+    if op_type == "copy_item":
+        return {
+            "from_row": random_index(rng, rows),
+            "from_col": random_index(rng, cols),
+            "to_row": random_index(rng, rows),
+            "to_col": random_index(rng, cols),
+        }
+    if op_type == "merge_cols":
+        return {
+            "source_col_indices": [random_index(rng, cols) for _ in range(rng.randint(1, 4))],
+            "target_col_index": random_index(rng, cols),
+            "row_range": random_range(rng, rows),
+        }
+    if op_type == "delete_cols":
+        return {
+            "col_indices": [random_index(rng, cols) for _ in range(rng.randint(0, 4))],
+            "row_range": random_range(rng, rows),
+        }
+    raise ValueError(op_type)
+
+
+def run_handler(handlers, op_type, ops, matrix, header):
+    """Outcome of one handler call: the resulting arrays as lists, or "error"."""
+    handler = handlers[op_type]
+    operations = [{op_type: ops}]
+    try:
+        if op_type in ("map_column", "insert_column"):
+            matrix, header = handler(operations, matrix.copy(), quiet_logger, header=header.copy())
+            return matrix.tolist(), np.asarray(header).tolist()
+        return handler(operations, matrix.copy(), quiet_logger).tolist()
+    except Exception:
+        return "error"
+
+
+def random_program(rng, matrix, op_types, length):
+    operations = []
+    for _ in range(length):
+        op_type = rng.choice(op_types)
+        ops = [random_operation(rng, op_type, matrix) for _ in range(rng.randint(0, 2))]
+        operations.append({"operation_type": op_type, "operation": {op_type: ops}})
+    return operations
+
+
+def clean_page(operations, rows, path, environ):
+    """CSV written by process_gemini_response under the given settings, or "error"."""
+    with mock.patch.dict(os.environ, environ):
+        try:
+            reference.process_gemini_response(
+                {"operations": operations}, PageTable(1, rows), path, quiet_logger
+            )
+        except Exception:
+            return "error"
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def failing_step(operations, matrix):
+    """Index of the operation the vectorized engine fails on with its message, or None."""
+    header = matrix[0].copy()
+    for step, op in enumerate(operations):
+        if len(matrix) == 0:
+            return None
+        op_type = op["operation_type"]
+        handler = vectorized.VECTORIZED_HANDLERS[op_type]
+        try:
+            if op_type in ("map_column", "insert_column"):
+                matrix, header = handler([op["operation"]], matrix, quiet_logger, header=header)
+            else:
+                matrix = handler([op["operation"]], matrix, quiet_logger)
+        except Exception as e:
+            return step, str(e)
+    return None
+
+
+def page_rows(matrix):
+    return [["" if cell is None else cell for cell in row] for row in matrix.tolist()]
+
+
+class VectorizedOperationsTest(SimpleTestCase):
+    """Differential tests of the vectorized cleaning engine against the reference handlers."""
+
+    CASES = 400
+
+    def assertSameOutcome(self, op_type, ops, matrix, header=None):
+        header = matrix[0].copy() if header is None and len(matrix) else header
+        if header is None:
+            header = np.empty(0, dtype=object)
+        expected = run_handler(reference.OPERATION_HANDLERS, op_type, ops, matrix, header)
+        actual = run_handler(vectorized.VECTORIZED_HANDLERS, op_type, ops, matrix, header)
+        self.assertEqual(
+            actual, expected, f"{op_type} {ops} on {matrix.tolist()} differs"
+        )
+        return actual
+
+    def check_random(self, op_type, seed):
+        rng = random.Random(seed)
+        for _ in range(self.CASES):
+            matrix = random_matrix(rng)
+            ops = [random_operation(rng, op_type, matrix) for _ in range(rng.randint(0, 3))]
+            self.assertSameOutcome(op_type, ops, matrix)
+
+    def test_handlers_cover_the_same_operations(self):
+        self.assertEqual(
+            set(vectorized.VECTORIZED_HANDLERS), set(reference.OPERATION_HANDLERS)
+        )
+
+    def test_regex_replace(self):
+        self.check_random("regex_replace", 1)
+
+    def test_delete_rows(self):
+        self.check_random("delete_rows", 2)
+
+    def test_map_column(self):
+        self.check_random("map_column", 3)
+
+    def test_merge_rows(self):
+        self.check_random("merge_rows", 4)
+
+    def test_split_cols(self):
+        self.check_random("split_cols", 5)
+
+    def test_insert_column(self):
+        self.check_random("insert_column", 6)
+
+    def test_copy_item(self):
+        self.check_random("copy_item", 7)
+
+    def test_merge_cols(self):
+        self.check_random("merge_cols", 8)
+
+    def test_delete_cols(self):
+        self.check_random("delete_cols", 9)
+
+    def test_regex_replace_skips_empty_and_non_string_cells(self):
+        matrix = np.array([["", None, "a"], ["b", "", None]], dtype=object)
+        result = self.assertSameOutcome(
+            "regex_replace", [{"regex": r"^", "replacement": "x"}], matrix
+        )
+        self.assertEqual(result, [["", None, "xa"], ["xb", "", None]])
+
+    def test_merge_cols_applies_only_the_last_operation(self):
+        matrix = np.array([["a", "b", "c"], ["d", "e", "f"]], dtype=object)
+        ops = [
+            {"source_col_indices": [0], "target_col_index": 1},
+            {"source_col_indices": [2], "target_col_index": 1},
+        ]
+        result = self.assertSameOutcome("merge_cols", ops, matrix)
+        self.assertEqual(result, [["a", "b c", "c"], ["d", "e f", "f"]])
+
+    def test_delete_cols_deletes_one_at_a_time(self):
+        matrix = np.array([["a", "b", "c", "d"]], dtype=object)
+        # The duplicate 2 removes "c" and then "d", 9 is beyond the width and
+        # ignored, and -2 then counts from the two remaining columns
+        result = self.assertSameOutcome("delete_cols", [{"col_indices": [2, 2, 9, -2]}], matrix)
+        self.assertEqual(result, [["b"]])
+
+    def test_split_cols_fills_unmatched_rows(self):
+        matrix = np.array([["01/02", ""], ["none", ""]], dtype=object)
+        ops = [
+            {
+                "source_col_index": 0,
+                "num_target_cols": 2,
+                "split_logic": r"(\d+)/(\d+)",
+                "method": "regex",
+                "index_created": [0, 1],
+            }
+        ]
+        result = self.assertSameOutcome("split_cols", ops, matrix)
+        self.assertEqual(result, [["01", "02"], ["", ""]])
+
+    def test_merge_rows_orders_by_row_index(self):
+        matrix = np.array([["a"], ["b"], ["c"]], dtype=object)
+        ops = [{"source_row_indices": [2, 0], "target_row_index": 1}]
+        result = self.assertSameOutcome("merge_rows", ops, matrix)
+        self.assertEqual(result, [["a"], ["a b c"], ["c"]])
+
+    def test_process_gemini_response_matches_reference_engine(self):
+        rng = random.Random(10)
+        op_types = list(reference.OPERATION_HANDLERS)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for case in range(100):
+                matrix = random_matrix(rng, max_rows=10)
+                rows = page_rows(matrix)
+                if not rows or not rows[0]:
+                    continue
+                operations = random_program(rng, matrix, op_types, rng.randint(1, 6))
+                outputs = {
+                    engine: clean_page(
+                        operations,
+                        rows,
+                        os.path.join(tmp_dir, f"{case}_{engine}.csv"),
+                        {"EXTRACTOR_CLEANING_ENGINE": engine},
+                    )
+                    for engine in ("reference", "vectorized")
+                }
+                self.assertEqual(outputs["vectorized"], outputs["reference"], operations)
+
+    def test_dense_page_matches_reference_in_half_the_time(self):
+        rng = random.Random(11)
+        matrix = np.empty((200, 12), dtype=object)
+        for r in range(200):
+            for c in range(12):
+                matrix[r, c] = rng.choice(CELL_VALUES[:-1]) + str(rng.randint(0, 50))
+        ops = [
+            {"regex": pattern, "replacement": ""}
+            for pattern in [r",", r"^\s+", r"\s+$", r"CR$", r"[^\w\s./,-]", r"(?<=\d) (?=\d)"] * 2
+        ]
+
+        result = vectorized.handle_regex_replace([{"regex_replace": ops}], matrix.copy(), quiet_logger)
+        expected = reference.handle_regex_replace([{"regex_replace": ops}], matrix.copy(), quiet_logger)
+        self.assertEqual(result.tolist(), expected.tolist())
+
+        # Relative to the reference engine on the same machine, so load does not fail it
+        def best_time(handler):
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                handler([{"regex_replace": ops}], matrix.copy(), quiet_logger)
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        self.assertLess(
+            best_time(vectorized.handle_regex_replace),
+            0.5 * best_time(reference.handle_regex_replace),
+        )
+
+
+class OperationPlanTest(SimpleTestCase):
+    """The optimized plan must clean pages exactly like running every operation on its own."""
+
+    def test_optimized_plan_matches_unoptimized_run(self):
+        rng = random.Random(12)
+        # Weighted towards runs of deletions and regex replacements, which get fused
+        op_types = ["delete_rows", "delete_cols", "regex_replace"] * 3 + list(
+            reference.OPERATION_HANDLERS
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for case in range(200):
+                matrix = random_matrix(rng, max_rows=10)
+                rows = page_rows(matrix)
+                if not rows or not rows[0]:
+                    continue
+                operations = random_program(rng, matrix, op_types, rng.randint(1, 10))
+                outputs = {
+                    plan: clean_page(
+                        operations,
+                        rows,
+                        os.path.join(tmp_dir, f"{case}_{plan}.csv"),
+                        {"EXTRACTOR_CLEANING_ENGINE": "vectorized", "EXTRACTOR_OPERATION_PLAN": plan},
+                    )
+                    for plan in ("true", "false")
+                }
+                self.assertEqual(outputs["true"], outputs["false"], operations)
+
+    def test_plan_reports_saved_passes_and_copies(self):
+        def operation(op_type, *ops):
+            return {"operation_type": op_type, "operation": {op_type: list(ops)}}
+
+        operations = [
+            operation("delete_cols", {"col_indices": [3]}),
+            operation("delete_rows", {"row_indices": [0]}, {"row_indices": [0]}),
+            operation("copy_item"),
+            operation("delete_cols", {"col_indices": [0]}),
+            operation("regex_replace", {"regex": ",", "replacement": ""}),
+            operation("regex_replace", {"regex": r"\s+$", "replacement": ""}),
+            operation("map_column", {"header_name": "Date", "column_index": [0]}),
+        ]
+        plan = OperationPlan(operations, vectorized.VECTORIZED_HANDLERS)
+        self.assertEqual(
+            [step.op_type for step in plan.steps],
+            ["delete_cols+delete_rows", "regex_replace", "map_column"],
+        )
+
+        matrix = np.array([["a", "b", "c", "d"]] * 4, dtype=object)
+        header = matrix[0].copy()
+        for step in plan.steps:
+            matrix, header = step.apply(matrix, header, quiet_logger, plan.stats)
+        self.assertEqual(matrix.tolist(), [["b", "c"]] * 2)
+        # 7 passes became 3, and 4 deletion copies became 1
+        self.assertEqual(plan.stats["dropped"], 1)
+        self.assertEqual(plan.stats["passes_saved"], 4)
+        self.assertEqual(plan.stats["copies_saved"], 3)
+
+
+class ProgramValidationTest(SimpleTestCase):
+    """The validator must reject exactly the programs whose indices fail in the handlers."""
+
+    def operation(self, op_type, *ops):
+        return {"operation_type": op_type, "operation": {op_type: list(ops)}}
+
+    def test_rejects_the_operation_the_engine_fails_on(self):
+        rng = random.Random(23)
+        op_types = list(vectorized.VECTORIZED_HANDLERS)
+        for _ in range(1500):
+            matrix = np.array(page_rows(random_matrix(rng, max_rows=10)), dtype=object)
+            if not matrix.size:
+                continue
+            operations = random_program(rng, matrix, op_types, rng.randint(1, 8))
+            failure = failing_step(operations, matrix.copy())
+            errors = validate_program(operations, matrix.shape).errors
+            message = f"{operations} on {matrix.shape}: {failure} vs {[str(e) for e in errors]}"
+
+            # Replacement templates are only expanded when a non-empty cell is left
+            if errors and errors[0].operation_type == "regex_replace":
+                if failure is None or errors[0].step < failure[0]:
+                    continue
+            # Cells that are None after an optional group depend on the data, not the shape
+            if failure and "expected string" in failure[1]:
+                continue
+            self.assertEqual(errors[0].step if errors else None, failure and failure[0], message)
+
+    def test_tracks_the_shape_through_the_program(self):
+        operations = [
+            self.operation("insert_column", {"name": "Type", "position": 9, "default_value": ""}),
+            self.operation("delete_rows", {"row_indices": [0, 0, 7]}),
+            self.operation("copy_item", {"from_row": 3, "from_col": 3, "to_row": 0, "to_col": 0}),
+            self.operation("merge_rows", {"source_row_indices": [3], "target_row_index": 4}),
+        ]
+        validation = validate_program(operations, (5, 3))
+        self.assertEqual(validation.shapes, [(5, 4), (4, 4), (4, 4)])
+        self.assertEqual(
+            [error.as_dict() for error in validation.errors],
+            [
+                {
+                    "step": 3,
+                    "operation_type": "merge_rows",
+                    "message": "target_row_index 4 is out of range for 4 rows",
+                }
+            ],
+        )
+        feedback = validation.feedback()
+        self.assertIn("- Operation 3 (merge_rows)", feedback)
+        # The rejected program is quoted back so Gemini corrects it instead of starting over
+        self.assertIn(json.dumps(operations, ensure_ascii=False), feedback)
+
+    def test_rejects_patterns_that_do_not_compile(self):
+        operations = [
+            self.operation("regex_replace", {"regex": "(\\d+", "replacement": ""}),
+            self.operation("regex_replace", {"regex": "(\\d+)", "replacement": "\\2"}),
+        ]
+        self.assertIn("does not compile", str(validate_program(operations, (2, 2)).errors[0]))
+        self.assertIn("invalid group reference", str(validate_program(operations[1:], (2, 2)).errors[0]))
+
+
+class RegexCacheTest(SimpleTestCase):
+    def test_least_recently_used_pattern_is_evicted(self):
+        cache = RegexCache(max_size=2)
+        first = cache.compile(r"\d+")
+        cache.compile(r"[,$]")
+        self.assertIs(cache.compile(r"\d+"), first)
+        cache.compile(r"\s+$")
+        cache.compile(r"[,$]")
+        self.assertEqual(
+            cache.stats(),
+            {"size": 2, "hits": 1, "misses": 4, "evictions": 2, "rejected": 0, "slow_calls": 0},
+        )
+
+    def test_invalid_and_refused_patterns_raise_on_every_lookup(self):
+        cache = RegexCache()
+        for _ in range(2):
+            with self.assertRaises(UnsafePatternError):
+                cache.compile(r"(\w+\s?)*$")
+            with self.assertRaises(re.error):
+                cache.compile(r"(\d+")
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["rejected"], 1)
+
+    def test_cached_errors_are_raised_fresh(self):
+        cache = RegexCache()
+        errors = []
+        for _ in range(3):
+            try:
+                cache.compile(r"(\d+")
+            except re.error as e:
+                errors.append(e)
+        self.assertIsNot(errors[0], errors[1])
+        # The traceback does not grow with every lookup
+        self.assertEqual(len({len(list(traceback.walk_tb(e.__traceback__))) for e in errors}), 1)
+
+    def test_slow_patterns_are_refused_only_when_slow_repeatedly(self):
+        from types import SimpleNamespace
+        from .utils import regex_cache
+
+        clock = FakeClock()
+        calls = []
+        duration = [0.0]
+
+        def perf_counter():
+            # Calls come in start/end pairs; each call lasts ``duration``
+            calls.append(clock.now)
+            if len(calls) % 2 == 0:
+                clock.sleep(duration[0])
+            return clock.now
+
+        def run(pattern, *seconds):
+            for call_seconds in seconds:
+                duration[0] = call_seconds
+                self.assertEqual(pattern.sub("#", "a1"), "a#")
+
+        cache = RegexCache(timeout=0.05)
+        fake_time = SimpleNamespace(perf_counter=perf_counter, monotonic=clock.monotonic)
+        with mock.patch.object(regex_cache, "time", fake_time):
+            pattern = cache.compile(r"\d+")
+            # One slow call under load costs nothing but its own time
+            run(pattern, 0.1, 0.01, 0.1)
+            self.assertIs(cache.compile(r"\d+"), pattern)
+            clock.sleep(regex_cache.REFUSAL_TTL)
+            run(pattern, 0.1, 0.1)
+            self.assertIs(cache.compile(r"\d+"), pattern)
+            run(pattern, 0.1)
+            with self.assertRaises(UnsafePatternError):
+                cache.compile(r"\d+")
+
+            # The refusal expires
+            clock.sleep(regex_cache.REFUSAL_TTL)
+            pattern = cache.compile(r"\d+")
+            run(pattern, 0.05 * regex_cache.LARGE_OVERRUN)
+            with self.assertRaises(UnsafePatternError):
+                cache.compile(r"\d+")
+        self.assertEqual((cache.stats()["slow_calls"], cache.stats()["rejected"]), (6, 2))
+
+    def test_patterns_run_on_the_standard_engine(self):
+        import warnings
+
+        # The regex module would read [[:alpha:]] as a POSIX class
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            pattern = RegexCache().compile(r"[[:alpha:]]+")
+        self.assertIsInstance(pattern.compiled, re.Pattern)
+        self.assertEqual(pattern.sub("#", "ab12:"), "ab12:")
+
+    def test_complexity_guard(self):
+        refused = [
+            r"(a+)+$", r"(.*)*x", r"((a|b)*c?)+", r"(?:(?:\d*))+", "a" * 1001,
+            # Alternatives that can start at the same character
+            r"(a|aa)+$", r"(\w|\d)+$", r"(?i)(A|a)+$", r"(,|)*x",
+        ]
+        for regex in refused:
+            with self.assertRaises(UnsafePatternError, msg=regex):
+                check_pattern(regex)
+        allowed = [
+            r"(?:\d+,)*\d+", r"(\d{1,3}(,\d{3})*)", r"(\S+)\s*(.*)", r"(?>a+)+", r"\s*(Dr|Cr)$",
+            r"(?:Dr|Cr)+", r"(?:\s|,)+$", r"(?:[A-Z]|\d)+", r"(a|aa)++$", r"(?x) (Dr | Cr) + # suffix",
+            r"(?<=\d) (?=\d)", r"(?P<day>\d{2})/(?P=day)", r"a{}+",
+        ]
+        for regex in allowed:
+            check_pattern(regex)
+        with self.assertRaises(re.error):
+            check_pattern(r"(\d+")
+
+    def test_refused_pattern_fails_validation_and_the_handler_without_running(self):
+        operations = [
+            {
+                "operation_type": "regex_replace",
+                "operation": {"regex_replace": [{"regex": r"^(a+)+$", "replacement": ""}]},
+            }
+        ]
+        errors = validate_program(operations, (1, 1)).errors
+        self.assertIn("refused", errors[0].message)
+
+        # Refused while compiling, so the pattern never runs on the cell; running
+        # it would take hours, so a generous bound does not depend on machine load
+        matrix = np.array([["a" * 40 + "!"]], dtype=object)
+        started = time.perf_counter()
+        with self.assertRaisesRegex(Exception, "backtrack catastrophically"):
+            vectorized.handle_regex_replace([operations[0]["operation"]], matrix, quiet_logger)
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(matrix.tolist(), [["a" * 40 + "!"]])
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class OperationTraceTest(SimpleTestCase):
+    def setUp(self):
+        self.handler = ListHandler()
+        self.page_logger = logging.getLogger("extractor.tests.trace")
+        self.page_logger.addHandler(self.handler)
+        self.page_logger.propagate = False
+        self.page_logger.setLevel(logging.INFO)
+        self.addCleanup(self.page_logger.removeHandler, self.handler)
+
+    def traced_page(self, trace):
+        operations = [
+            {
+                "operation_type": "regex_replace",
+                "operation": {"regex_replace": [{"regex": ",", "replacement": ""}]},
+            },
+            {"operation_type": "delete_rows", "operation": {"delete_rows": [{"row_indices": [0]}]}},
+            {
+                "operation_type": "map_column",
+                "operation": {"map_column": [{"header_name": "Amount", "column_index": [1]}]},
+            },
+        ]
+        rows = [["Date", "Amt"], ["01/02", "1,200.00"], ["02/02", "3.00"]]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reference.process_gemini_response(
+                {"operations": operations},
+                PageTable(1, rows),
+                os.path.join(tmp_dir, "page.csv"),
+                self.page_logger,
+                trace=trace,
+            )
+        return [
+            json.loads(message.split(" ", 2)[2])
+            for message in self.handler.messages
+            if message.startswith("[DEBUG] [TRACE]")
+        ]
+
+    def test_diff_records_changed_cells_shapes_and_headers(self):
+        self.assertEqual(
+            self.traced_page("diff"),
+            [
+                {"op": "regex_replace", "shape": [3, 2], "changed": 1, "cells": [[1, 1, "1,200.00", "1200.00"]]},
+                {"op": "delete_rows", "shape": [[3, 2], [2, 2]]},
+                {"op": "map_column", "shape": [2, 2], "changed": 0, "cells": [], "header": ["Date", "Amount"]},
+            ],
+        )
+
+    def test_off_and_disabled_level_skip_snapshots_and_formatting(self):
+        self.assertEqual(self.traced_page("off"), [])
+
+        self.handler.messages = []
+        self.page_logger.setLevel(logging.WARNING)
+        trace = OperationTrace(self.page_logger, "diff")
+        matrix = np.array([["a"]], dtype=object)
+        trace.start(matrix, matrix[0])
+        self.assertFalse(trace.enabled)
+        self.assertIsNone(trace._before)
+        self.traced_page("full")
+        self.assertEqual(self.handler.messages, [])
+
+
+class DedupViewTest(TestCase):
+    """Re-uploads are only answered from complete results stored by content."""
+
+    def setUp(self):
+        from PyPDF2 import PdfWriter
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        self.pdf_bytes = buffer.getvalue()
+
+    def dirs(self, pdf_file):
+        storage_dir = os.path.join(self.tmp_dir, pdf_file.name)
+        paths = [os.path.join(storage_dir, name) for name in ("upload", "images", "final", "temp", "xml", "pages")]
+        for path in paths:
+            os.makedirs(path, exist_ok=True)
+        return (storage_dir, *paths)
+
+    def upload(self, name, failed_pages=(), **fields):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from . import views
+
+        page_csv = os.path.join(self.tmp_dir, f"{name}_page_1.csv")
+        with open(page_csv, "w", encoding="utf-8") as f:
+            f.write("Date,Amount\n01/02,12.50\n")
+        job = mock.Mock(column_map=["Date", "Amount"], failed_pages=set(failed_pages))
+        job.page_classifier.skipped = []
+        pipeline = mock.Mock(errors={})
+        pipeline.run.return_value = {1: page_csv}
+
+        request = RequestFactory().post(
+            "/",
+            {
+                "user_email": "user@example.com",
+                "pdf_file": SimpleUploadedFile(f"{name}.pdf", self.pdf_bytes),
+                **fields,
+            },
+        )
+        patches = {
+            "create_dirs": self.dirs,
+            "result_csv_path": lambda h, v: os.path.join(self.tmp_dir, f"{h}-{v}.csv"),
+            "pipeline_version": mock.Mock(return_value="v1"),
+            "default_storage": mock.Mock(
+                save=lambda name, content: name,
+                path=lambda name: os.path.join(self.tmp_dir, name),
+            ),
+            "StatementJob": mock.Mock(return_value=job),
+            "find_header_page": mock.Mock(return_value=1),
+            "filter_pages": mock.Mock(return_value=[1]),
+            "iter_page_images": mock.Mock(),
+            "build_page_pipeline": mock.Mock(return_value=pipeline),
+            "EmailService": mock.Mock(),
+            "render": mock.Mock(return_value="error page"),
+        }
+        with ExitStack() as stack:
+            for name, value in patches.items():
+                stack.enter_context(mock.patch.object(views, name, value))
+            response = views.AzureExtractorView(request)
+        self.statement_job = patches["StatementJob"]
+        self.pipeline_version = patches["pipeline_version"]
+        build, email = patches["build_page_pipeline"], patches["EmailService"]
+        return response, build.call_count, email.return_value
+
+    def test_only_complete_results_are_reused(self):
+        from .models import ExtractedDataUsingAzure
+
+        _, built, _ = self.upload("outage", failed_pages=[2])
+        self.assertEqual(built, 1)
+        self.assertIsNone(ExtractedDataUsingAzure.objects.get(pdf_name="outage").content_hash)
+
+        _, built, _ = self.upload("statement")
+        self.assertEqual(built, 1)
+
+        response, built, email = self.upload("copy")
+        self.assertEqual(built, 0)
+        self.assertEqual(response.content, b"Date,Amount\n01/02,12.5\n")
+        record = ExtractedDataUsingAzure.objects.get(pdf_name="copy")
+        self.assertTrue(record.extracted_csv_path.endswith("-v1.csv"))
+        self.assertEqual(
+            email.send_processing_complete_notification.call_args.kwargs["record_count"], 1
+        )
+
+    def test_operation_trace_is_a_request_option(self):
+        # An incomplete result, so the next upload is processed again
+        self.upload("traced", failed_pages=[2], operation_trace="Full")
+        self.assertEqual(self.statement_job.call_args.kwargs["operation_trace"], "full")
+        self.upload("default")
+        self.assertIsNone(self.statement_job.call_args.kwargs["operation_trace"])
+
+        response, built, _ = self.upload("verbose", operation_trace="verbose")
+        self.assertEqual((response, built), ("error page", 0))
+        self.statement_job.assert_not_called()
+
+    def test_table_encoding_is_a_request_option(self):
+        self.upload("tsv", failed_pages=[2], table_encoding="TSV")
+        self.assertEqual(self.statement_job.call_args.kwargs["encoding"], "tsv")
+        self.pipeline_version.assert_called_once_with("tsv")
+        self.upload("default", failed_pages=[2])
+        self.assertIsNone(self.statement_job.call_args.kwargs["encoding"])
+
+        response, built, _ = self.upload("yaml", table_encoding="yaml")
+        self.assertEqual((response, built), ("error page", 0))
+        self.statement_job.assert_not_called()
+
+
+class ConcurrentPagesTest(TestCase):
+    """Pages cleaned concurrently give the same results as pages cleaned one by one."""
+
+    pages = 6
+
+    def setUp(self):
+        from PyPDF2 import PdfWriter
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        writer = PdfWriter()
+        for _ in range(self.pages):
+            writer.add_blank_page(width=200, height=200)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        self.pdf_bytes = buffer.getvalue()
+
+    def delay(self, page_num):
+        """Later pages finish first, so concurrent stages complete out of order."""
+        time.sleep(0.01 * (self.pages - page_num))
+
+    def run_statement(self, workers):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from . import views
+        from .processing.azure.ocr_tool import AzureAgent
+        from .processing.pipeline import page_task
+
+        run_dir = os.path.join(self.tmp_dir, f"workers_{workers}")
+        paths = [os.path.join(run_dir, name) for name in ("upload", "images", "final", "temp", "xml", "pages")]
+        for path in paths:
+            os.makedirs(path)
+
+        def save(name, content):
+            with open(os.path.join(run_dir, name), "wb") as f:
+                f.write(content.read())
+            return name
+
+        ocr_pool = ThreadPoolExecutor(max_workers=self.pages)
+        self.addCleanup(ocr_pool.shutdown)
+
+        def submit_page_tables(agent, page_num, png_bytes, page_logger=None):
+            def read():
+                self.delay(page_num)
+                rows = [["Date", "Details", "Amount"]] + [
+                    [f"0{row}/0{page_num}/2024", f"Payment {page_num}.{row}", f"1,00{row}.50"]
+                    for row in range(1, 4)
+                ]
+                table = azure_table(rows)
+                table["rowCount"] = len(rows)
+                return [table]
+
+            return ocr_pool.submit(read)
+
+        class StubGemini:
+            def __init__(self, retry_budget=None):
+                pass
+
+            def call_gemini(gemini, image, **kwargs):
+                self.delay(image.page_num)
+                return {
+                    "operations": [
+                        {"operation_type": "delete_rows", "operation": {"delete_rows": [{"row_indices": [0]}]}},
+                        {
+                            "operation_type": "regex_replace",
+                            "operation": {"regex_replace": [{"regex": ",", "replacement": ""}]},
+                        },
+                        {
+                            "operation_type": "map_column",
+                            "operation": {
+                                "map_column": [
+                                    {"header_name": "Date", "column_index": [0]},
+                                    {"header_name": "Details", "column_index": [1]},
+                                    {"header_name": "Amount", "column_index": [2]},
+                                ]
+                            },
+                        },
+                    ]
+                }
+
+            def cache_response(gemini, json_response):
+                pass
+
+        def find_header_page(job, num_pages):
+            page_task.set_column_map(
+                job,
+                1,
+                [
+                    {"index": 0, "headers": "Date"},
+                    {"index": 1, "headers": "Details"},
+                    {"index": 2, "headers": "Amount"},
+                ],
+            )
+            return 1
+
+        def render_range(job, pdf_path, first_page, last_page):
+            return {
+                page_num: mock.Mock(page_num=page_num, png_bytes=b"")
+                for page_num in range(first_page, last_page + 1)
+            }
+
+        build_page_pipeline = page_task.build_page_pipeline
+        runs = []
+
+        def build_and_record(job, page_numbers):
+            pipeline = build_page_pipeline(job, page_numbers)
+            run = pipeline.run
+            pipeline.run = lambda items: runs.append(run(items)) or runs[-1]
+            return pipeline
+
+        request = RequestFactory().post(
+            "/", {"pdf_file": SimpleUploadedFile("statement.pdf", self.pdf_bytes)}
+        )
+        environ = {
+            "AZURE_OCR_BACKEND": "threads",
+            "AZURE_OCR_MODE": "pages",
+            "AZURE_OCR_WORKERS": str(workers),
+            "EXTRACTOR_PAGE_WORKERS": str(workers),
+            "EXTRACTOR_TEXT_LAYER": "false",
+        }
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.dict(os.environ, environ))
+            for name, value in {
+                "create_dirs": lambda pdf_file: (run_dir, *paths),
+                "result_csv_path": lambda h, v: os.path.join(run_dir, f"{h}-{v}.csv"),
+                "default_storage": mock.Mock(
+                    save=save, path=lambda name: os.path.join(run_dir, name)
+                ),
+                "find_header_page": find_header_page,
+                "build_page_pipeline": build_and_record,
+                "render": lambda request, template, context: self.fail(context["message"]),
+            }.items():
+                stack.enter_context(mock.patch.object(views, name, value))
+            stack.enter_context(mock.patch.object(page_task, "GeminiAgent", StubGemini))
+            stack.enter_context(mock.patch.object(page_task, "render_range_in_memory", render_range))
+            stack.enter_context(mock.patch.object(AzureAgent, "submit_page_tables", submit_page_tables))
+            response = views.AzureExtractorView(request)
+        (page_results,) = runs
+        page_csvs = {
+            page_num: open(path, encoding="utf-8").read() for page_num, path in page_results.items()
+        }
+        return list(page_results), page_csvs, response.content
+
+    def test_page_workers_do_not_change_the_result(self):
+        sequential = self.run_statement(1)
+        concurrent = self.run_statement(4)
+        self.assertEqual(sequential[0], list(range(1, self.pages + 1)))
+        self.assertEqual(concurrent, sequential)
+        self.assertTrue(sequential[2].startswith(b"Date,Details,Amount\n01/01/2024,Payment 1.1,1001.5\n"))
+        self.assertTrue(sequential[2].endswith(b"03/06/2024,Payment 6.3,1003.5\n"))
+
+
+class PipelineVersionTest(SimpleTestCase):
+    def test_table_reading_settings_change_the_version(self):
+        from .processing.pipeline.version import pipeline_version
+
+        with mock.patch.dict(os.environ, {}, clear=False):
+            for name in (
+                "AZURE_OCR_MODE",
+                "EXTRACTOR_TEXT_LAYER",
+                "EXTRACTOR_PAGE_FILTER",
+                "EXTRACTOR_LOCAL_HEADERS",
+                "EXTRACTOR_LOCAL_HEADER_MIN_CONFIDENCE",
+                "LAYOUT_FINGERPRINTS",
+            ):
+                os.environ.pop(name, None)
+            baseline = pipeline_version()
+            for environ in (
+                {"AZURE_OCR_MODE": "chunked"},
+                {"EXTRACTOR_TEXT_LAYER": "true"},
+                {"EXTRACTOR_PAGE_FILTER": "off"},
+                {"EXTRACTOR_LOCAL_HEADERS": "on"},
+                {"LAYOUT_FINGERPRINTS": "false"},
+            ):
+                with mock.patch.dict(os.environ, environ):
+                    self.assertNotEqual(pipeline_version(), baseline, environ)
+            with mock.patch.dict(os.environ, {"EXTRACTOR_LOCAL_HEADERS": "on"}):
+                local_headers = pipeline_version()
+                os.environ["EXTRACTOR_LOCAL_HEADER_MIN_CONFIDENCE"] = "0.5"
+                self.assertNotEqual(pipeline_version(), local_headers)
+            # Shadow mode does not change any result
+            with mock.patch.dict(os.environ, {"EXTRACTOR_LOCAL_HEADERS": "shadow"}):
+                self.assertEqual(pipeline_version(), baseline)
+            self.assertEqual(pipeline_version(), baseline)
+
+
+def azure_table(rows):
+    return {
+        "columnCount": max(len(row) for row in rows),
+        "cells": [
+            {"rowIndex": r, "columnIndex": c, "content": content}
+            for r, row in enumerate(rows)
+            for c, content in enumerate(row)
+        ],
+    }
+
+
+class ClassifyPageTest(SimpleTestCase):
+    def test_classify_text(self):
+        from .processing.pre.classify_page import (
+            NON_TRANSACTION,
+            TRANSACTION,
+            UNCERTAIN,
+            classify_text,
+        )
+
+        amounts = ("1.234,56", "12,50", "1 250,00")
+        rows = "\n".join(
+            f"0{day}/02/2024 Card payment {amount}" for day, amount in enumerate(amounts, 1)
+        )
+        self.assertEqual(classify_text(rows)[0], TRANSACTION)
+        terms = "Terms and conditions apply to every account held with the bank. " * 2
+        self.assertEqual(classify_text(terms)[0], NON_TRANSACTION)
+        # Whole amounts without a date keep a page
+        self.assertEqual(classify_text(terms + "Overdraft fee 1500")[0], UNCERTAIN)
+        self.assertEqual(classify_text(terms + "Opened 01/02/2024")[0], UNCERTAIN)
+        self.assertEqual(classify_text("1,234.56")[0], UNCERTAIN)
+
+    def test_classify_tables(self):
+        from .processing.pre.classify_page import (
+            NON_TRANSACTION,
+            TRANSACTION,
+            UNCERTAIN,
+            classify_tables,
+        )
+
+        self.assertEqual(classify_tables([])[0], NON_TRANSACTION)
+        european = azure_table([
+            ["01.02.2024", "Rent", "1.234,56"],
+            ["02.02.2024", "Coffee", "3,50"],
+            ["03.02.2024", "Salary", "2 500,00"],
+        ])
+        self.assertEqual(classify_tables([european])[0], TRANSACTION)
+        # Dates alone are not amounts
+        dates_only = azure_table([["01/02/2024", "Opened", "Savings"]] * 3)
+        self.assertEqual(classify_tables([dates_only])[0], UNCERTAIN)
+        self.assertEqual(classify_tables([azure_table([["Fee", "USD 12", "Monthly"]])])[0], UNCERTAIN)
+        contact = azure_table([["Phone", "Branch", "Hours"], ["See website", "Any", "Weekdays"]])
+        self.assertEqual(classify_tables([contact])[0], NON_TRANSACTION)
+
+    def test_shadow_mode_is_the_default_and_keeps_pages(self):
+        from .processing.pre.classify_page import PageClassifier
+
+        text_layer = mock.Mock(**{"text.return_value": "Terms and conditions " * 5})
+        with mock.patch.dict(os.environ):
+            os.environ.pop("EXTRACTOR_PAGE_FILTER", None)
+            classifier = PageClassifier(text_layer)
+        self.assertEqual(classifier.mode, "shadow")
+        self.assertFalse(classifier.should_skip(1))
+        self.assertTrue(PageClassifier(text_layer, mode="on").should_skip(1))
+
+
+class LocalHeaderTest(SimpleTestCase):
+    def header_table(self, header, rows):
+        table = azure_table([header] + rows)
+        for cell in table["cells"]:
+            cell["kind"] = "columnHeader" if cell["rowIndex"] == 0 else "content"
+        table["rowCount"] = len(rows) + 1
+        return table
+
+    def detect(self, *tables):
+        from .processing.azure.local_header import detect_header_locally
+
+        header, confidence = detect_header_locally(list(tables), quiet_logger)
+        return [item["headers"] for item in header], confidence
+
+    def test_transaction_header_with_transaction_rows(self):
+        rows = [
+            [f"0{day}/02/2024", f"Card payment {day}", "12.50", "1,234.56"] for day in range(1, 4)
+        ]
+        header = ["Date", "Description", "Debit", "Balance"]
+        self.assertEqual(self.detect(self.header_table(header, rows)), (header, 1.0))
+        # Too few rows below the header to trust it
+        self.assertEqual(self.detect(self.header_table(header, rows[:2])), ([], 0.0))
+
+    def test_summary_table_is_not_a_transaction_header(self):
+        summary = self.header_table(
+            ["Opening balance", "Date", "Total credit", "Closing balance"],
+            [["1,000.00", f"0{day}/02/2024", "250.00", "1,250.00"] for day in range(1, 4)],
+        )
+        self.assertEqual(self.detect(summary), ([], 0.0))
+
+        # The transaction table below the summary still wins
+        header = ["Date", "Details", "Amount", "Balance"]
+        transactions = self.header_table(
+            header, [[f"0{day}/02/2024", "Rent", "100.00", "900.00"] for day in range(1, 4)]
+        )
+        self.assertEqual(self.detect(summary, transactions), (header, 1.0))
+
+    def test_empty_header_cells_keep_their_column(self):
+        from .processing.azure.local_header import detect_header_locally
+
+        header = ["Date", "", "Description", "Amount", "Balance"]
+        table = self.header_table(
+            header,
+            [[f"0{day}/02/2024", "POS", "Coffee", "3.50", "96.50"] for day in range(1, 4)],
+        )
+        items, _ = detect_header_locally([table], quiet_logger)
+        self.assertEqual(
+            [(item["index"], item["headers"]) for item in items], list(enumerate(header))
+        )
+
+    def test_shadow_mode_is_the_default_and_never_skips_gemini(self):
+        from .processing.azure.local_header import local_header_mode
+        from .processing.pipeline import page_task
+
+        rows = [[f"0{day}/02/2024", "Rent", "100.00", "900.00"] for day in range(1, 4)]
+        tables = [self.header_table(["Date", "Details", "Amount", "Balance"], rows)]
+        gemini_header = [{"index": 0, "headers": "Date"}]
+        job = mock.Mock(page_tables={}, **{"page_classifier.should_skip.return_value": False})
+        with mock.patch.dict(os.environ, {"LAYOUT_FINGERPRINTS": "false"}), ExitStack() as stack:
+            os.environ.pop("EXTRACTOR_LOCAL_HEADERS", None)
+            stack.enter_context(mock.patch.object(page_task, "render_page"))
+            stack.enter_context(mock.patch.object(page_task, "read_page_tables", return_value=tables))
+            gemini = stack.enter_context(
+                mock.patch.object(
+                    page_task, "extract_header_using_gemini", return_value=(gemini_header, True)
+                )
+            )
+            self.assertEqual(local_header_mode(), "shadow")
+            self.assertEqual(page_task.detect_header(job, 1), gemini_header)
+            self.assertEqual(gemini.call_count, 1)
+
+            os.environ["EXTRACTOR_LOCAL_HEADERS"] = "on"
+            self.assertEqual(len(page_task.detect_header(job, 1)), 4)
+            self.assertEqual(gemini.call_count, 1)
+
+
+class PageTableTest(SimpleTestCase):
+    rows = [
+        ["Date", "Ref", "Details", "Amount"],
+        ["01/02/2024", "0012", "Coffee", "3.50"],
+        ["02/02/2024", "0007", "Fee", "1.00"],
+        ["03/02/2024", "0100", "Rent", "900.00"],
+    ]
+
+    def clean(self, operations, page_table):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "page.csv")
+            reference.process_gemini_response(
+                {"operations": operations}, page_table, path, quiet_logger
+            )
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+
+    def test_ocr_strings_keep_their_leading_zeros(self):
+        from .processing.azure.ocr_tool import AzureAgent
+        from .processing.post.table_encoding import encode_table
+
+        table = azure_table(self.rows)
+        table["rowCount"] = len(self.rows)
+        df = AzureAgent(max_workers=1).build_page_dataframe(1, [table], page_logger=quiet_logger)
+        page_table = PageTable.from_dataframe(1, df)
+        # Preceded by the row of Azure's columnHeader cells, empty here
+        self.assertEqual(page_table.rows, [[""] * 4] + self.rows)
+        self.assertEqual(page_table.to_matrix()[2, 1], "0012")
+        for encoding in ("xml", "tsv", "json"):
+            self.assertIn("0012", encode_table(page_table.rows, encoding), encoding)
+
+        csv = self.clean(
+            [
+                {"operation_type": "delete_rows", "operation": {"delete_rows": [{"row_indices": [0]}]}},
+                {
+                    "operation_type": "map_column",
+                    "operation": {
+                        "map_column": [
+                            {"header_name": name, "column_index": [index]}
+                            for index, name in enumerate(self.rows[0])
+                        ]
+                    },
+                },
+            ],
+            page_table,
+        )
+        self.assertIn("01/02/2024,0012,Coffee,3.50\n", csv)
+        self.assertIn("02/02/2024,0007,Fee,1.00\n", csv)
+
+    def test_prompt_row_indices_are_the_indices_operations_use(self):
+        from .processing.post.table_encoding import encode_table
+
+        page_table = PageTable(1, self.rows)
+        prompt_indices = {
+            "xml": re.search(r"<row_(\d+)>(?:(?!</row_).)*>Fee<", encode_table(self.rows, "xml"), re.S),
+            "tsv": re.search(r"^(\d+)\t[^\n]*\tFee\t", encode_table(self.rows, "tsv"), re.M),
+        }
+        prompt_indices = {encoding: int(match.group(1)) for encoding, match in prompt_indices.items()}
+        prompt_indices["json"] = json.loads(encode_table(self.rows, "json")).index(self.rows[2])
+        self.assertEqual(set(prompt_indices.values()), {2})
+
+        for encoding, index in prompt_indices.items():
+            csv = self.clean(
+                [
+                    {
+                        "operation_type": "delete_rows",
+                        "operation": {"delete_rows": [{"row_indices": [0, index]}]},
+                    },
+                    {
+                        "operation_type": "map_column",
+                        "operation": {
+                            "map_column": [
+                                {"header_name": "Details", "column_index": [2]},
+                                {"header_name": "Amount", "column_index": [3]},
+                            ]
+                        },
+                    },
+                ],
+                page_table,
+            )
+            self.assertNotIn("Fee", csv, encoding)
+            self.assertIn("Coffee", csv, encoding)
+            self.assertIn("Rent", csv, encoding)
+
+
+class HeaderSearchTest(SimpleTestCase):
+    def test_cancelled_detection_does_not_read_tables(self):
+        from .processing.pipeline import page_task
+
+        cancelled = threading.Event()
+        job = mock.Mock(**{"page_classifier.should_skip.return_value": False})
+        with mock.patch.object(
+            page_task, "render_page", side_effect=lambda job, page_num: cancelled.set()
+        ), mock.patch.object(page_task, "read_page_tables") as read_tables:
+            self.assertIsNone(page_task.detect_header(job, 2, cancelled))
+        read_tables.assert_not_called()
+
+    def test_running_detections_finish_before_the_search_returns(self):
+        from .processing.pipeline import header_search
+
+        job = mock.Mock(page_images={}, page_tables={})
+        released = threading.Event()
+
+        def detect_header(job, page_num, cancelled):
+            if page_num == 1:
+                released.wait(1)
+                return [{"index": 0, "headers": "Date"}]
+            released.set()
+            # A later page still finishing its OCR call
+            time.sleep(0.05)
+            job.page_tables[page_num] = ["tables"]
+            return None
+
+        with mock.patch.object(header_search, "detect_header", detect_header), \
+                mock.patch.object(header_search, "set_column_map"):
+            self.assertEqual(header_search.find_header_page(job, 2, window=2), 1)
+            self.assertEqual(job.page_tables, {2: ["tables"]})
+
+    def test_failed_detection_moves_on_to_the_next_page(self):
+        from .processing.pipeline import header_search
+
+        job = mock.Mock(page_images={}, page_tables={}, failed_pages=set())
+
+        def detect_header(job, page_num, cancelled):
+            if page_num == 1:
+                raise RuntimeError("Gemini unavailable")
+            return [{"index": 0, "headers": "Date"}] if page_num == 3 else None
+
+        for window in (1, 2):
+            with mock.patch.object(header_search, "detect_header", detect_header), \
+                    mock.patch.object(header_search, "set_column_map") as set_column_map:
+                self.assertEqual(header_search.find_header_page(job, 4, window=window), 3)
+            set_column_map.assert_called_once_with(job, 3, [{"index": 0, "headers": "Date"}])
+            self.assertEqual(job.failed_pages, {1})
+
+    def test_invalid_header_window_falls_back_to_the_default(self):
+        from .processing.pipeline.header_search import DEFAULT_HEADER_WINDOW, header_window
+
+        for value, expected in (("abc", DEFAULT_HEADER_WINDOW), ("0", 1), ("5", 5)):
+            with mock.patch.dict(os.environ, {"EXTRACTOR_HEADER_WINDOW": value}):
+                self.assertEqual(header_window(), expected)
+
+
+class StagedPipelineTest(SimpleTestCase):
+    def test_future_results_are_collected_without_a_thread_per_page(self):
+        from concurrent.futures import Future
+        from .processing.pipeline.staged_pipeline import Stage, StagedPipeline
+
+        futures = {}
+
+        def submit(page_num, payload):
+            futures[page_num] = Future()
+            if len(futures) == 6:
+                # Finish in reverse order once every page has been submitted
+                for number in sorted(futures, reverse=True):
+                    if number == 3:
+                        futures[number].set_exception(RuntimeError("OCR failed"))
+                    else:
+                        futures[number].set_result(number * 10)
+            return futures[page_num]
+
+        pipeline = StagedPipeline(
+            [
+                Stage("ocr", submit, workers=1, max_pending=6),
+                Stage("clean", lambda page_num, payload: payload + 1, workers=1),
+            ]
+        )
+        results = pipeline.run((page_num, page_num) for page_num in range(1, 7))
+
+        self.assertEqual(results, {1: 11, 2: 21, 3: None, 4: 41, 5: 51, 6: 61})
+        self.assertEqual(pipeline.errors, {3: "ocr"})
+        stats = pipeline.stats()["ocr"]
+        # The sixth future is already done when it is returned
+        self.assertEqual((stats["peak_pending"], stats["processed"], stats["failed"]), (5, 5, 1))
+
+
+class RenderPdfTest(SimpleTestCase):
+    def test_group_page_ranges(self):
+        from .processing.pre.render_pdf import group_page_ranges
+
+        self.assertEqual(group_page_ranges([2, 3, 4, 5, 7], 3), [(2, 4), (5, 5), (7, 7)])
+        self.assertEqual(group_page_ranges([7, 3, 2, 4], 4), [(2, 4), (7, 7)])
+        self.assertEqual(group_page_ranges([1, 2, 3], 1), [(1, 1), (2, 2), (3, 3)])
+        self.assertEqual(group_page_ranges([], 4), [])
+
+    def test_pages_are_yielded_in_order_with_bounded_ranges_in_flight(self):
+        from .processing.pre.render_pdf import iter_rendered_pages
+
+        started = []
+
+        def render_range(pdf_path, first_page, last_page):
+            started.append(first_page)
+            # Earlier ranges finish last
+            time.sleep(0.02 / first_page)
+            return {page_num: f"image {page_num}" for page_num in range(first_page, last_page + 1)}
+
+        pages = iter_rendered_pages(
+            "statement.pdf", [6, 1, 2, 3, 4, 5], render_range, chunk_size=1, max_workers=2
+        )
+        for pulled, (page_num, image) in enumerate(pages, 1):
+            self.assertEqual((page_num, image), (pulled, f"image {pulled}"))
+            # A consumer that stops pulling stops rendering
+            time.sleep(0.03)
+            self.assertLessEqual(len(started), pulled + 2)
+        self.assertEqual(sorted(started), [1, 2, 3, 4, 5, 6])
+
+    def test_invalid_settings_fall_back_to_working_values(self):
+        from .processing.pre.render_pdf import iter_rendered_pages
+
+        render_range = lambda pdf_path, first, last: {page: page for page in range(first, last + 1)}
+        for chunk_size, workers in (("abc", "x"), ("0", "0"), ("-2", "")):
+            environ = {"EXTRACTOR_RENDER_CHUNK_SIZE": chunk_size, "EXTRACTOR_RENDER_WORKERS": workers}
+            with mock.patch.dict(os.environ, environ):
+                pages = list(iter_rendered_pages("statement.pdf", [1, 2, 3], render_range))
+            self.assertEqual(pages, [(1, 1), (2, 2), (3, 3)])
+
+
+class ChunkedOcrTest(SimpleTestCase):
+    def test_chunks_are_submitted_up_front_and_read_without_page_images(self):
+        from concurrent.futures import Future
+        from types import SimpleNamespace
+        from .processing.azure.ocr_tool import ChunkedDocumentOcr
+        from .processing.pipeline import page_task
+
+        started = []
+        release = threading.Event()
+
+        def analyze_document(document, label, page_logger=None, pages=None):
+            started.append(pages)
+            release.wait(1)
+            if pages == "21-25":
+                return None
+            first_page = int(pages.split("-")[0])
+            region = [{"pageNumber": first_page}]
+            cell = {"rowIndex": 0, "columnIndex": 0, "content": "x", "boundingRegions": region}
+            table = {"boundingRegions": region, "columnCount": 1, "cells": [cell]}
+            return SimpleNamespace(tables=[table])
+
+        agent = mock.Mock(backend="sync", max_workers=8, analyze_document=analyze_document)
+        ocr = ChunkedDocumentOcr(agent, "statement.pdf", range(1, 26), chunk_size=10)
+        # All three chunks are in flight before any page asks for its tables
+        for _ in range(100):
+            if len(started) == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(started), ["1-10", "11-20", "21-25"])
+        release.set()
+
+        job = mock.Mock(page_tables={})
+        page_image = mock.Mock(spec=["page_num"])
+
+        def tables(page_num):
+            # page_image has no png_bytes, so encoding it would fail
+            result = page_task.ocr_page(job, ocr, page_num, page_image)
+            return (result.result() if isinstance(result, Future) else result)[1]
+
+        with mock.patch.object(page_task, "text_layer_enabled", return_value=False):
+            self.assertEqual(len(tables(11)), 1)
+            self.assertEqual(tables(12), [])
+            # A failed chunk fails its pages instead of reading as empty
+            self.assertIsNone(tables(22))
+
+
+class TextLayerTest(SimpleTestCase):
+    # Glyphs are 6pt wide while the 5pt font size makes GLYPH_WIDTH estimate 2.5pt
+    SIZE = 5
+    ADVANCE = 6
+
+    def right_aligned(self, text, right, y):
+        from .processing.pre.text_layer import Fragment
+
+        return Fragment(text, right - len(text) * self.ADVANCE, y, self.SIZE)
+
+    def test_group_rows(self):
+        from .processing.pre.text_layer import Fragment, group_rows
+
+        rows = group_rows(
+            [
+                Fragment("Card", 120, 700.5, 10),
+                Fragment("01/02", 50, 700, 10),
+                Fragment("payment", 143, 700, 10),
+                Fragment("12.50", 300, 699, 10),
+                Fragment("Opening balance", 50, 680, 10),
+            ]
+        )
+        self.assertEqual(
+            [[cell.text for cell in row] for row in rows],
+            [["01/02", "Card payment", "12.50"], ["Opening balance"]],
+        )
+
+    def test_build_table_keeps_right_aligned_amounts_in_one_column(self):
+        from .processing.pre.text_layer import Fragment, build_table
+
+        lines = [("Date", "Description", "Debit", "Credit")] + [
+            ("01/02/2024", "Rent", "1,234,567.89", ""),
+            ("02/02/2024", "Coffee", "5.00", ""),
+            ("03/02/2024", "Salary", "", "12.50"),
+            ("04/02/2024", "Refund", "", "9,876,543.21"),
+        ]
+        rows = []
+        for row_index, (date, description, debit, credit) in enumerate(lines):
+            y = 700 - 20 * row_index
+            row = [Fragment(date, 50, y, self.SIZE), Fragment(description, 120, y, self.SIZE)]
+            row += [
+                self.right_aligned(amount, right, y)
+                for amount, right in ((debit, 300), (credit, 400))
+                if amount
+            ]
+            rows.append(row)
+
+        table = build_table(rows)
+        self.assertEqual((table["rowCount"], table["columnCount"]), (5, 4))
+        cells = {(cell["rowIndex"], cell["columnIndex"]): cell["content"] for cell in table["cells"]}
+        self.assertEqual(
+            [cells.get((row_index, 2)) for row_index in range(5)],
+            ["Debit", "1,234,567.89", "5.00", None, None],
+        )
+        self.assertEqual(
+            [cells.get((row_index, 3)) for row_index in range(5)],
+            ["Credit", None, None, "12.50", "9,876,543.21"],
+        )
+
+    def test_font_widths_give_real_extents(self):
+        from .processing.pre.text_layer import glyph_widths, text_width
+
+        font = {"/FirstChar": 48, "/Widths": [556] * 10 + [278]}
+        metrics = glyph_widths(font)
+        self.assertAlmostEqual(text_width("10:", metrics, 10), (556 * 2 + 278) / 100)
+        # Characters outside the table use the average width
+        self.assertAlmostEqual(text_width(".", metrics, 10), sum(font["/Widths"]) / 11 / 100)
+        self.assertIsNone(glyph_widths({}))
+
+
+class GeminiResponseCacheTest(SimpleTestCase):
+    def test_only_programs_that_cleaned_their_page_are_cached(self):
+        from types import SimpleNamespace
+        from .processing.gemini.cleaning import gemini_response
+
+        cache = {}
+        fake_cache = SimpleNamespace(get=cache.get, set=cache.__setitem__)
+        programs = iter([[{"operation_type": "broken"}], [{"operation_type": "fixed"}]])
+
+        def generate(*args, **kwargs):
+            candidate = SimpleNamespace(content=SimpleNamespace(parts=[]))
+            return SimpleNamespace(
+                text=json.dumps({"operations": next(programs)}), candidates=[candidate]
+            )
+
+        image = SimpleNamespace(page_num=1, sha256="page", png_bytes=b"")
+        with mock.patch.object(gemini_response, "get_gemini_client"), \
+                mock.patch.object(gemini_response, "response_cache", return_value=fake_cache), \
+                mock.patch.object(gemini_response, "call_with_backoff", side_effect=generate), \
+                mock.patch.object(gemini_response.types.Part, "from_bytes"):
+            agent = gemini_response.GeminiAgent(bypass_cache=False)
+            agent.call_gemini("<table/>", image, {}, quiet_logger)
+            self.assertEqual(cache, {})
+
+            fixed = agent.call_gemini("<table/>", image, {}, quiet_logger, feedback="- broken")
+            agent.cache_response(fixed)
+            # Stored under the first prompt, so the next run needs no re-prompt
+            self.assertEqual(
+                gemini_response.GeminiAgent(bypass_cache=False).call_gemini(
+                    "<table/>", image, {}, quiet_logger
+                ),
+                [{"operation_type": "fixed"}],
+            )
+
+
+class FakeClock:
+    """Monotonic clock that only moves when a test sleeps or advances it."""
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimiterTest(SimpleTestCase):
+    # Waits are powers of two, so the fake clock advances without rounding
+    def limiter(self, clock, rate=8, burst=2):
+        from .utils import rate_limiter
+
+        with mock.patch.object(rate_limiter, "time", clock):
+            return rate_limiter.AdaptiveRateLimiter("test", rate, burst)
+
+    def test_bucket_allows_a_burst_then_refills_at_the_rate(self):
+        from .utils import rate_limiter
+
+        clock = FakeClock()
+        limiter = self.limiter(clock)
+        with mock.patch.object(rate_limiter, "time", clock):
+            self.assertEqual([limiter._reserve(clock.now) for _ in range(2)], [0, 0])
+            self.assertEqual(limiter._reserve(clock.now), 0.125)
+            clock.sleep(0.0625)
+            self.assertEqual(limiter._reserve(clock.now), 0.0625)
+            # A long idle period refills no more than the burst
+            clock.sleep(10)
+            self.assertEqual([limiter._reserve(clock.now) for _ in range(2)], [0, 0])
+            self.assertGreater(limiter._reserve(clock.now), 0)
+
+            started = clock.now
+            limiter.acquire()
+            self.assertEqual(clock.now - started, 0.125)
+        self.assertEqual(limiter.stats()["calls"], 5)
+
+    def test_throttle_halves_the_rate_and_successes_restore_it(self):
+        from .utils import rate_limiter
+
+        clock = FakeClock()
+        limiter = self.limiter(clock)
+        with mock.patch.object(rate_limiter, "time", clock):
+            limiter.on_throttle(retry_after=3)
+            self.assertEqual(limiter.rate, 4)
+            # The bucket is full, but paused for the Retry-After period
+            self.assertEqual(limiter._reserve(clock.now), 3)
+            clock.sleep(3)
+            self.assertEqual(limiter._reserve(clock.now), 0)
+
+            for _ in range(4):
+                limiter.on_throttle()
+            self.assertEqual(limiter.rate, limiter.min_rate)
+            self.assertEqual(limiter.min_rate, 0.5)
+
+            limiter.on_success()
+            self.assertAlmostEqual(limiter.rate, 0.5 + 8 / 20)
+            for _ in range(30):
+                limiter.on_success()
+            self.assertEqual(limiter.rate, 8)
+        self.assertEqual(limiter.stats()["throttled"], 5)
+
+    def test_backoff_respects_retry_after_and_the_job_budget(self):
+        from types import SimpleNamespace
+        from .utils import rate_limiter
+
+        clock = FakeClock()
+        limiter = self.limiter(clock)
+
+        class Throttled(Exception):
+            status_code = 429
+            response = SimpleNamespace(headers={"Retry-After": "7"})
+
+        outcomes = iter([Throttled(), Throttled(), "ok"])
+
+        def call():
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        def always_throttled():
+            raise Throttled()
+
+        with mock.patch.object(rate_limiter, "time", clock):
+            started = clock.now
+            self.assertEqual(
+                rate_limiter.call_with_backoff(limiter, call, page_logger=quiet_logger), "ok"
+            )
+            # Jitter never retries earlier than Retry-After
+            self.assertGreaterEqual(clock.now - started, 14)
+
+            with self.assertRaises(rate_limiter.RetryBudgetExhausted):
+                rate_limiter.call_with_backoff(
+                    limiter,
+                    always_throttled,
+                    retry_budget=rate_limiter.RetryBudget(max_retries=0),
+                    page_logger=quiet_logger,
+                )
+        self.assertEqual(limiter.stats()["retries"], 2)
+
+
+class DiskCacheTest(SimpleTestCase):
+    def setUp(self):
+        from .utils import disk_cache
+
+        self.clock = FakeClock()
+        patcher = mock.patch.object(disk_cache, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.sqlite3")
+
+    def cache(self, max_bytes, ttl_seconds=None, sweep_interval=100):
+        from .utils.disk_cache import DiskCache
+
+        cache = DiskCache(self.path, max_bytes, ttl_seconds, sweep_interval)
+        self.addCleanup(cache._connection.close)
+        return cache
+
+    def keys(self, cache):
+        return {row[0] for row in cache._connection.execute("SELECT key FROM entries")}
+
+    def test_least_recently_used_entries_are_evicted_past_the_size_limit(self):
+        # Random hex barely compresses, so every entry takes about 240 bytes
+        values = {key: os.urandom(200).hex() for key in "abc"}
+        cache = self.cache(max_bytes=600)
+        for key in "ab":
+            cache.set(key, values[key])
+            self.clock.sleep(1)
+
+        # Reading "a" makes "b" the least recently used entry
+        self.assertEqual(cache.get("a"), values["a"])
+        self.clock.sleep(1)
+        cache.set("c", values["c"])
+        self.assertEqual(self.keys(cache), {"a", "c"})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = self.cache(max_bytes=10_000, ttl_seconds=10, sweep_interval=3)
+        cache.set("old", {"rows": [1, 2]})
+        self.clock.sleep(5)
+        cache.set("new", {"rows": [3]})
+        self.assertEqual(cache.get("old"), {"rows": [1, 2]})
+
+        self.clock.sleep(6)
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual(cache.get("new"), {"rows": [3]})
+        # Expired rows are deleted by the next sweep, however recently they were read
+        cache.set("newer", [])
+        self.assertEqual(self.keys(cache), {"new", "newer"})
+
+    def test_writes_below_the_limit_keep_a_running_total_without_sweeping(self):
+        cache = self.cache(max_bytes=10_000)
+        with mock.patch.object(cache, "_evict", wraps=cache._evict) as evict:
+            cache.set("a", "x" * 100)
+            cache.set("a", os.urandom(100).hex())
+            cache.set("b", [1, 2, 3])
+        evict.assert_not_called()
+        self.assertEqual(cache._total_bytes, cache._stored_bytes())
+
+        # Entries written by another process are counted at the next sweep
+        other = self.cache(max_bytes=10_000)
+        other.set("c", os.urandom(100).hex())
+        cache._evict()
+        self.assertEqual(cache._total_bytes, other._stored_bytes())
+
+    def test_later_calls_with_other_limits_warn_and_apply_them(self):
+        from .utils import disk_cache
+
+        with mock.patch.dict(disk_cache._caches, clear=True), \
+                mock.patch.object(disk_cache, "cache_dir", return_value=os.path.dirname(self.path)):
+            cache = disk_cache.get_disk_cache("limits", 1000, 60)
+            self.addCleanup(cache._connection.close)
+            with self.assertNoLogs(disk_cache.logger, "WARNING"):
+                self.assertIs(disk_cache.get_disk_cache("limits", 1000, 60), cache)
+            with self.assertLogs(disk_cache.logger, "WARNING"):
+                self.assertIs(disk_cache.get_disk_cache("limits", 500, None), cache)
+        self.assertEqual((cache.max_bytes, cache.ttl_seconds), (500, None))
+
+
+class LayoutFingerprintTest(TestCase):
+    HEADERS = ["Date", "Description", "Amount"]
+
+    def page(self, logo_left, body_shade=255):
+        from types import SimpleNamespace
+        from PIL import Image, ImageDraw
+
+        image = Image.new("L", (600, 800), body_shade)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, 600, 160), fill=255)
+        draw.rectangle((logo_left, 20, logo_left + 150, 120), fill=0)
+        return SimpleNamespace(image=image)
+
+    def tables(self, headers):
+        cells = [
+            {"kind": "columnHeader", "columnIndex": index, "content": header}
+            for index, header in enumerate(headers)
+        ]
+        cells.append({"kind": "content", "columnIndex": 0, "content": "01/02/2024"})
+        return [{"cells": cells}]
+
+    def test_letterhead_hash_ignores_the_body_and_tells_banks_apart(self):
+        from .processing.pipeline.layout_fingerprint import PageLayout, hamming_distance
+
+        first = PageLayout.from_page(self.page(20), self.tables(self.HEADERS))
+        same_bank = PageLayout.from_page(self.page(20, body_shade=120), self.tables(self.HEADERS))
+        other_bank = PageLayout.from_page(self.page(420), self.tables(self.HEADERS))
+        self.assertEqual(first.header_cells, self.HEADERS)
+        self.assertEqual(hamming_distance(first.image_hash, same_bank.image_hash), 0)
+        self.assertGreater(hamming_distance(first.image_hash, other_bank.image_hash), 10)
+        # Header text is compared case-insensitively
+        shouting = PageLayout.from_page(self.page(20), self.tables(["DATE", "Description", "AMOUNT"]))
+        self.assertEqual(first.header_signature, shouting.header_signature)
+        self.assertIsNone(PageLayout.from_page(self.page(20), self.tables([])))
+
+    def test_recorded_layouts_are_matched_by_headers_and_letterhead(self):
+        from .models import LayoutFingerprint
+        from .processing.pipeline.layout_fingerprint import (
+            PageLayout,
+            lookup_layout,
+            record_layout,
+        )
+
+        column_map = [{"index": 0, "headers": "Date"}]
+        layout = PageLayout.from_page(self.page(20), self.tables(self.HEADERS))
+        self.assertIsNone(lookup_layout(layout, quiet_logger))
+        record_layout(layout, column_map, quiet_logger)
+
+        same_bank = PageLayout.from_page(self.page(20, body_shade=120), self.tables(self.HEADERS))
+        self.assertEqual(lookup_layout(same_bank, quiet_logger), column_map)
+        other_bank = PageLayout.from_page(self.page(420), self.tables(self.HEADERS))
+        self.assertIsNone(lookup_layout(other_bank, quiet_logger))
+        other_headers = PageLayout.from_page(self.page(20), self.tables(["Date", "Amount"]))
+        self.assertIsNone(lookup_layout(other_headers, quiet_logger))
+
+        fingerprint = LayoutFingerprint.objects.get()
+        self.assertEqual((fingerprint.hits, fingerprint.misses), (1, 1))
+
+
+class TableToXmlTest(SimpleTestCase):
+    def assertMatchesMinidom(self, rows):
+        import pandas as pd
+        from .processing.post.handle_csv_to_xml import dataframe_to_xml, table_to_xml
+
+        expected = dataframe_to_xml(pd.DataFrame(rows))
+        self.assertIsNotNone(expected)
+        self.assertEqual(table_to_xml(rows).encode("utf-8"), expected.encode("utf-8"))
+
+    def test_edge_cases_are_byte_identical_to_minidom(self):
+        self.assertMatchesMinidom([])
+        self.assertMatchesMinidom([["Date", "Description", "Amount"]])
+        self.assertMatchesMinidom(
+            [
+                ["", " ", "  leading and trailing  "],
+                ['Card & Co <REF> "quoted"', "it's > 5", "&amp; already escaped"],
+                ["line\r\nbreak", "carriage\rreturn", "tab\tand\nnewline"],
+                ["Überweisung €12,50", "日本語", "emoji \U0001f4b3"],
+                ["]]>", "<![CDATA[x]]>", "<!-- comment -->"],
+            ]
+        )
+
+    def test_random_cells_are_byte_identical_to_minidom(self):
+        rng = random.Random(0)
+        alphabet = "aZ09 ,.-/&<>\"'\t\r\n€é"
+        for _ in range(20):
+            cols = rng.randint(1, 6)
+            cell = lambda: "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            self.assertMatchesMinidom(
+                [[cell() for _ in range(cols)] for _ in range(rng.randint(1, 8))]
+            )
+
+    def test_characters_xml_cannot_hold_are_dropped(self):
+        from .processing.post.handle_csv_to_xml import table_to_xml
+
+        xml = table_to_xml([["a\x00b\x1fc", "\x0b"]], compact=True)
+        self.assertEqual(
+            xml,
+            '<?xml version="1.0" ?><table><rows>'
+            "<row_0><col_0>abc</col_0><col_1/></row_0>"
+            "</rows></table>",
+        )
+
+
+class TableEncodingTest(SimpleTestCase):
+    def test_jobs_clean_with_their_own_encoding(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .processing.pipeline import page_task
+        from .processing.post.table_encoding import encode_table
+
+        rows = [["Date", "Amount"], ["01/02/2024", "12.50"], ["02/02/2024", "3.00"]]
+        prompts = {}
+
+        class StubGemini:
+            def __init__(self, retry_budget=None):
+                pass
+
+            def call_gemini(self, image, xml_output, encoding, **kwargs):
+                prompts[image.page_num] = (encoding, xml_output)
+                # Both pages ask at once, so neither sees the other's encoding
+                barrier.wait(timeout=5)
+                return {"operations": []}
+
+            def cache_response(self, json_response):
+                pass
+
+        barrier = threading.Barrier(2)
+        with tempfile.TemporaryDirectory() as tmp_dir, ExitStack() as stack:
+            stack.enter_context(mock.patch.dict(os.environ, {"EXTRACTOR_TABLE_ENCODING": "xml"}))
+            stack.enter_context(mock.patch.object(page_task, "GeminiAgent", StubGemini))
+            jobs = {
+                page_num: page_task.StatementJob(
+                    os.path.join(tmp_dir, "statement.pdf"),
+                    tmp_dir, tmp_dir, tmp_dir, tmp_dir, tmp_dir,
+                    encoding=encoding,
+                )
+                for page_num, encoding in ((1, "tsv"), (2, "json"))
+            }
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                results = pool.map(
+                    lambda page_num: page_task.process_page(
+                        jobs[page_num],
+                        page_num,
+                        (mock.Mock(page_num=page_num), PageTable(page_num, rows)),
+                    ),
+                    jobs,
+                )
+                self.assertTrue(all(results))
+        self.assertEqual(
+            prompts,
+            {
+                1: ("tsv", encode_table(rows, "tsv")),
+                2: ("json", encode_table(rows, "json")),
+            },
+        )
+        self.assertEqual(page_task.StatementJob(os.devnull, *[tmp_dir] * 5).encoding, "xml")
@@ -12,9 +12,6 @@ def create_dirs(pdf_name):
     upload_dir = f"{storage_dir}/uploaded_pdf"
     os.makedirs(upload_dir, exist_ok=True)
 
-    split_dir = f"{storage_dir}/split_pdf"
-    os.makedirs(split_dir, exist_ok=True)
-
     extracted_data_dir = f"{storage_dir}/extracted_csv"
     os.makedirs(extracted_data_dir, exist_ok=True)
 
@@ -29,10 +26,25 @@ def create_dirs(pdf_name):
     return (
         storage_dir,
         upload_dir,
-        split_dir,
         image_dir,
         final_csv_dir,
         temp_csv_dir,
         xml_dir,
         extracted_data_dir,
     )
+
+
+RESULTS_DIR = "media/azure/results"
+
+
+def result_csv_path(content_hash, pipeline_version):
+    """
+    Content-addressed path of a statement's final CSV.
+
+    Per-upload directories are keyed by file name and date, so a different PDF
+    uploaded under the same name would overwrite their CSV; re-uploads of the
+    same document are only answered from this path.
+    """
+    results_dir = f"{RESULTS_DIR}/{content_hash[:2]}"
+    os.makedirs(results_dir, exist_ok=True)
+    return f"{results_dir}/{content_hash}-{pipeline_version}.csv"
@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CACHE_DIR = "cache/"
+# Writes between full sweeps, which expire old entries and pick up the sizes
+# written by other processes
+DEFAULT_SWEEP_INTERVAL = 100
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_dir():
+    """Directory of the persistent caches (EXTRACTOR_CACHE_DIR)."""
+    return os.getenv("EXTRACTOR_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+class DiskCache:
+    """
+    Persistent key/value cache in a SQLite file.
+
+    Values are JSON encoded and zlib compressed. Entries older than
+    ``ttl_seconds`` are treated as missing, and once the stored size exceeds
+    ``max_bytes`` the least recently used entries are evicted. The stored
+    size is kept as a running total, so a write only sweeps the table when
+    it pushes the total past the limit or every ``sweep_interval`` writes.
+    SQLite takes care of locking between processes; a lock serialises the
+    threads of one process on the shared connection.
+    """
+
+    def __init__(
+        self, path, max_bytes, ttl_seconds=None, sweep_interval=DEFAULT_SWEEP_INTERVAL
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+            )
+        self._total_bytes = self._stored_bytes()
+
+    def _stored_bytes(self):
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.ttl_seconds is not None and now - row[1] > self.ttl_seconds
+            ):
+                self.misses += 1
+                return None
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key, value):
+        """Store a JSON-serialisable value, evicting old entries past the size limit."""
+        blob = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        with self._lock, self._connection:
+            replaced = self._connection.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._total_bytes += len(blob) - (replaced[0] if replaced else 0)
+            self._writes += 1
+            if self._total_bytes > self.max_bytes or self._writes >= self.sweep_interval:
+                self._evict()
+
+    def _evict(self):
+        self._writes = 0
+        if self.ttl_seconds is not None:
+            self._connection.execute(
+                "DELETE FROM entries WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+        # Resynchronise with the writes of other processes
+        total = self._total_bytes = self._stored_bytes()
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._total_bytes = total
+        logger.info(
+            f"[DEBUG] [DISK_CACHE] Evicted {evicted} entries from {self.path}, "
+            f"{total} bytes left"
+        )
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def get_disk_cache(name, max_bytes, ttl_seconds=None):
+    """
+    Return the process-wide ``DiskCache`` called ``name``.
+
+    A later call with different limits applies them to the shared instance
+    and logs a warning, since every caller of the cache is affected.
+
+    Args:
+        name (str): Cache name, also the file name under ``cache_dir()``
+        max_bytes (int): Size limit of the compressed values
+        ttl_seconds (float, optional): Age after which entries expire
+
+    Returns:
+        DiskCache: Shared cache instance
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(
+                os.path.join(cache_dir(), f"{name}.sqlite3"), max_bytes, ttl_seconds
+            )
+        cache = _caches[name]
+    if (cache.max_bytes, cache.ttl_seconds) != (max_bytes, ttl_seconds):
+        logger.warning(
+            f"[WARNING] [DISK_CACHE] Limits of cache {name} changed from "
+            f"max_bytes={cache.max_bytes}, ttl_seconds={cache.ttl_seconds} to "
+            f"max_bytes={max_bytes}, ttl_seconds={ttl_seconds}"
+        )
+        with cache._lock:
+            cache.max_bytes, cache.ttl_seconds = max_bytes, ttl_seconds
+    return cache
@@ -0,0 +1,320 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Requests per second used when no RATE_LIMIT_* variable is set
+DEFAULT_RATES = {"azure": 15.0, "gemini": 10.0}
+DEFAULT_JOB_RETRY_BUDGET = 20
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RetryBudgetExhausted(Exception):
+    """Raised when a job has used up all of its retries."""
+
+
+class RetryBudget:
+    """
+    Retries shared by every call of one statement.
+
+    Caps the total number of retries a job may spend, so a provider outage
+    fails the job quickly instead of multiplying retries across pages.
+    """
+
+    def __init__(self, max_retries=None):
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(os.getenv("EXTRACTOR_JOB_RETRY_BUDGET", DEFAULT_JOB_RETRY_BUDGET))
+        )
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self):
+        """Take one retry from the budget; False when none are left."""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by all workers calling one provider/model.
+
+    Refills at ``rate`` requests per second. A throttled response halves the
+    rate and pauses the bucket for the Retry-After period; every successful
+    call then raises the rate back towards its configured maximum
+    (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = max(rate / 16, 0.1)
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.last_refill = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def _reserve(self, started):
+        """Take a token if one is available, otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= 1:
+                self.tokens -= 1
+                self.calls += 1
+                self.wait_seconds += now - started
+                return 0
+            return max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        started = time.monotonic()
+        while wait := self._reserve(started):
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait on the event loop until a request may be sent."""
+        started = time.monotonic()
+        while wait := self._reserve(started):
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + retry_after
+                )
+        logger.warning(
+            f"[WARNING] [RATE_LIMITER] {self.name} throttled, "
+            f"rate lowered to {self.rate:.2f}/s, retry after {retry_after}"
+        )
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "failures": self.failures,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+def _configured_rate(provider, model):
+    model_key = re.sub(r"[^A-Za-z0-9]+", "_", model or "").upper()
+    for name in (
+        f"RATE_LIMIT_{provider.upper()}_{model_key}_RPS",
+        f"RATE_LIMIT_{provider.upper()}_RPS",
+    ):
+        if os.getenv(name):
+            return float(os.getenv(name))
+    return DEFAULT_RATES.get(provider, 5.0)
+
+
+def get_rate_limiter(provider, model=None):
+    """
+    Return the process-wide limiter for a provider and model.
+
+    Rates come from RATE_LIMIT_<PROVIDER>_<MODEL>_RPS, then
+    RATE_LIMIT_<PROVIDER>_RPS, e.g. RATE_LIMIT_GEMINI_GEMINI_2_5_FLASH_RPS.
+    """
+    key = (provider, model)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdaptiveRateLimiter(
+                f"{provider}:{model}", _configured_rate(provider, model)
+            )
+        return _limiters[key]
+
+
+def rate_limiter_stats():
+    """Throttle and retry counters of every limiter, used to size quotas."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {limiter.name: limiter.stats() for limiter in limiters.values()}
+
+
+def throttle_info(error):
+    """
+    Inspect an SDK error for throttling.
+
+    Works with Azure ``HttpResponseError`` (status_code, response.headers) and
+    google-genai ``APIError`` (code, response.headers).
+
+    Returns:
+        tuple: (status code or None, whether it is a throttle, Retry-After seconds or None)
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = None
+
+    retry_after = None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("Retry-After"):
+            retry_after = float(headers["Retry-After"])
+    except (TypeError, ValueError, AttributeError):
+        retry_after = None
+
+    throttled = status == 429 or "RESOURCE_EXHAUSTED" in str(error)
+    return status, throttled, retry_after
+
+
+def _is_retryable(status, throttled):
+    return throttled or status is None or status == 408 or status >= 500
+
+
+def _retry_delay(
+    limiter, error, attempt, retries, retry_budget, page_logger, label, base_delay, max_delay
+):
+    """
+    Record a failed attempt and return how long to wait before the next one.
+
+    Raises:
+        The error when it is not retried, or RetryBudgetExhausted
+    """
+    status, throttled, retry_after = throttle_info(error)
+    if throttled:
+        limiter.on_throttle(retry_after)
+    page_logger.error(
+        f"[ERROR] [RATE_LIMITER] {label} failed, attempt {attempt}/{retries} "
+        f"(status {status}): {error}"
+    )
+
+    if attempt == retries or not _is_retryable(status, throttled):
+        limiter.record_failure()
+        raise error
+    if retry_budget is not None and not retry_budget.consume():
+        limiter.record_failure()
+        raise RetryBudgetExhausted(
+            f"Job retry budget of {retry_budget.max_retries} exhausted at {label}"
+        ) from error
+
+    # Full jitter, but never earlier than the server asked for
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    delay = max(delay, retry_after or 0)
+    limiter.record_retry()
+    page_logger.info(
+        f"[DEBUG] [RATE_LIMITER] Retrying {label} in {delay:.2f}s, attempt {attempt + 1}"
+    )
+    return delay
+
+
+def call_with_backoff(
+    limiter,
+    call,
+    retries=3,
+    retry_budget=None,
+    page_logger=None,
+    label="",
+    base_delay=1.0,
+    max_delay=60.0,
+):
+    """
+    Call ``call()`` through a rate limiter, retrying with jittered exponential backoff.
+
+    Throttled responses slow the shared limiter down and are retried after at
+    least their Retry-After period. Client errors other than 408/429 are not
+    retried. Every retry is taken from the job's ``retry_budget`` when given.
+
+    Args:
+        limiter (AdaptiveRateLimiter): Limiter of the provider/model being called
+        call (callable): The request to send
+        retries (int): Attempts allowed for this call
+        retry_budget (RetryBudget, optional): Retries shared by the whole job
+        page_logger (Logger, optional): Logger instance for the page
+        label (str): Description of the call, used for logging
+
+    Returns:
+        The return value of ``call()``
+
+    Raises:
+        The last error once the attempts or the job's retry budget are exhausted
+    """
+    page_logger = page_logger or logger
+
+    for attempt in range(1, retries + 1):
+        limiter.acquire()
+        try:
+            result = call()
+            limiter.on_success()
+            return result
+        except Exception as e:
+            delay = _retry_delay(
+                limiter, e, attempt, retries, retry_budget, page_logger, label,
+                base_delay, max_delay,
+            )
+        time.sleep(delay)
+
+
+async def call_with_backoff_async(
+    limiter,
+    call,
+    retries=3,
+    retry_budget=None,
+    page_logger=None,
+    label="",
+    base_delay=1.0,
+    max_delay=60.0,
+):
+    """
+    Coroutine version of ``call_with_backoff`` for ``call()`` returning an awaitable.
+
+    Waiting for the limiter and between attempts happens on the event loop,
+    so no thread is held while a request is throttled or backing off.
+    """
+    page_logger = page_logger or logger
+
+    for attempt in range(1, retries + 1):
+        await limiter.acquire_async()
+        try:
+            result = await call()
+            limiter.on_success()
+            return result
+        except Exception as e:
+            delay = _retry_delay(
+                limiter, e, attempt, retries, retry_budget, page_logger, label,
+                base_delay, max_delay,
+            )
+        await asyncio.sleep(delay)
@@ -0,0 +1,528 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_REGEX_CACHE_SIZE = 256
+DEFAULT_REGEX_TIMEOUT = 0.1
+MAX_PATTERN_LENGTH = 1000
+# A pattern is refused after this many slow calls within REFUSAL_TTL seconds,
+# or at once when a single call overran the timeout LARGE_OVERRUN times
+SLOW_CALLS_TO_REFUSE = 3
+LARGE_OVERRUN = 10
+REFUSAL_TTL = 300
+# Characters tried against single-character items to tell whether two
+# alternatives can start with the same character
+PROBE_CHARACTERS = (
+    "".join(chr(code) for code in range(0x20, 0x7F)) + "\t\n\r\x0b\x0c éÉßü€£Ж中٣"
+)
+PROBE_FLAGS = re.IGNORECASE | re.ASCII | re.DOTALL
+QUANTIFIER = re.compile(r"[*+?]|\{(\d*)(,?)(\d*)\}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class UnsafePatternError(ValueError):
+    """A pattern that could backtrack catastrophically and is never compiled."""
+
+
+def regex_timeout():
+    """Seconds after which a single match or substitution counts as slow (EXTRACTOR_REGEX_TIMEOUT)."""
+    return float(os.getenv("EXTRACTOR_REGEX_TIMEOUT", DEFAULT_REGEX_TIMEOUT))
+
+
+# Structure of a pattern, as far as backtracking is concerned:
+#   ("char", source)           one character, ``source`` matches exactly it
+#   ("empty",)                 anchors, flags and backreferences
+#   ("look", node)             lookaround, zero width
+#   ("seq", [node, ...])
+#   ("alt", [node, ...])
+#   ("repeat", min, max, node, possessive)   max is None when unbounded
+#   ("atomic", node)           cannot be backtracked into
+
+
+class _PatternScanner:
+    """Scan a pattern that ``re`` has already compiled into the structure above."""
+
+    def __init__(self, regex, verbose):
+        self.regex = regex
+        self.verbose = verbose
+        self.pos = 0
+
+    def peek(self, text=None):
+        if text is None:
+            return self.regex[self.pos] if self.pos < len(self.regex) else ""
+        return self.regex.startswith(text, self.pos)
+
+    def alternation(self):
+        branches = [self.sequence()]
+        while self.peek("|"):
+            self.pos += 1
+            branches.append(self.sequence())
+        return branches[0] if len(branches) == 1 else ("alt", branches)
+
+    def sequence(self):
+        items = []
+        while self.pos < len(self.regex) and self.peek() not in "|)":
+            item = self.item()
+            if item is not None:
+                items.append(self.quantified(item))
+        return ("seq", items)
+
+    def skip_verbose(self):
+        while self.verbose and self.pos < len(self.regex):
+            if self.peek().isspace():
+                self.pos += 1
+            elif self.peek("#"):
+                end = self.regex.find("\n", self.pos)
+                self.pos = len(self.regex) if end == -1 else end + 1
+            else:
+                break
+
+    def item(self):
+        self.skip_verbose()
+        if self.pos >= len(self.regex) or self.peek() in "|)":
+            return None
+        char = self.peek()
+        if char == "(":
+            return self.group()
+        if char == "[":
+            return self.char_class()
+        if char == "\\":
+            return self.escape()
+        self.pos += 1
+        if char in "^$":
+            return ("empty",)
+        if char == ".":
+            return ("char", ".")
+        return ("char", re.escape(char))
+
+    def quantified(self, node):
+        self.skip_verbose()
+        match = QUANTIFIER.match(self.regex, self.pos)
+        if not match or match.group(0) == "{}":
+            # "{}" is a literal, like any brace that does not hold a count
+            return node
+        token = match.group(0)
+        if token == "*":
+            low, high = 0, None
+        elif token == "+":
+            low, high = 1, None
+        elif token == "?":
+            low, high = 0, 1
+        else:
+            low = int(match.group(1) or 0)
+            high = int(match.group(3)) if match.group(3) else (None if match.group(2) else low)
+        self.pos = match.end()
+        possessive = self.peek("+")
+        if self.peek() in ("?", "+"):
+            self.pos += 1
+        return ("repeat", low, high, node, possessive)
+
+    def char_class(self):
+        start = self.pos
+        self.pos += 1
+        if self.peek("^"):
+            self.pos += 1
+        if self.peek("]"):
+            self.pos += 1
+        while not self.peek("]"):
+            self.pos += 2 if self.peek("\\") else 1
+        self.pos += 1
+        return ("char", self.regex[start:self.pos])
+
+    def escape(self):
+        start = self.pos
+        self.pos += 2
+        char = self.regex[start + 1]
+        if char in "bBAZ":
+            return ("empty",)
+        if char.isdigit() and char != "0":
+            # Backreference; its width depends on the group it repeats
+            while self.peek().isdigit():
+                self.pos += 1
+            return ("empty",)
+        lengths = {"x": 2, "u": 4, "U": 8}
+        if char in lengths:
+            self.pos += lengths[char]
+        elif char == "N":
+            self.pos = self.regex.index("}", self.pos) + 1
+        elif char == "0":
+            while self.peek().isdigit() and self.pos < start + 4:
+                self.pos += 1
+        return ("char", self.regex[start:self.pos])
+
+    def group(self):
+        self.pos += 1
+        kind = None
+        if self.peek("?"):
+            self.pos += 1
+            if self.peek("#"):
+                self.pos = self.regex.index(")", self.pos) + 1
+                return None
+            if self.peek("P="):
+                self.pos = self.regex.index(")", self.pos) + 1
+                return ("empty",)
+            if self.peek("P<"):
+                self.pos = self.regex.index(">", self.pos) + 1
+            elif self.peek("("):
+                # Conditional group: (?(id)yes|no)
+                self.pos = self.regex.index(")", self.pos) + 1
+            elif self.peek(":"):
+                self.pos += 1
+            elif self.peek(">"):
+                self.pos += 1
+                kind = "atomic"
+            elif self.peek("=") or self.peek("!"):
+                self.pos += 1
+                kind = "look"
+            elif self.peek("<=") or self.peek("<!"):
+                self.pos += 2
+                kind = "look"
+            else:
+                flags = re.compile(r"[aiLmsux]*(?:-[imsx]*)?").match(self.regex, self.pos)
+                self.pos = flags.end()
+                if self.peek(")"):
+                    self.pos += 1
+                    return ("empty",)
+                self.pos += 1
+        node = self.alternation()
+        self.pos += 1
+        return (kind, node) if kind else node
+
+
+def _children(node):
+    kind = node[0]
+    if kind in ("seq", "alt"):
+        return node[1]
+    if kind == "repeat":
+        return [node[3]]
+    if kind in ("look", "atomic"):
+        return [node[1]]
+    return []
+
+
+def _min_width(node):
+    kind = node[0]
+    if kind == "char":
+        return 1
+    if kind == "seq":
+        return sum(_min_width(item) for item in node[1])
+    if kind == "alt":
+        return min(_min_width(branch) for branch in node[1])
+    if kind == "repeat":
+        return node[1] * _min_width(node[3])
+    if kind == "atomic":
+        return _min_width(node[1])
+    return 0
+
+
+def _unbounded(node):
+    return node[0] == "repeat" and node[2] is None and not node[4]
+
+
+def _has_unbounded(node):
+    """Whether backtracking can retry an unbounded repeat inside ``node``."""
+    if node[0] == "atomic" or (node[0] == "repeat" and node[4]):
+        return False
+    return _unbounded(node) or any(_has_unbounded(child) for child in _children(node))
+
+
+@lru_cache(maxsize=1024)
+def _matching_characters(source, flags):
+    compiled = re.compile(source, flags)
+    return frozenset(char for char in PROBE_CHARACTERS if compiled.fullmatch(char))
+
+
+def _first_characters(node, flags):
+    """Probe characters a non-empty match of ``node`` can start with."""
+    kind = node[0]
+    if kind == "char":
+        return _matching_characters(node[1], flags)
+    if kind == "seq":
+        first = frozenset()
+        for item in node[1]:
+            first |= _first_characters(item, flags)
+            if _min_width(item):
+                break
+        return first
+    if kind == "alt":
+        return frozenset().union(*(_first_characters(branch, flags) for branch in node[1]))
+    if kind == "repeat":
+        return _first_characters(node[3], flags) if node[2] != 0 else frozenset()
+    if kind == "atomic":
+        return _first_characters(node[1], flags)
+    return frozenset()
+
+
+def _body_items(node):
+    """Top-level items of a repeated body, looking through plain groups."""
+    while node[0] == "seq" and len(node[1]) == 1 and node[1][0][0] in ("seq", "alt"):
+        node = node[1][0]
+    return node[1] if node[0] == "seq" else [node]
+
+
+def _nested_quantifier(body):
+    """
+    An unbounded repeat of a body that holds another unbounded repeat.
+
+    Such a body can split the same text into iterations in exponentially many
+    ways, unless the rest of the body has to consume at least one character
+    per iteration (``(?:\\d+,)*`` is fine, ``(\\w+\\s?)*`` is not).
+    """
+    items = _body_items(body)
+    rest = [item for item in items if not _has_unbounded(item)]
+    return len(rest) < len(items) and _min_width(("seq", rest)) == 0
+
+
+def _ambiguous_alternation(node, flags):
+    """
+    An alternation whose branches can match the same text at the same position.
+
+    Repeated, such a branch choice doubles the ways to split the text with
+    every iteration (``(a|aa)+``); branches starting with different
+    characters (``(?:Dr|Cr)+``) leave one choice per position.
+    """
+    if node[0] == "atomic" or (node[0] == "repeat" and node[4]):
+        return False
+    if node[0] == "alt":
+        firsts = [_first_characters(branch, flags) for branch in node[1]]
+        if any(_min_width(branch) == 0 for branch in node[1]):
+            return True
+        for index, first in enumerate(firsts):
+            if any(first & other for other in firsts[index + 1:]):
+                return True
+    return any(_ambiguous_alternation(child, flags) for child in _children(node))
+
+
+def _unsafe_repeat(node, flags):
+    """Describe the first unbounded repeat that may backtrack catastrophically."""
+    if _unbounded(node):
+        if _nested_quantifier(node[3]):
+            return "nested quantifier"
+        if _ambiguous_alternation(node[3], flags):
+            return "overlapping alternatives"
+    for child in _children(node):
+        problem = _unsafe_repeat(child, flags)
+        if problem:
+            return problem
+    return None
+
+
+def check_pattern(regex):
+    """
+    Reject patterns that are too long or can backtrack catastrophically.
+
+    Patterns run on the standard ``re`` engine, which cannot be interrupted,
+    so ambiguity is refused before a pattern is ever used: unbounded repeats
+    of a body that can match empty text around another unbounded repeat
+    (``(a+)+$``), and of alternations whose branches can start at the same
+    character (``(a|aa)+$``).
+
+    Raises:
+        re.error: If the pattern does not compile
+        UnsafePatternError: If the pattern is refused
+    """
+    if len(regex) > MAX_PATTERN_LENGTH:
+        raise UnsafePatternError(
+            f"pattern is longer than {MAX_PATTERN_LENGTH} characters"
+        )
+    compiled = re.compile(regex)
+    structure = _PatternScanner(regex, bool(compiled.flags & re.VERBOSE)).alternation()
+    problem = _unsafe_repeat(structure, compiled.flags & PROBE_FLAGS)
+    if problem:
+        raise UnsafePatternError(f"{problem} in {regex!r} may backtrack catastrophically")
+
+
+class TimedPattern:
+    """
+    A compiled ``re`` pattern that reports calls slower than ``timeout`` seconds.
+
+    The standard engine cannot be interrupted, so ``check_pattern`` is what
+    keeps exponential patterns out. ``sub``, ``match``, ``fullmatch`` and
+    ``search`` still return their result when slow; the call is reported to
+    ``on_slow`` so patterns that are slow again and again can be refused.
+    Everything else, such as ``groups`` and ``groupindex``, is the compiled
+    pattern's own.
+    """
+
+    def __init__(self, compiled, timeout, on_slow=None):
+        self.compiled = compiled
+        self.timeout = timeout
+        self._on_slow = on_slow
+
+    def __getattr__(self, name):
+        return getattr(self.compiled, name)
+
+    def _run(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        elapsed = time.perf_counter() - started
+        if elapsed > self.timeout and self._on_slow is not None:
+            self._on_slow(self.compiled.pattern, elapsed)
+        return result
+
+    def sub(self, replacement, string):
+        return self._run(self.compiled.sub, replacement, string)
+
+    def match(self, string):
+        return self._run(self.compiled.match, string)
+
+    def fullmatch(self, string):
+        return self._run(self.compiled.fullmatch, string)
+
+    def search(self, string):
+        return self._run(self.compiled.search, string)
+
+
+def _expired(entry):
+    """Whether a cached refusal of a slow pattern has run out."""
+    return isinstance(entry, tuple) and len(entry) == 3 and time.monotonic() >= entry[2]
+
+
+class RegexCache:
+    """
+    Bounded LRU cache of compiled patterns shared by all page workers.
+
+    Gemini repeats the same few patterns across pages and statements, so each
+    one is checked and compiled once per process. Refused and invalid patterns
+    are cached as well and raise a fresh error on every lookup. A single slow
+    call only costs its own cell, since load or GIL contention can make any
+    pattern slow once; a pattern is refused after ``SLOW_CALLS_TO_REFUSE``
+    slow calls within ``REFUSAL_TTL`` seconds, or after one call that took
+    ``LARGE_OVERRUN`` times the timeout, and the refusal expires after
+    ``REFUSAL_TTL`` seconds.
+    """
+
+    def __init__(self, max_size=DEFAULT_REGEX_CACHE_SIZE, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout or regex_timeout()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.slow_calls = 0
+        self._entries = OrderedDict()
+        # Times of recent slow calls per pattern
+        self._slow_calls = {}
+        self._lock = threading.Lock()
+
+    def _store(self, regex, entry):
+        with self._lock:
+            self._entries[regex] = entry
+            self._entries.move_to_end(regex)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _slow(self, regex, elapsed):
+        """Count a slow call, refusing the pattern for a while once it is slow repeatedly."""
+        now = time.monotonic()
+        with self._lock:
+            self.slow_calls += 1
+            recent = [
+                at for at in self._slow_calls.get(regex, []) if now - at < REFUSAL_TTL
+            ] + [now]
+            refuse = (
+                len(recent) >= SLOW_CALLS_TO_REFUSE
+                or elapsed >= self.timeout * LARGE_OVERRUN
+            )
+            if refuse:
+                self._slow_calls.pop(regex, None)
+                self.rejected += 1
+            else:
+                self._slow_calls[regex] = recent
+        if not refuse:
+            logger.warning(
+                f"[DEBUG] [REGEX_CACHE] Slow pattern {regex!r}: {elapsed:.2f}s "
+                f"({len(recent)}/{SLOW_CALLS_TO_REFUSE} slow calls)"
+            )
+            return
+        message = (
+            f"{regex!r} took {elapsed:.2f}s, longer than {self.timeout}s, "
+            f"and may backtrack catastrophically"
+        )
+        logger.warning(
+            f"[DEBUG] [REGEX_CACHE] Refused pattern for {REFUSAL_TTL}s: {message}"
+        )
+        self._store(regex, (UnsafePatternError, message, now + REFUSAL_TTL))
+
+    def _compile(self, regex):
+        check_pattern(regex)
+        return TimedPattern(re.compile(regex), self.timeout, self._slow)
+
+    def compile(self, regex):
+        """
+        Return the compiled pattern.
+
+        Raises:
+            re.error: If the pattern does not compile
+            UnsafePatternError: If the pattern is refused by ``check_pattern``
+                or was slow repeatedly in the last ``REFUSAL_TTL`` seconds
+        """
+        with self._lock:
+            entry = self._entries.get(regex)
+            if entry is not None and _expired(entry):
+                del self._entries[regex]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(regex)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            try:
+                entry = self._compile(regex)
+            except UnsafePatternError as e:
+                logger.warning(f"[DEBUG] [REGEX_CACHE] Refused pattern: {e}")
+                entry = (UnsafePatternError, str(e))
+                with self._lock:
+                    self.rejected += 1
+            except re.error as e:
+                entry = (re.error, str(e))
+            self._store(regex, entry)
+
+        if isinstance(entry, tuple):
+            # A new exception each time, so tracebacks do not pile up on a cached one
+            error_class, message = entry[:2]
+            raise error_class(message)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "slow_calls": self.slow_calls,
+            }
+
+
+def get_regex_cache():
+    """
+    Return the process-wide ``RegexCache``.
+
+    Its size is read from EXTRACTOR_REGEX_CACHE_SIZE (default 256) when the
+    cache is first used.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RegexCache(
+                int(os.getenv("EXTRACTOR_REGEX_CACHE_SIZE", DEFAULT_REGEX_CACHE_SIZE))
+            )
+        return _cache
+
+
+def compile_regex(regex):
+    """Compile ``regex`` through the process-wide cache."""
+    return get_regex_cache().compile(regex)
@@ -1,37 +1,76 @@
 import io
 from PyPDF2 import PdfReader
 from django.shortcuts import redirect, render
-from pdf2image import convert_from_path
 from .models import ExtractedDataUsingAzure
-from .processing.azure.ocr_tool import AzureAgent
 import os
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from .processing.pre.handle_split_pdf import split_pdf_into_pages
 from .processing.post.handle_csv import download_csv
 import pandas as pd
-from .utils.logger import (
-    get_logger,
-    setup_logging_for_each_page,
-)
+from .utils.logger import get_logger
 from datetime import datetime
 import chardet
-from .processing.gemini.cleaning.gemini_response import GeminiAgent
-from .processing.gemini.extract_header import (
-    extract_header_using_gemini,
-)
-from .processing.gemini.cleaning.clean_using_response import (
-    process_gemini_response,
+import shutil
+from .processing.gemini.cleaning.operation_trace import TRACE_MODES
+from .processing.post.table_encoding import ENCODINGS
+from .processing.pipeline.header_search import find_header_page
+from .processing.pipeline.page_task import (
+    StatementJob,
+    build_page_pipeline,
+    filter_pages,
+    iter_page_images,
 )
-from .processing.post.handle_csv_to_xml import run_file_to_xml_converter
-import re
-from .utils.create_dir import create_dirs
+from .processing.pipeline.version import content_hash, pipeline_version
+from .utils.create_dir import create_dirs, result_csv_path
+from .utils.rate_limiter import rate_limiter_stats
 
 from .processing.mail.mailer import EmailService
 
 logger = get_logger(__name__)
 
 
+def notify_user(user_email, pdf_name, csv_path, start_time, record_count):
+    """Email the CSV to the uploader; failures are logged and never fail the request."""
+    try:
+        logger.info(f"Sending email notification to: {user_email}")
+        email_service = EmailService()
+
+        # Calculate processing stats; the Lambda view passes an aware start time
+        processing_duration = datetime.now(start_time.tzinfo) - start_time
+
+        # Send email with CSV attachment
+        email_service.send_processing_complete_notification(
+            user_email=user_email,
+            pdf_name=pdf_name,
+            csv_path=csv_path,
+            processing_time=str(processing_duration).split(".")[
+                0
+            ],  # Remove microseconds
+            record_count=record_count,
+        )
+        logger.info("Email notification sent successfully")
+    except Exception as e:
+        logger.error(f"Failed to send email notification: {e}")
+        # Don't fail the entire process if email fails
+
+
+def store_result(final_csv_path, document_hash, version):
+    """
+    Publish a completed statement's CSV at its content-addressed path.
+
+    The copy is written next to the target and renamed into place, so a
+    concurrent re-upload never reads a partial file.
+
+    Returns:
+        str: The content-addressed path
+    """
+    cached_csv_path = result_csv_path(document_hash, version)
+    partial_path = f"{cached_csv_path}.{os.getpid()}.partial"
+    shutil.copyfile(final_csv_path, partial_path)
+    os.replace(partial_path, cached_csv_path)
+    return cached_csv_path
+
+
 # Create your views here.
 def AzureExtractorView(request):
     if request.method == "POST":
@@ -45,6 +84,34 @@ def AzureExtractorView(request):
         else:
             logger.warning("No user email provided in request")
 
+        # Optional trace mode of the cleaning operations for this statement;
+        # EXTRACTOR_OPERATION_TRACE applies when it is left out
+        operation_trace = request.POST.get("operation_trace", "").strip().lower() or None
+        if operation_trace and operation_trace not in TRACE_MODES:
+            logger.error(f"Unknown operation_trace {operation_trace!r}")
+            return render(
+                request,
+                "azure_extractor.html",
+                {
+                    "error": True,
+                    "message": f"operation_trace must be one of {', '.join(TRACE_MODES)}",
+                },
+            )
+
+        # Optional encoding of the raw tables in the cleaning prompts;
+        # EXTRACTOR_TABLE_ENCODING applies when it is left out
+        encoding = request.POST.get("table_encoding", "").strip().lower() or None
+        if encoding and encoding not in ENCODINGS:
+            logger.error(f"Unknown table_encoding {encoding!r}")
+            return render(
+                request,
+                "azure_extractor.html",
+                {
+                    "error": True,
+                    "message": f"table_encoding must be one of {', '.join(ENCODINGS)}",
+                },
+            )
+
         pdf_file = request.FILES.get("pdf_file")
         pdf_name = pdf_file.name.strip(".pdf")
 
@@ -75,6 +142,45 @@ def AzureExtractorView(request):
                 {"error": True, "message": f"Invalid PDF file: {str(e)}"},
             )
 
+        # An identical statement already processed completely with the same
+        # prompts and models is answered from its content-addressed CSV
+        document_hash = content_hash(clean_bytes)
+        version = pipeline_version(encoding)
+        cached_csv_path = result_csv_path(document_hash, version)
+        previous = (
+            ExtractedDataUsingAzure.objects.filter(
+                content_hash=document_hash, pipeline_version=version
+            )
+            .order_by("-created_at")
+            .first()
+        )
+        if previous and os.path.exists(cached_csv_path):
+            logger.info(
+                f"[DEBUG] [DEDUP] {pdf_name} matches {previous.pdf_name} "
+                f"({document_hash[:12]}, pipeline {version}), returning cached CSV"
+            )
+            # The request is recorded and notified like a processed one
+            ExtractedDataUsingAzure.objects.create(
+                pdf_path=previous.pdf_path,
+                extracted_csv_path=cached_csv_path,
+                pdf_name=pdf_name,
+                csv_name=f"{pdf_name}.csv",
+                user_email=user_email if user_email else None,
+                content_hash=document_hash,
+                pipeline_version=version,
+            )
+            if user_email:
+                notify_user(
+                    user_email,
+                    pdf_file.name,
+                    cached_csv_path,
+                    start_time,
+                    len(pd.read_csv(cached_csv_path)),
+                )
+            response = download_csv(cached_csv_path)
+            response.status_code = 200
+            return response
+
         # Reset to use original file for further processing
         pdf_file.seek(0)
         logger.info(f"Processing file -> {pdf_name}")
@@ -83,7 +189,6 @@ def AzureExtractorView(request):
             (
                 storage_dir,
                 upload_dir,
-                split_dir,
                 image_dir,
                 final_csv_dir,
                 temp_csv_dir,
@@ -91,134 +196,50 @@ def AzureExtractorView(request):
                 extracted_data_dir,
             ) = create_dirs(pdf_file)
             pdf_path = os.path.join(upload_dir, pdf_name)
-            path = default_storage.save(pdf_path, ContentFile(pdf_file.read()))
+            # Pages are rendered straight from this file, so store the cleaned bytes
+            path = default_storage.save(pdf_path, ContentFile(clean_bytes))
             full_pdf_path = default_storage.path(path)
             final_csv_path = f"{final_csv_dir}/{pdf_name}.csv"
 
-            # Split PDF into pages
-            parts = split_pdf_into_pages(full_pdf_path, output_dir=split_dir)
-
-            # Process each part and collect image paths
-            images = []
-            i = 0
-            csv_files = []
-            column_map = []
-            for part in parts:
-                # Convert PDF part to images
-                part_images = convert_from_path(part)
-                i += 1
-                for j, image in enumerate(part_images):
-                    page_num = i
-
-                    # Setup page-specific logger
-                    page_logger = setup_logging_for_each_page(storage_dir, page_num)
-                    page_logger.info(f"Starting processing for page {page_num}")
-
-                    page_path = f"{image_dir}/page_{page_num}.png"
-
-                    image.save(page_path, "PNG")
-                    images.append(page_path)  # Add image path to images list
-
-                    temp_path = f"{temp_csv_dir}/page_{page_num}.csv"
-                    page_logger.info(f"Creating Azure agent for page {page_num}")
-
-                    if not column_map:
-                        # Extract headers using Gemini
-                        header, is_valid_page = extract_header_using_gemini(
-                            image=page_path, page_logger=page_logger
-                        )
-
-                        page_logger.info(f"header: {header}")
-                        if is_valid_page:
-                            # Dict mapping index to header
-                            index_to_header = {
-                                item["index"]: item["headers"] for item in header
-                            }
-
-                            # List of headers
-                            headers_list = [item["headers"] for item in header]
-                            column_map_with_index = index_to_header
-                            column_map = headers_list
-                        page_logger.info(f"column_map: {column_map}")
-
-                        if not is_valid_page:
-                            page_logger.info(
-                                f"Page {page_num} is not a valid page, skipping."
-                            )
-                            break
-
-                    # Extract data using Azure OCR
-                    AzureAgent(
-                        {images[page_num - 1]},
-                        page_path,
-                        page_num,
-                        temp_path=temp_path,
-                        page_logger=page_logger,
-                    )
+            job = StatementJob(
+                full_pdf_path,
+                storage_dir,
+                image_dir,
+                temp_csv_dir,
+                xml_dir,
+                extracted_data_dir,
+                operation_trace=operation_trace,
+                encoding=encoding,
+            )
 
-                    if not os.path.exists(temp_path):
-                        page_logger.warning(
-                            f"No CSV file found for page {page_num}, skipping."
-                        )
-                        continue
-
-                    df = pd.read_csv(temp_path)
-                    page_logger.info(f"[DEBUG] df: {df}")
-
-                    page_logger.info("Converting to XML format")
-                    # Convert CSV to XML format
-                    xml_data = run_file_to_xml_converter(temp_path, xml_dir)
-                    page_logger.info(f"xml_data:\n {str(xml_data)}")
-
-                    # Call Gemini agent for data cleaning
-                    page_logger.info("Calling Gemini agent for data cleaning")
-                    gemini_agent = GeminiAgent()
-                    json_response = gemini_agent.call_gemini(
-                        image=page_path,
-                        xml_output=xml_data,
-                        headers=column_map_with_index,
-                        page_logger=page_logger,
-                    )
+            # Header detection tries the first pages concurrently and takes the
+            # earliest transaction page; every page from there on is independent.
+            header_page = find_header_page(job, num_pages)
+            pending_pages = (
+                filter_pages(job, range(header_page, num_pages + 1))
+                if header_page
+                else []
+            )
 
-                    # Process Gemini response
-                    extracted_data_path = f"{extracted_data_dir}/{page_num}.csv"
-                    page_logger.info("Processing Gemini response")
-                    try:
-                        cleaned_data = process_gemini_response(
-                            json_response,
-                            temp_path,
-                            extracted_data_path,
-                            page_logger,
-                        )
-                    except Exception as e:
-                        page_logger.error(f"Error in process_gemini_response: {e}")
-                        continue
-                    page_logger.info(f"Completed processing for page {page_num}")
+            # Remaining pages stream through rendering, OCR and cleaning
+            pipeline = build_page_pipeline(job, pending_pages)
+            page_results = pipeline.run(iter_page_images(job, pending_pages))
+            column_map = job.column_map
 
             try:
                 print(f"final_csv_dir: {final_csv_dir}")
                 final_df = pd.DataFrame()  # Initialize as empty DataFrame
 
-                csv_files = os.listdir(extracted_data_dir)
-                if not csv_files:
+                # Per-page CSVs in page order, skipping pages that failed
+                file_paths = [path for path in page_results.values() if path]
+                if not file_paths:
                     logger.warning("No CSV files found in extracted_data directory")
 
-                # Before processing files, order them by page number
-                def extract_page_number(filename):
-                    match = re.search(r"page_(\d+)\.csv$", filename)
-                    if match:
-                        return int(match.group(1))
-                    return float("inf")  # Put files without a page number at the end
-
-                # If you have a list of file paths, e.g., file_paths = [...]
-                file_paths = sorted(csv_files, key=extract_page_number)
-
-                for idx, file in enumerate(file_paths):
-                    file_path = os.path.join(extracted_data_dir, file)
+                for idx, file_path in enumerate(file_paths):
                     header = column_map
                     logger.info(f"header: {header}")
                     logger.info(f"final_df shape: {final_df.shape}")
-                    logger.info(f"file:\n {file}")
+                    logger.info(f"file:\n {file_path}")
 
                     reader = pd.read_csv(file_path)
                     if reader.columns.tolist() != header:
@@ -240,6 +261,18 @@ def AzureExtractorView(request):
 
                 final_df.to_csv(f"{final_csv_dir}/{pdf_name}.csv", index=False)
 
+                # Only complete results are reused for re-uploads, so a provider
+                # outage is never served again from the dedup cache
+                failed_pages = job.failed_pages | set(pipeline.errors)
+                complete = not final_df.empty and not failed_pages
+                if complete:
+                    store_result(final_csv_path, document_hash, version)
+                else:
+                    logger.warning(
+                        f"[DEBUG] [DEDUP] Not caching {pdf_name}: "
+                        f"{len(final_df)} rows, failed pages {sorted(failed_pages)}"
+                    )
+
                 # Save to database with email information
                 try:
                     ExtractedDataUsingAzure.objects.create(
@@ -250,6 +283,8 @@ def AzureExtractorView(request):
                         user_email=(
                             user_email if user_email else None
                         ),  # Store email if provided
+                        content_hash=document_hash if complete else None,
+                        pipeline_version=version if complete else None,
                     )
                 except Exception as e:
                     logger.error(f"Error creating ExtractedDataUsingAzure: {e}")
@@ -261,29 +296,10 @@ def AzureExtractorView(request):
 
                 # Send email notification if email was provided
                 if user_email:
-                    try:
-                        logger.info(f"Sending email notification to: {user_email}")
-                        email_service = EmailService()
-
-                        # Calculate processing stats
-                        end_time = datetime.now()
-                        processing_duration = end_time - start_time
-                        record_count = len(final_df) if not final_df.empty else 0
-
-                        # Send email with CSV attachment
-                        email_service.send_processing_complete_notification(
-                            user_email=user_email,
-                            pdf_name=pdf_file.name,
-                            csv_path=final_csv_path,
-                            processing_time=str(processing_duration).split(".")[
-                                0
-                            ],  # Remove microseconds
-                            record_count=record_count,
-                        )
-                        logger.info("Email notification sent successfully")
-                    except Exception as e:
-                        logger.error(f"Failed to send email notification: {e}")
-                        # Don't fail the entire process if email fails
+                    record_count = len(final_df) if not final_df.empty else 0
+                    notify_user(
+                        user_email, pdf_file.name, final_csv_path, start_time, record_count
+                    )
 
             except Exception as e:
                 logger.error(f"Error in final_df: {e}")
@@ -297,7 +313,11 @@ def AzureExtractorView(request):
             response.status_code = 200
             end_time = datetime.now()
             logger.info(f"Process Ended at {end_time}")
-            logger.info(f"Process took {end_time - start_time} for {len(parts)} pages")
+            logger.info(f"Process took {end_time - start_time} for {num_pages} pages")
+            logger.info(f"Provider rate limiter stats: {rate_limiter_stats()}")
+            logger.info(
+                f"Pages skipped as non-transaction: {job.page_classifier.skipped}"
+            )
             return response
 
     return render(request, "azure_extractor.html")